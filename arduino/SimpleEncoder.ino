@@ -1,44 +1,122 @@
 #include <QuadratureEncoder.h>
 /*
-Reads 2 rotary encoders and writes data every second.
+Reads 2 rotary encoders and writes data every sample period.
 
-The data consists of millis, count1, count2, error1, error2
+The data consists of time, count1, count2, error1, error2, written either as
+a text line (time in millis):
 
-N controls the write period:
-N = 1000    T = 1s
-N = 100     T = 100ms
-N = 10      T = 10ms
-N = 1       T = 1ms
+  "<millis> <count1> <count2> <error1> <error2>\r\n"
+
+or as a 20B binary frame (time in micros), little-endian:
+
+  sync (0xa5 0x5a), micros (uint32), count1 (int32), count2 (int32),
+  error1 (uint16), error2 (uint16), CRC-16/CCITT of the first 18B (uint16)
+
+BAUD, BINARY and PERIOD_US are the defaults. The host changes the protocol and
+the sample period by writing a command line, 'T' (text) or 'B' (binary)
+followed by the period in us (0 keeps the current one), e.g. "B1000\n".
+The baud rate is fixed, the host must be configured to match it.
+
+PERIOD_US controls the write period:
+PERIOD_US = 1000000  T = 1s
+PERIOD_US = 50000    T = 50ms  (text at 9600 baud: ~25B per line, 5 kb/s)
+PERIOD_US = 1000     T = 1ms   (binary at 250000 baud: 20B per frame, 200 kb/s)
 */
 
+#define BAUD 9600
+#define BINARY 0
+#define PERIOD_US 50000
 
 Encoders aziEncoder(2,4);
 Encoders altEncoder(7,8);
 
-unsigned long lastMilli = 0;
-unsigned long N = 50;
+unsigned long lastMicros = 0;
+unsigned long period = PERIOD_US;
+bool binary = BINARY;
+
+char command[16];
+byte commandLength = 0;
+
+uint16_t crc16(const uint8_t *data, byte length) {
+  uint16_t crc = 0xffff;
+  for (byte i = 0; i < length; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (byte j = 0; j < 8; j++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+void readCommand() {
+  while (Serial.available() > 0) {
+    char c = Serial.read();
+    if (c == '\n' || c == '\r') {
+      command[commandLength] = '\0';
+      if (commandLength > 0 && (command[0] == 'B' || command[0] == 'T')) {
+        binary = command[0] == 'B';
+        unsigned long p = strtoul(command + 1, NULL, 10);
+        if (p > 0) {
+          period = p;
+        }
+      }
+      commandLength = 0;
+    } else if (commandLength < sizeof(command) - 1) {
+      command[commandLength++] = c;
+    }
+  }
+}
+
+void writeFrame(unsigned long t, long count1, long count2, long error1, long error2) {
+  uint8_t frame[20];
+  uint16_t e1 = error1;
+  uint16_t e2 = error2;
+  frame[0] = 0xa5;
+  frame[1] = 0x5a;
+  memcpy(frame + 2, &t, 4);
+  memcpy(frame + 6, &count1, 4);
+  memcpy(frame + 10, &count2, 4);
+  memcpy(frame + 14, &e1, 2);
+  memcpy(frame + 16, &e2, 2);
+  uint16_t crc = crc16(frame, 18);
+  memcpy(frame + 18, &crc, 2);
+  Serial.write(frame, sizeof(frame));
+}
+
+void writeLine(unsigned long t, long count1, long count2, long error1, long error2) {
+  Serial.print(t);
+  Serial.print(" ");
+  Serial.print(count1);
+  Serial.print(" ");
+  Serial.print(count2);
+  Serial.print(" ");
+  Serial.print(error1);
+  Serial.print(" ");
+  Serial.println(error2);
+}
 
 void setup() {
-  Serial.begin(9600);
-  lastMilli = millis();
+  Serial.begin(BAUD);
+  lastMicros = micros();
 }
 
 void loop() {
-  if ((millis()-lastMilli) > N) {
+  readCommand();
+
+  unsigned long now = micros();
+  if (now - lastMicros >= period) {
+    /* keep the schedule, unless we fell more than a period behind */
+    lastMicros = (now - lastMicros < 2*period) ? lastMicros + period : now;
+
     long currentAziCount = aziEncoder.getEncoderCount();
     long currentAltCount = altEncoder.getEncoderCount();
     long currentAziError = aziEncoder.getEncoderErrorCount();
     long currentAltError = altEncoder.getEncoderErrorCount();
 
-    Serial.print(lastMilli);
-    Serial.print(" ");
-    Serial.print(currentAziCount);
-    Serial.print(" ");
-    Serial.print(currentAltCount);
-    Serial.print(" ");
-    Serial.print(currentAziError);
-    Serial.print(" ");
-    Serial.println(currentAltError);
-    lastMilli = millis();
+    if (binary) {
+      writeFrame(now, currentAziCount, currentAltCount, currentAziError, currentAltError);
+    } else {
+      writeLine(millis(), currentAziCount, currentAltCount, currentAziError, currentAltError);
+    }
   }
 }
@@ -23,19 +23,25 @@ Horizontal coordinates: aligned with zenith and horizon
     (0, 0): North on the horizon
 
 """
+from collections import deque
+#
 import numpy as np
 
 
+"Fraction of the total weight below which a forgotten star is dropped"
+MIN_WEIGHT = 1e-6
+
+
 def vec_from_angles(phi, theta):
     """
     Create a direction unit vector from elevation and azimuthal angles.
 
     :param phi: azimuthal angle, in degrees
-    :type phi: float
+    :type phi: float or :obj:`np.ndarray`
     :param theta: elevation angle, in degrees
-    :type theta: float
+    :type theta: float or :obj:`np.ndarray`
 
-    :return: unit direction vector
+    :return: unit direction vector, shape (3,) or (3, N)
     :rtype: :obj:`np.ndarray`
 
     """
@@ -50,21 +56,19 @@ def angles_from_vec(v):
     """
     Create elevation and azimuthal angles from a direction vector.
     
-    :param v: direction vector
+    :param v: direction vector, or array of shape (3, N) of direction vectors
     :type v: :obj:`np.ndarray`
 
     :return: azimuthal angle, elevation angle in degrees
     :rtype: list
 
     """
-    norm = np.linalg.norm(v)
+    norm = np.sqrt(v[0]*v[0] + v[1]*v[1] + v[2]*v[2])
     theta = np.arcsin(v[2]/norm)
     phi = np.arctan2(v[1], v[0])
-    
-    while phi < 0:
-        phi += 2*np.pi
-        
-    return np.degrees(phi), np.degrees(theta)
+    phi = np.where(phi < 0, phi + 2*np.pi, phi)
+
+    return np.degrees(phi)[()], np.degrees(theta)
 
 
 class Aligner(object):
@@ -73,14 +77,34 @@ class Aligner(object):
         - calculates transformation matrix
         - transforms between telescope <-> horizontal
         
-    :param n_stars: max number of stars to use, optional
+    The B matrix of Wahba's problem is kept as a running weighted sum, so adding or
+    removing a star costs O(1) before the 3x3 SVD. Old stars can be dropped with a
+    sliding window, or down-weighted with exponential forgetting, to track a mount
+    that settles during the night.
+
+    :param n_stars: max number of stars to use, further stars are ignored, optional
     :type n_stars: int
+    :param window: max number of stars to keep, the oldest star is dropped, optional
+    :type window: int
+    :param forget: forgetting factor in (0:1], the weights of previous stars are
+                   multiplied by it each time a star is added, and the stars with a
+                   negligible weight are dropped, optional
+    :type forget: float
     
+    >>> aligner = Aligner(window=10, forget=0.9)
+    >>> aligner.add_star(phi1, theta1, azi1, alt1)
+    >>> aligner.add_star(phi2, theta2, azi2, alt2)
+    >>> aligner.remove_star(0)
     """
 
-    def __init__(self, n_stars=None):
+    def __init__(self, n_stars=None, window=None, forget=1):
         self.n_stars = n_stars
+        self.window = window
+        self.forget = forget
         self.stars = None
+        self.B = None
+        self.norm = None
+        self.n_added = None
         self.R = None
         self.R_inv = None
         self.R_chi2 = None
@@ -108,16 +132,67 @@ class Aligner(object):
         if self.n_stars and len(self.stars) == self.n_stars:
             return
 
+        if self.window and len(self.stars) == self.window:
+            self._subtract(self.stars.popleft())
+
         v1 = vec_from_angles(phi, theta)
         v2 = vec_from_angles(azi, alt)
-        self.stars.append([v1, v2, weight])
+
+        "Age the previous stars"
+        if self.forget != 1:
+            self.B *= self.forget
+            self.norm *= self.forget
+        self.n_added += 1
+
+        self.B += weight*np.outer(v2, v1)
+        self.norm += weight
+        self.stars.append([v1, v2, weight, self.n_added])
+
+        "Drop the forgotten stars, so the stars are bounded without a window"
+        while len(self.stars) > 1 and self._weight(self.stars[0]) < MIN_WEIGHT*self.norm:
+            self._subtract(self.stars.popleft())
+        self.update()
+
+    def remove_star(self, index):
+        """
+        Remove an alignment star.
+
+        :param index: index of the star in :attr:`stars`
+        :type index: int
+
+        """
+        star = self.stars[index]
+        del self.stars[index]
+        self._subtract(star)
         self.update()
 
+    def _weight(self, star):
+        """
+        Current weight of a star, aged by the forgetting factor.
+        """
+        return star[2]*self.forget**(self.n_added - star[3])
+
+    def _subtract(self, star):
+        """
+        Remove the current contribution of a star from the B matrix.
+        """
+        v1, v2, _, _ = star
+        weight = self._weight(star)
+        if len(self.stars) == 0:
+            self.B = np.zeros((3, 3))
+            self.norm = 0
+        else:
+            self.B -= weight*np.outer(v2, v1)
+            self.norm -= weight
+
     def reset(self):
         """
         Reset the alignment.
         """
-        self.stars = []
+        self.stars = deque()
+        self.B = np.zeros((3, 3))
+        self.norm = 0
+        self.n_added = 0
         self.R = np.identity(3)
         self.R_inv = np.identity(3)
         self.R_chi2 = None
@@ -127,21 +202,17 @@ class Aligner(object):
         """
         Calculate the correction matrix using the known stars.
         
-        Called automatically when stars are added.
+        Called automatically when stars are added or removed.
         """
         if len(self.stars) < 2:
+            self.R = np.identity(3)
+            self.R_inv = np.identity(3)
+            self.R_chi2 = None
+            self.corr = None
             return
 
-        "Calculate the B matrix"
-        norm = 0
-        bm = 0
-        for star in self.stars:
-            v1 = star[0]
-            v2 = star[1]
-            w = star[2]
-            norm += w
-            bm += w*np.outer(v2, v1)
-        bm /= norm
+        "Normalize the B matrix"
+        bm = self.B/self.norm
 
         "Get the single value decomposition"
         u, s, vh = np.linalg.svd(bm)
@@ -150,12 +221,12 @@ class Aligner(object):
         d = np.linalg.det(u)*np.linalg.det(vh.T)
         a_opt = np.matmul(u, np.matmul(np.diag([1, 1, d]), vh))
         l_opt = 1 - s[0] - s[1] - d*s[2]
-        ps = np.diag([(1-s[0])/(s[1]+d*s[2])**2, (1-s[1])/(s[0]+d*s[2])**2, (1-d*s[2])/(s[0]+s[1])**2])/len(self.stars)
+        ps = np.diag([(1-s[0])/(s[1]+d*s[2])**2, (1-s[1])/(s[0]+d*s[2])**2, (1-d*s[2])/(s[0]+s[1])**2])/self.norm
         ph = np.matmul(vh.T, np.matmul(ps, vh))
         
-        "Update the values"
+        "Update the values, the inverse of a rotation is its transpose"
         self.R = a_opt
-        self.R_inv = np.linalg.inv(self.R)
+        self.R_inv = self.R.T
         self.R_chi2 = l_opt
         self.corr = ph
 
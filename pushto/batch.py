@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+"""
+Offline processing of whole sessions, from encoder counts to equatorial coordinates.
+
+Provides:
+    - BatchProcessor
+    - read_session
+    - read_text
+    - write_text
+
+
+The chain is the same as the live one, Encoders -> PointingModel -> Aligner ->
+Location, but every stage works on arrays: a chunk of samples goes through each
+stage at once, and the equatorial coordinates are computed with an array
+:class:`astropy.coordinates.SkyCoord` transformation. The expensive part of that
+transformation, the ERFA astrometry parameters, is interpolated on a time grid
+with :class:`astropy.coordinates.erfa_astrom.ErfaAstromInterpolator`, which is
+accurate to much better than a milli-arcsecond for grids of a few minutes.
+
+Large inputs are read and processed in chunks, so that the memory stays bounded,
+and the chunks can be spread over a pool of processes.
+
+"""
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+#
+import numpy as np
+import astropy.units as u
+from astropy.time import Time
+from astropy.coordinates.erfa_astrom import erfa_astrom, ErfaAstromInterpolator
+#
+from pushto.telescope import Encoders, PointingModel, LINE_BITS, FRAME_BITS
+from pushto.alignment import Aligner
+from pushto.site import Location
+from pushto.clock import ClockSync
+from pushto.session import SessionReader
+
+"Columns of the processed samples"
+BATCH_COLUMNS = ('time', 'phi_cnt', 'theta_cnt', 'phi_raw', 'theta_raw', 'phi', 'theta',
+                 'azi', 'alt', 'ra', 'dec')
+
+
+class BatchProcessor(object):
+    """
+    Vectorized processing of encoder counts into equatorial coordinates.
+
+    :param enc: the encoders
+    :type enc: :obj:`pushto.telescope.Encoders`
+    :param pm: the pointing model
+    :type pm: :obj:`pushto.telescope.PointingModel`
+    :param location: the location of the telescope
+    :type location: :obj:`pushto.site.Location`
+    :param aligner: the telescope aligner, optional (default is no rotation)
+    :type aligner: :obj:`pushto.alignment.Aligner` or None
+    :param interpolate: interpolation interval of the ERFA astrometry in seconds, optional
+                        (0 to compute it for every sample)
+    :type interpolate: float
+
+    >>> batch = BatchProcessor.setup(cfg)
+    >>> out = batch.process(utc, phi_cnt, theta_cnt)
+    >>> for out in batch.run(read_session('session.ptsc'), workers=4):
+    ...     print(out['ra'], out['dec'])
+    """
+
+    def __init__(self, enc, pm, location, aligner=None, interpolate=300):
+        self.enc = enc
+        self.pm = pm
+        self.location = location
+        self.aligner = aligner or Aligner()
+        self.interpolate = interpolate
+
+    def process(self, utc, phi_cnt, theta_cnt):
+        """
+        Process a chunk of samples.
+
+        :param utc: acquisition times in seconds since epoch
+        :type utc: :obj:`np.ndarray`
+        :param phi_cnt: azimuthal encoder counts
+        :type phi_cnt: :obj:`np.ndarray`
+        :param theta_cnt: polar encoder counts
+        :type theta_cnt: :obj:`np.ndarray`
+
+        :return: arrays of the processed samples, keyed by :data:`BATCH_COLUMNS`
+        :rtype: dict
+        """
+        utc = np.asarray(utc, dtype=float)
+        phi_cnt = np.asarray(phi_cnt)
+        theta_cnt = np.asarray(theta_cnt)
+
+        phi_raw, theta_raw = self.enc.convert_array(phi_cnt, theta_cnt)
+        phi, theta = self.pm.apply(phi_raw, theta_raw)
+        azi, alt = self.aligner.telescope_to_horizontal(phi, theta)
+        azi = np.atleast_1d(azi)
+        alt = np.atleast_1d(alt)
+
+        astrom = erfa_astrom.set(ErfaAstromInterpolator(self.interpolate*u.s)) if self.interpolate else nullcontext()
+        with astrom:
+            ra, dec = self.location.horizontal_to_equatorial(azi, alt, Time(utc, format='unix'))
+
+        return dict(zip(BATCH_COLUMNS, (utc, phi_cnt, theta_cnt, phi_raw, theta_raw, phi, theta,
+                                        azi, alt, ra, dec)))
+
+    def run(self, chunks, workers=0):
+        """
+        Process chunks of samples, in order.
+
+        :param chunks: iterable of (utc, phi_cnt, theta_cnt) chunks
+        :type chunks: iterable
+        :param workers: number of worker processes, optional (0 to process in this process)
+        :type workers: int
+
+        :return: generator of the processed chunks, see :meth:`process`
+        :rtype: generator
+        """
+        if not workers:
+            for utc, phi_cnt, theta_cnt in chunks:
+                if len(utc):
+                    yield self.process(utc, phi_cnt, theta_cnt)
+            return
+
+        "keep a bounded number of chunks in flight"
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            for utc, phi_cnt, theta_cnt in chunks:
+                if not len(utc):
+                    continue
+                pending.append(pool.submit(self.process, utc, phi_cnt, theta_cnt))
+                if len(pending) >= 2*workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    @classmethod
+    def setup(cls, cfg, aligner=None, interpolate=300):
+        """
+        Convenience method for creating a BatchProcessor object based on a Configuration object
+
+        :param cfg: the configuration object to use
+        :type cfg: :obj:`Configuration`
+        :param aligner: the telescope aligner, optional
+        :type aligner: :obj:`pushto.alignment.Aligner` or None
+        :param interpolate: interpolation interval of the ERFA astrometry in seconds, optional
+        :type interpolate: float
+
+        :return: the batch processor
+        :rtype: :obj:`BatchProcessor`
+        """
+        enc = Encoders()
+        enc.config(cfg)
+        pm = PointingModel()
+        pm.config(cfg)
+        "the full astropy transformation, which is vectorized over time"
+        location = Location(cfg.get_latitude(), cfg.get_longitude(), cfg.get_elevation(),
+                            cfg.get_pressure(), cfg.get_temperature(), cfg.get_rel_humidity())
+        return BatchProcessor(enc, pm, location, aligner, interpolate)
+
+
+def read_session(filename, size=100000, baudrate=9600, binary=False):
+    """
+    Read a captured session in chunks. The acquisition times are fitted from the
+    Arduino time stamps and the arrival times, chunk by chunk.
+
+    :param filename: name of the session file
+    :type filename: str
+    :param size: number of samples per chunk, optional
+    :type size: int
+    :param baudrate: baud rate of the captured serial port, for the transmission delay, optional
+    :type baudrate: int
+    :param binary: the session was captured from binary frames, stamped with micros(), optional
+    :type binary: bool
+
+    :return: generator of (utc, phi_cnt, theta_cnt) chunks
+    :rtype: generator
+    """
+    session = SessionReader(filename)
+    if binary:
+        clock = ClockSync(delay=FRAME_BITS/baudrate, tick=1e-6)
+    else:
+        clock = ClockSync(delay=LINE_BITS/baudrate)
+    for arrival, millis, phi_cnt, theta_cnt, _, _ in session.iter_data(size):
+        yield clock.convert(millis, arrival), phi_cnt, theta_cnt
+    session.close()
+
+
+def read_text(filename, size=100000):
+    """
+    Read a text file of 'time phi_cnt theta_cnt' rows in chunks, the time in seconds
+    since epoch. Lines starting with '#' are ignored.
+
+    :param filename: name of the text file
+    :type filename: str
+    :param size: number of samples per chunk, optional
+    :type size: int
+
+    :return: generator of (utc, phi_cnt, theta_cnt) chunks
+    :rtype: generator
+    """
+    with open(filename, 'r') as f:
+        rows = (line for line in f if line.strip() and not line.startswith('#'))
+        while True:
+            lines = list(itertools.islice(rows, size))
+            if not lines:
+                break
+            data = np.loadtxt(lines, ndmin=2, usecols=(0, 1, 2))
+            yield data[:, 0], data[:, 1].astype(np.int64), data[:, 2].astype(np.int64)
+
+
+def write_text(f, out, header=False):
+    """
+    Write a processed chunk as text rows.
+
+    :param f: the output file
+    :type f: file
+    :param out: the processed chunk, see :meth:`BatchProcessor.process`
+    :type out: dict
+    :param header: write the column names first, optional
+    :type header: bool
+    """
+    if header:
+        f.write('# %s\n' % ' '.join(BATCH_COLUMNS))
+    np.savetxt(f, np.column_stack([out[name] for name in BATCH_COLUMNS]),
+               fmt=['%.6f', '%d', '%d'] + ['%.7f']*(len(BATCH_COLUMNS) - 3))
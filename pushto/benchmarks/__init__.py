@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+Benchmarks of the pointing pipeline.
+
+Every stage is timed in isolation on a synthetic stream, and the whole chain is
+timed end to end from a serial line to a Stellarium frame. Results are plain
+dictionaries that are saved to JSON so that runs can be compared:
+
+    > python -m pushto.benchmarks -o results.json
+    > python -m pushto.benchmarks -o new.json --compare results.json
+
+Provides:
+    - measure
+    - summarize
+    - save_results
+    - load_results
+    - compare_results
+
+"""
+import json
+import platform
+import time
+#
+import numpy as np
+
+
+def summarize(latencies, elapsed=None):
+    """
+    Summarize a list of per-call latencies.
+
+    :param latencies: latencies in seconds
+    :type latencies: list(float) or :obj:`np.ndarray`
+    :param elapsed: wall time of the run in seconds, optional (default is the sum of latencies)
+    :type elapsed: float or None
+
+    :return: count, throughput in calls per second, mean, p50 and p99 latencies in microseconds
+    :rtype: dict
+    """
+    latencies = np.asarray(latencies, dtype=float)
+    if elapsed is None:
+        elapsed = latencies.sum()
+    return {'count': int(latencies.size),
+            'throughput': float(latencies.size/elapsed) if elapsed > 0 else None,
+            'mean_us': float(1e6*latencies.mean()),
+            'p50_us': float(1e6*np.percentile(latencies, 50)),
+            'p99_us': float(1e6*np.percentile(latencies, 99))}
+
+
+def measure(func, args, warmup=10):
+    """
+    Time a function call for every set of arguments.
+
+    :param func: the function to time
+    :type func: callable
+    :param args: list of argument tuples, one per call
+    :type args: list(tuple)
+    :param warmup: number of untimed calls before timing, optional
+    :type warmup: int
+
+    :return: summary of the latencies, see :func:`summarize`
+    :rtype: dict
+    """
+    for a in args[:warmup]:
+        func(*a)
+
+    clock = time.perf_counter
+    latencies = np.empty(len(args))
+    start = clock()
+    for i, a in enumerate(args):
+        t0 = clock()
+        func(*a)
+        latencies[i] = clock() - t0
+    return summarize(latencies, clock() - start)
+
+
+def save_results(results, filename):
+    """
+    Save results to a JSON file, together with a description of the host.
+
+    :param results: benchmark results
+    :type results: dict
+    :param filename: output file name
+    :type filename: str
+    """
+    doc = {'host': {'python': platform.python_version(),
+                    'machine': platform.machine(),
+                    'system': platform.platform(),
+                    'numpy': np.__version__},
+           'time': time.time(),
+           'results': results}
+    with open(filename, 'w') as f:
+        json.dump(doc, f, indent=2)
+
+
+def load_results(filename):
+    """
+    Load results saved with :func:`save_results`.
+
+    :param filename: input file name
+    :type filename: str
+
+    :return: benchmark results
+    :rtype: dict
+    """
+    with open(filename, 'r') as f:
+        return json.load(f)['results']
+
+
+def compare_results(new, old, key='p50_us'):
+    """
+    Compare two sets of results.
+
+    :param new: new benchmark results
+    :type new: dict
+    :param old: reference benchmark results
+    :type old: dict
+    :param key: summary value to compare, optional
+    :type key: str
+
+    :return: ratio new/old of the key for every benchmark in both sets
+    :rtype: dict
+    """
+    ratios = {}
+    for name, summary in new.items():
+        if name in old and old[name].get(key) and summary.get(key) is not None:
+            ratios[name] = summary[key]/old[name][key]
+    return ratios
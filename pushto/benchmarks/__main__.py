@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+Run the benchmarks of the pointing pipeline.
+
+    > python -m pushto.benchmarks [-c config] [-n samples] [-r threads|asyncio] [-t tcp|ipc|inproc] [-o results.json] [--compare old.json]
+
+"""
+import sys
+import argparse
+import logging
+#
+from astropy.utils import iers
+#
+from pushto.config import Configuration, TRANSPORTS, SERIAL_PROTOCOLS
+from pushto.benchmarks import save_results, load_results, compare_results
+from pushto.benchmarks.stages import run_stages
+from pushto.benchmarks.pipeline import run_pipeline
+from pushto.runtime import RUNTIMES
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pushto.benchmarks',
+                                     description='Benchmark the stages of the pointing pipeline and the pipeline end to end.')
+    parser.add_argument('-c', '--config', default=None, help='configuration file (default is the package default)')
+    parser.add_argument('-n', '--samples', type=int, default=1000, help='number of samples per stage')
+    parser.add_argument('-b', '--burst', type=int, default=2000, help='number of lines for the pipeline throughput')
+    parser.add_argument('-f', '--format', action='append', choices=('json', 'binary'),
+                        help='wire format(s) of the pipeline, can be repeated (default is both)')
+    parser.add_argument('-r', '--runtime', action='append', choices=RUNTIMES,
+                        help='runtime(s) of the pipeline, can be repeated (default is both)')
+    parser.add_argument('-t', '--transport', choices=TRANSPORTS, default=None,
+                        help='zmq transport between the threads (default is the configured one)')
+    parser.add_argument('-p', '--protocol', choices=SERIAL_PROTOCOLS, default=None,
+                        help='protocol of the serial data (default is the configured one)')
+    parser.add_argument('--no-pipeline', action='store_true', help='only time the stages')
+    parser.add_argument('-o', '--output', default=None, help='save the results to this JSON file')
+    parser.add_argument('--compare', default=None, help='compare the p50 latencies to this JSON file')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+
+    "Never reach out for IERS tables, use the bundled ones"
+    iers.conf.auto_download = False
+
+    cfg = Configuration(args.config)
+    if args.protocol is not None:
+        cfg.set_serial_protocol(args.protocol)
+    results = run_stages(cfg, n=args.samples)
+    if not args.no_pipeline:
+        runtimes = args.runtime or RUNTIMES
+        if 'threads' in runtimes:
+            for fmt in args.format or ('json', 'binary'):
+                for name, summary in run_pipeline(cfg, n=args.samples, burst=args.burst, fmt=fmt,
+                                                  transport=args.transport).items():
+                    results['%s.%s' % (name, fmt)] = summary
+        if 'asyncio' in runtimes:
+            "no zmq between the stages, the wire format does not matter"
+            for name, summary in run_pipeline(cfg, n=args.samples, burst=args.burst, runtime='asyncio').items():
+                results['%s.asyncio' % name] = summary
+
+    print('%-48s %12s %12s %12s' % ('benchmark', 'per second', 'p50 [us]', 'p99 [us]'))
+    for name, summary in results.items():
+        print('%-48s %12.0f %12s %12s' % (name, summary['throughput'],
+                                          '%.1f' % summary['p50_us'] if 'p50_us' in summary else '-',
+                                          '%.1f' % summary['p99_us'] if 'p99_us' in summary else '-'))
+
+    if args.output:
+        save_results(results, args.output)
+
+    if args.compare:
+        print('\n%-48s %12s' % ('benchmark', 'p50 new/old'))
+        for name, ratio in compare_results(results, load_results(args.compare)).items():
+            print('%-48s %12.2f' % (name, ratio))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
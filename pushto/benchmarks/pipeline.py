@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+"""
+End to end benchmark of the pointing pipeline.
+
+The Telescope reads from a pseudo terminal (or a loop:// serial port where there
+are none), so that the lines written to the port are read back as if they came
+from the Arduino, and a plain socket stands in for Stellarium. The time from
+writing a line to receiving its 'CurrentPosition' frame covers the serial reader,
+the Telescope, the Site and the StellariumTC threads and the zmq sockets in between.
+With the binary serial protocol, binary frames are written instead of lines.
+
+The asyncio runtime (see :mod:`pushto.runtime`) runs the same stages in one event
+loop, which reads the serial port when its file descriptor is readable.
+
+Provides:
+    - free_port
+    - open_pty
+    - run_pipeline
+
+"""
+import os
+import socket
+import time
+#
+import zmq
+import numpy as np
+#
+from pushto.benchmarks import summarize
+from pushto.benchmarks.stages import synthetic_stream
+from pushto.telescope import Telescope, frame_encode
+from pushto.site import Site
+from pushto.stellarium import StellariumTC, STC_POSITION
+from pushto.runtime import AsyncRuntime, RUNTIMES
+
+
+def free_port():
+    """
+    Find a free local tcp port.
+
+    :return: port number
+    :rtype: int
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def recv_frame(sock):
+    """
+    Receive one 'CurrentPosition' frame from the STC.
+
+    :param sock: the socket standing in for Stellarium
+    :type sock: :obj:`socket.socket`
+
+    :return: the frame
+    :rtype: bytes
+    """
+    data = b''
+    while len(data) < STC_POSITION.size:
+        chunk = sock.recv(STC_POSITION.size - len(data))
+        if not chunk:
+            raise ConnectionError('STC closed the connection')
+        data += chunk
+    return data
+
+
+def open_pty():
+    """
+    Open a raw pseudo terminal, standing in for the Arduino serial port.
+
+    :return: file descriptor of the master side and name of the slave side
+    :rtype: list(int, str)
+    """
+    import tty
+    master, slave = os.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    name = os.ttyname(slave)
+    os.close(slave)
+    return master, name
+
+
+def run_pipeline(cfg, n=500, burst=2000, fmt=None, timeout=10, runtime='threads', transport=None):
+    """
+    Time the pipeline end to end, from a serial line to a Stellarium frame.
+
+    The latency is measured one line at a time, the throughput by writing a burst
+    of lines as fast as possible and counting the frames that come out.
+
+    :param cfg: the configuration to build the pipeline from, its serial port, ports
+                and decimation are overwritten
+    :type cfg: :obj:`Configuration`
+    :param n: number of lines for the latency, optional
+    :type n: int
+    :param burst: number of lines for the throughput, optional
+    :type burst: int
+    :param fmt: wire format of the zmq messages, optional (default is the configured one)
+    :type fmt: str or None
+    :param timeout: time in seconds to wait for a frame, optional
+    :type timeout: float
+    :param runtime: runtime of the pipeline, threads or asyncio, optional
+    :type runtime: str
+    :param transport: zmq transport between the threads, tcp, ipc or inproc, optional
+                      (default is the configured one)
+    :type transport: str or None
+
+    :return: summaries of the latency and of the throughput, see :func:`pushto.benchmarks.summarize`
+    :rtype: dict
+    """
+    if runtime not in RUNTIMES:
+        raise ValueError('unknown runtime %s' % runtime)
+
+    "Run on the loopback, on free ports, and forward every sample"
+    cfg.set_host_ip('127.0.0.1')
+    master = None
+    if hasattr(os, 'openpty'):
+        master, port = open_pty()
+        cfg.set_serial_port(port)
+    else:
+        cfg.set_serial_port('loop://')
+    for setter in (cfg.set_stc_port, cfg.set_td_ta_port, cfg.set_td_eq_port, cfg.set_pd_eq_port,
+                   cfg.set_pd_ta_port, cfg.set_gd_port):
+        setter(str(free_port()))
+    cfg.set_td_eq_decimation(1)
+    if transport is not None:
+        for edge in ('td_ta', 'td_eq', 'pd_eq'):
+            cfg.set_transport(edge, transport)
+    if fmt is not None:
+        cfg.set_td_ta_format(fmt)
+        cfg.set_td_eq_format(fmt)
+        cfg.set_pd_eq_format(fmt)
+
+    "Start the pipeline, from the end"
+    ctx = zmq.Context()
+    if runtime == 'asyncio':
+        pipeline = AsyncRuntime.setup(cfg, ctx)
+        pipeline.start()
+        client = socket.create_connection((cfg.get_host_ip(), cfg.get_stc_port()))
+        scope = pipeline.telescope
+        serial_port = scope.serial
+    else:
+        stel = StellariumTC.setup(cfg, ctx)
+        client = socket.create_connection((cfg.get_host_ip(), cfg.get_stc_port()))
+        stel.start()
+        site = Site.setup(cfg, ctx)
+        site.connect()
+        site.start()
+        scope = Telescope.setup(cfg, ctx)
+        scope.start()
+        serial_port = scope.reader.serial
+    client.settimeout(timeout)
+
+    _, phi_cnt, theta_cnt = synthetic_stream(n + burst, cfg)
+    if cfg.get_serial_protocol() == 'binary':
+        lines = [frame_encode(100000*(i + 1), p, t, 0, 0) for i, (p, t) in enumerate(zip(phi_cnt, theta_cnt))]
+        first = frame_encode(0, phi_cnt[0], theta_cnt[0], 0, 0)
+    else:
+        lines = [b'%d %d %d 0 0\r\n' % (100*(i + 1), p, t) for i, (p, t) in enumerate(zip(phi_cnt, theta_cnt))]
+        first = b'0 %d %d 0 0\r\n' % (phi_cnt[0], theta_cnt[0])
+    if master is not None:
+        def write(line):
+            os.write(master, line)
+    else:
+        write = serial_port.write
+
+    "Wait for the zmq subscriptions to be established"
+    deadline = time.time() + timeout
+    client.settimeout(0.1)
+    while True:
+        write(first)
+        try:
+            recv_frame(client)
+            break
+        except socket.timeout:
+            if time.time() > deadline:
+                raise TimeoutError('no frame received from the pipeline')
+    "Drain the frames of the lines written while waiting"
+    try:
+        while True:
+            recv_frame(client)
+    except socket.timeout:
+        pass
+    client.settimeout(timeout)
+
+    results = {}
+    try:
+        "Latency, one line at a time"
+        clock = time.perf_counter
+        latencies = np.empty(n)
+        for i, line in enumerate(lines[:n]):
+            t0 = clock()
+            write(line)
+            recv_frame(client)
+            latencies[i] = clock() - t0
+        results['pipeline.latency'] = summarize(latencies)
+
+        "Throughput, a burst of lines"
+        t0 = clock()
+        for line in lines[n:]:
+            write(line)
+        received = 0
+        client.settimeout(1)
+        try:
+            while received < burst:
+                recv_frame(client)
+                received += 1
+        except socket.timeout:
+            pass
+        elapsed = clock() - t0
+        results['pipeline.throughput'] = {'count': received, 'sent': burst,
+                                          'throughput': received/elapsed}
+    finally:
+        if runtime == 'asyncio':
+            pipeline.close(timeout)
+        else:
+            scope.close()
+            site.join(timeout)
+            stel.join(timeout)
+        client.close()
+        if master is not None:
+            os.close(master)
+        ctx.destroy(linger=0)
+
+    return results
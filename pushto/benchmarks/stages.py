@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+"""
+Per stage benchmarks of the pointing pipeline.
+
+Every stage is fed a synthetic stream of samples, the way it is called by the
+pipeline: one sample per call. The vectorized variants are also timed on the
+whole stream, and reported per sample.
+
+Provides:
+    - synthetic_stream
+    - run_stages
+
+"""
+import os
+import json
+import time
+import tempfile
+#
+import numpy as np
+#
+from pushto.benchmarks import measure, summarize
+from pushto.telescope import Encoders, PointingModel, SerialHandler
+from pushto.smoothing import AttitudeFilter
+from pushto.alignment import Aligner, angles_from_vec
+from pushto.site import Location
+from pushto.runtime import Pipeline
+from pushto.guidance import Guide
+from pushto.catalog import Catalog
+from pushto.prediction import Predictor
+from pushto.messages import Message, DataMessage
+from pushto.stellarium import stc_encode, stc_decode, STC_GOTO
+
+
+def synthetic_stream(n, cfg, rate=10.0, seed=0):
+    """
+    Generate a synthetic stream of encoder samples: a slow random walk of the
+    telescope, sampled at a fixed rate and starting now.
+
+    :param n: number of samples
+    :type n: int
+    :param cfg: the configuration, for the encoder resolutions
+    :type cfg: :obj:`Configuration`
+    :param rate: sample rate in Hz, optional
+    :type rate: float
+    :param seed: random seed, optional
+    :type seed: int
+
+    :return: unix times, phi counts and theta counts
+    :rtype: tuple(:obj:`np.ndarray`)
+    """
+    rng = np.random.default_rng(seed)
+    utc = time.time() + np.arange(n)/rate
+    phi_cnt = np.cumsum(rng.integers(-20, 21, n)) + cfg.get_phi_npr()//8
+    theta_cnt = np.clip(np.cumsum(rng.integers(-20, 21, n)) + cfg.get_theta_npr()//8,
+                        cfg.get_theta_npr()//72, cfg.get_theta_npr()//4)
+    return utc, phi_cnt, theta_cnt
+
+
+def run_stages(cfg, n=1000, seed=0):
+    """
+    Time every stage of the pipeline on a synthetic stream.
+
+    :param cfg: the configuration to build the stages from
+    :type cfg: :obj:`Configuration`
+    :param n: number of samples, optional
+    :type n: int
+    :param seed: random seed, optional
+    :type seed: int
+
+    :return: summary of every stage, see :func:`pushto.benchmarks.summarize`
+    :rtype: dict
+    """
+    results = {}
+    utc, phi_cnt, theta_cnt = synthetic_stream(n, cfg, seed=seed)
+
+    "Encoders"
+    enc = Encoders()
+    enc.config(cfg)
+    results['encoders.convert'] = measure(enc.convert, list(zip(phi_cnt.tolist(), theta_cnt.tolist())))
+    t0 = time.perf_counter()
+    phi_raw, theta_raw = enc.convert_array(phi_cnt, theta_cnt)
+    results['encoders.convert_array'] = summarize(np.full(n, (time.perf_counter() - t0)/n))
+
+    "Smoothing of the encoder counts, both filters"
+    for kind in ('alpha-beta', 'kalman'):
+        smoother = AttitudeFilter(kind, 360./cfg.get_phi_npr(), 360./cfg.get_theta_npr())
+        results['smoothing.%s' % kind] = measure(smoother.update, list(zip(utc.tolist(), phi_cnt.tolist(),
+                                                                           theta_cnt.tolist())))
+
+    "Pointing model, with non-zero terms so that every correction is exercised"
+    pm = PointingModel(ia=30, ie=-20, an=15, aw=-10, ca=25, npae=5, tx=3, tf=8)
+    args = list(zip(phi_raw.tolist(), theta_raw.tolist()))
+    results['pointing.apply'] = measure(pm.apply, args)
+    t0 = time.perf_counter()
+    phi, theta = pm.apply(phi_raw, theta_raw)
+    results['pointing.apply_array'] = summarize(np.full(n, (time.perf_counter() - t0)/n))
+    pm.set_grid(0.5)
+    results['pointing.apply_grid'] = measure(pm.apply, args)
+    pm.set_grid(None)
+
+    "Alignment, with a small rotation between the telescope and the horizontal frames"
+    aligner = Aligner()
+    for p, t in ((10, 20), (100, 50), (220, 70), (300, 30)):
+        aligner.add_star(p, t, p + 1.5, t - 0.7)
+    results['aligner.update'] = measure(aligner.update, [()]*n)
+    args = list(zip(phi.tolist(), theta.tolist()))
+    results['aligner.telescope_to_horizontal'] = measure(aligner.telescope_to_horizontal, args)
+    azi, alt = zip(*(aligner.telescope_to_horizontal(p, t) for p, t in args))
+
+    "Location, with the cached transformation and with the full astropy one (fewer samples)"
+    site = (cfg.get_latitude(), cfg.get_longitude(), cfg.get_elevation(),
+            cfg.get_pressure(), cfg.get_temperature(), cfg.get_rel_humidity())
+    location = Location(*site, refresh=cfg.get_transform_refresh() or 2)
+    args = list(zip(azi, alt, utc.tolist()))
+    results['location.horizontal_to_equatorial'] = measure(location.horizontal_to_equatorial, args)
+    slow = Location(*site)
+    results['location.horizontal_to_equatorial_astropy'] = measure(slow.horizontal_to_equatorial,
+                                                                   args[:max(n//50, 5)], warmup=2)
+    ra, dec = location.horizontal_to_equatorial(np.array(azi), np.array(alt), utc[0])
+
+    "Guidance to a target, every sample"
+    guide = Guide(location, aligner)
+    guide.set_target(float(np.mean(ra)), float(np.mean(dec)), utc[0])
+    results['guidance.offsets'] = measure(guide.offsets, list(zip(phi.tolist(), theta.tolist(), utc.tolist())))
+
+    "Catalog lookups of every sample, in a synthetic catalog of 100000 stars"
+    with tempfile.TemporaryDirectory() as tmp:
+        v = np.random.default_rng(seed).normal(size=(3, 100000))
+        c_ra, c_dec = angles_from_vec(v)
+        stars = os.path.join(tmp, 'stars.txt')
+        np.savetxt(stars, np.column_stack((c_ra*24/360, c_dec, np.linspace(-1, 12, len(c_ra)))), fmt='%.7f')
+        catalog = Catalog.open([stars])
+        args = list(zip(np.asarray(ra).tolist(), np.asarray(dec).tolist()))
+        results['catalog.nearest'] = measure(catalog.nearest, args)
+        results['catalog.cone'] = measure(lambda r, d: catalog.cone(r, d, 1.0), args)
+        catalog.close()
+
+    "Stellarium Telescope Control"
+    args = list(zip(utc.tolist(), np.asarray(ra).tolist(), np.asarray(dec).tolist()))
+    predictor = Predictor(horizon=0.25)
+    results['prediction.add'] = measure(predictor.add, args)
+    results['prediction.position'] = measure(predictor.position, [(u + 0.05,) for u, _, _ in args])
+    results['stellarium.stc_encode'] = measure(stc_encode, args)
+    gotos = [(STC_GOTO.pack(STC_GOTO.size, 0, int(1e6*u), int(r*2147483648/12.0) % 2**32,
+                            int(d*1073741824/90.0)),) for u, r, d in args]
+    results['stellarium.stc_decode'] = measure(stc_decode, gotos)
+
+    "Messages, in both wire formats"
+    msgs = [DataMessage(time=u, phi_cnt=int(pc), theta_cnt=int(tc), phi_raw=pr, theta_raw=tr, phi=p, theta=t,
+                        azi=a, alt=e, ra=r, dec=d, utc=True)
+            for u, pc, tc, pr, tr, p, t, a, e, r, d in zip(utc.tolist(), phi_cnt, theta_cnt, phi_raw.tolist(),
+                                                           theta_raw.tolist(), phi.tolist(), theta.tolist(),
+                                                           azi, alt, np.asarray(ra).tolist(),
+                                                           np.asarray(dec).tolist())]
+    results['messages.to_json'] = measure(lambda m: json.dumps(m.to_json()).encode('utf-8'),
+                                          [(m,) for m in msgs])
+    encoded = [(json.dumps(m.to_json()).encode('utf-8'),) for m in msgs]
+    results['messages.from_json'] = measure(Message.from_wire, encoded)
+    results['messages.to_bytes'] = measure(DataMessage.to_bytes, [(m,) for m in msgs])
+    encoded = [(m.to_bytes(),) for m in msgs]
+    results['messages.from_bytes'] = measure(Message.from_wire, encoded)
+
+    "Serial parsing, one line per read and all the lines of a read at once"
+    lines = [b'%d %d %d 0 0\r\n' % (100*(i + 1), p, t) for i, (p, t) in enumerate(zip(phi_cnt, theta_cnt))]
+    handler = SerialHandler(enc, PointingModel(ia=30, ie=-20, an=15, aw=-10, ca=25, npae=5, tx=3, tf=8),
+                            None, None, sink=lambda msg: None)
+    results['telescope.data_received'] = measure(handler.data_received, [(line,) for line in lines])
+    for size in (10, 100):
+        chunks = [b''.join(lines[i:i + size]) for i in range(0, n, size)]
+        t0 = time.perf_counter()
+        for chunk in chunks:
+            handler.data_received(chunk)
+        results['telescope.data_received_%d' % size] = summarize(np.full(n, (time.perf_counter() - t0)/n))
+
+    "Library mode, every stage by direct calls"
+    pipeline = Pipeline.setup(cfg)
+    args = list(zip(zip(phi_cnt.tolist(), theta_cnt.tolist()), utc.tolist()))
+    results['runtime.pipeline.process'] = measure(pipeline.process, args)
+
+    return results
@@ -0,0 +1,441 @@
+#!/usr/bin/env python
+"""
+Local sky catalog, for "what am I pointing at?" lookups.
+
+Provides:
+    - Catalog
+    - read_list
+    - cube_pixel
+    - pixel_vectors
+
+
+Star and DSO lists are text files of 'ra dec mag name' rows, ra in hours, dec in
+degrees and the name being the rest of the line. Lines starting with '#' are ignored.
+
+The objects are indexed on the sky with an equal-angle cube: the unit vectors
+(:func:`pushto.alignment.vec_from_angles`) are projected on the 6 faces of a cube,
+and every face is split into nside x nside pixels of equal angular width. The objects
+are sorted by pixel, so the objects of a pixel are contiguous and a pixel is a slice
+given by the pixel offsets.
+
+A cone query selects the rows of pixels around the center of the cone, see
+:meth:`Catalog.ranges`, and then the objects of these pixels within the cone. A nearest-neighbour query is a cone query whose radius is
+doubled until it contains enough objects.
+
+The sorted catalog and its index are built once and cached on disk, in a file that
+is memory-mapped. It is a 24B header followed by the arrays:
+
+    header:
+        - magic   (4B): b'PTCT'
+        - version (2B): 1
+        - nside   (2B): number of pixels along the edge of a face
+        - count   (4B): number of objects
+        - name    (4B): size of a name
+        - unused  (8B)
+
+    arrays:
+        - vectors (count x 3 float64): unit vectors
+        - mags    (count float32): magnitudes
+        - names   (count x name bytes): utf-8 encoded names, zero padded
+        - offsets ((6*nside*nside + 1) uint32): index of the first object of every pixel
+
+The cache is rebuilt when one of the lists is newer than it.
+
+"""
+import os
+import math
+import struct
+import logging
+#
+import numpy as np
+#
+from pushto.alignment import vec_from_angles, angles_from_vec
+
+CATALOG_MAGIC = b'PTCT'
+CATALOG_VERSION = 1
+CATALOG_HEADER = struct.Struct('<4sHHIIQ')
+
+"Average number of objects per pixel, and the range of nside"
+PIXEL_OCCUPANCY = 8
+MIN_NSIDE = 2
+MAX_NSIDE = 64
+
+"Number of objects between the candidate rows that are scanned rather than skipped"
+SPAN_SLACK = 1024
+
+"Axes of the faces of the cube: the major axis and the two axes of the face"
+FACE_AXES = ((0, 1, 2), (1, 2, 0), (2, 0, 1))
+
+
+def cube_pixel(v, nside):
+    """
+    Pixels of unit vectors on the equal-angle cube.
+
+    :param v: unit vectors, shape (3,) or (3, N)
+    :type v: :obj:`np.ndarray`
+    :param nside: number of pixels along the edge of a face
+    :type nside: int
+
+    :return: pixel numbers, in [0:6*nside*nside]
+    :rtype: int or :obj:`np.ndarray`
+    """
+    v = np.asarray(v, dtype=float)
+    a = np.argmax(np.abs(v), axis=0)
+    major = np.take_along_axis(v, a[None, ...], axis=0)[0]
+    face = 2*a + (major < 0)
+    b = np.take_along_axis(v, ((a + 1) % 3)[None, ...], axis=0)[0]
+    c = np.take_along_axis(v, ((a + 2) % 3)[None, ...], axis=0)[0]
+
+    "equal-angle coordinates on the face, in [0:1]"
+    u = np.arctan(b/np.abs(major))*(2/np.pi) + 0.5
+    w = np.arctan(c/np.abs(major))*(2/np.pi) + 0.5
+    i = np.clip((u*nside).astype(int), 0, nside - 1)
+    j = np.clip((w*nside).astype(int), 0, nside - 1)
+    return (face*nside + i)*nside + j
+
+
+def pixel_vectors(nside, di=0.5, dj=0.5):
+    """
+    Unit vectors at a position within every pixel of the equal-angle cube.
+
+    :param nside: number of pixels along the edge of a face
+    :type nside: int
+    :param di: position along the first axis of the face, in pixels, optional (default is the center)
+    :type di: float
+    :param dj: position along the second axis of the face, in pixels, optional (default is the center)
+    :type dj: float
+
+    :return: unit vectors of shape (6*nside*nside, 3), in the order of the pixel numbers
+    :rtype: :obj:`np.ndarray`
+    """
+    i, j = np.meshgrid(np.arange(nside), np.arange(nside), indexing='ij')
+    tan_u = np.tan(((i.ravel() + di)/nside - 0.5)*np.pi/2)
+    tan_w = np.tan(((j.ravel() + dj)/nside - 0.5)*np.pi/2)
+
+    faces = []
+    for face in range(6):
+        a, b, c = FACE_AXES[face//2]
+        v = np.empty((nside*nside, 3))
+        v[:, a] = -1.0 if face % 2 else 1.0
+        v[:, b] = tan_u
+        v[:, c] = tan_w
+        faces.append(v)
+    v = np.concatenate(faces)
+    return v/np.linalg.norm(v, axis=1, keepdims=True)
+
+
+def read_list(filename):
+    """
+    Read a star or DSO list of 'ra dec mag name' rows.
+
+    :param filename: name of the list
+    :type filename: str
+
+    :return: ra in hours, dec in degrees, magnitudes and names
+    :rtype: tuple
+    """
+    ra, dec, mag, names = [], [], [], []
+    with open(filename, 'r', encoding='utf-8') as f:
+        for n, line in enumerate(f, 1):
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.split(None, 3)
+            try:
+                ra.append(float(fields[0]))
+                dec.append(float(fields[1]))
+                mag.append(float(fields[2]))
+            except (ValueError, IndexError):
+                logging.warning('%s:%d: not a catalog row: %r' % (filename, n, line.rstrip()))
+                continue
+            names.append(fields[3].strip() if len(fields) > 3 else '')
+    return np.array(ra), np.array(dec), np.array(mag), names
+
+
+class Catalog(object):
+    """
+    Memory-mapped catalog of unit vectors and magnitudes, with a pixel index.
+
+    :param filename: name of the catalog file, see :meth:`build`
+    :type filename: str
+
+    >>> catalog = Catalog.open(['stars.txt', 'dso.txt'])
+    >>> index, sep = catalog.nearest(ra, dec, k=3, mag_limit=6)
+    >>> index, sep = catalog.cone(ra, dec, radius=0.5)
+    >>> print(catalog.name(index[0]), catalog.mags[index[0]])
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            magic, version, self.nside, count, name_size, _ = CATALOG_HEADER.unpack(f.read(CATALOG_HEADER.size))
+        if magic != CATALOG_MAGIC or version != CATALOG_VERSION:
+            raise ValueError('%s is not a version %d catalog file' % (filename, CATALOG_VERSION))
+
+        npix = 6*self.nside*self.nside
+        offset = CATALOG_HEADER.size
+        arrays = []
+        for dtype, shape in (('<f8', (count, 3)), ('<f4', (count,)), ('S%d' % max(name_size, 1), (count,)),
+                             ('<u4', (npix + 1,))):
+            dtype = np.dtype(dtype)
+            if count or shape[0] == npix + 1:
+                arrays.append(np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=shape))
+            else:
+                arrays.append(np.zeros(shape, dtype=dtype))
+            offset += dtype.itemsize*int(np.prod(shape))
+        "plain views of the memory maps, for the indexing speed"
+        self.vectors, self.mags, self.names, self.offsets = (np.asarray(a) for a in arrays)
+
+        "pixel centers, and the largest angle between a pixel center and its corners"
+        self.centers = pixel_vectors(self.nside)
+        cos = min(float(np.min(np.sum(pixel_vectors(self.nside, di, dj)*self.centers, axis=1)))
+                  for di in (0, 1) for dj in (0, 1))
+        self.pixel_radius = float(np.arccos(np.clip(cos, -1, 1)))
+
+    def __len__(self):
+        return len(self.vectors)
+
+    @staticmethod
+    def build(sources, filename, nside=None):
+        """
+        Build a catalog file from star and DSO lists.
+
+        :param sources: names of the lists, see :func:`read_list`
+        :type sources: list(str)
+        :param filename: name of the catalog file
+        :type filename: str
+        :param nside: number of pixels along the edge of a face, optional
+                      (default is about :data:`PIXEL_OCCUPANCY` objects per pixel)
+        :type nside: int or None
+        """
+        ra, dec, mag, names = [], [], [], []
+        for source in sources:
+            r, d, m, n = read_list(source)
+            ra.append(r)
+            dec.append(d)
+            mag.append(m)
+            names.extend(n)
+        ra = np.concatenate(ra) if ra else np.zeros(0)
+        dec = np.concatenate(dec) if dec else np.zeros(0)
+        mag = np.concatenate(mag) if mag else np.zeros(0)
+        count = len(ra)
+
+        if nside is None:
+            nside = int(np.clip(np.sqrt(count/(6*PIXEL_OCCUPANCY)), MIN_NSIDE, MAX_NSIDE))
+        vectors = vec_from_angles(ra*360/24, dec).reshape(3, count)
+        pix = cube_pixel(vectors, nside)
+
+        "sort by pixel, then by magnitude within a pixel"
+        order = np.lexsort((mag, pix))
+        offsets = np.searchsorted(pix[order], np.arange(6*nside*nside + 1)).astype('<u4')
+        encoded = np.array([n.encode('utf-8') for n in names], dtype=bytes)[order] if count else np.zeros(0, 'S1')
+        name_size = max(encoded.dtype.itemsize, 1)
+
+        tmp = filename + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(CATALOG_HEADER.pack(CATALOG_MAGIC, CATALOG_VERSION, nside, count, name_size, 0))
+            f.write(np.ascontiguousarray(vectors.T[order], dtype='<f8').tobytes())
+            f.write(mag[order].astype('<f4').tobytes())
+            f.write(encoded.astype('S%d' % name_size).tobytes())
+            f.write(offsets.tobytes())
+        os.replace(tmp, filename)
+        logging.debug('built catalog %s: %d objects, nside=%d' % (filename, count, nside))
+
+    @classmethod
+    def open(cls, sources, cache=None, nside=None):
+        """
+        Open the cached catalog of star and DSO lists, building it if it is missing or
+        older than one of the lists.
+
+        :param sources: names of the lists, see :func:`read_list`
+        :type sources: list(str)
+        :param cache: name of the catalog file, optional (default is the first list + '.ptct')
+        :type cache: str or None
+        :param nside: number of pixels along the edge of a face, optional
+        :type nside: int or None
+
+        :return: the catalog
+        :rtype: :obj:`Catalog`
+        """
+        cache = cache or sources[0] + '.ptct'
+        if (not os.path.exists(cache)
+                or any(os.path.getmtime(s) > os.path.getmtime(cache) for s in sources)):
+            cls.build(sources, cache, nside)
+        return Catalog(cache)
+
+    def ranges(self, v, radius):
+        """
+        Ranges of objects that contain all the objects within a cone.
+
+        On a face, a point at an angle s from the center of the cone has equal-angle
+        coordinates within sqrt(2)*s of those of the center, so when that window stays
+        on the face of the center, the candidates are rows of pixels: one contiguous
+        range of objects per row. Otherwise, the pixels are selected by the angle of
+        their center to the center of the cone.
+
+        :param v: unit vector of the center of the cone
+        :type v: :obj:`np.ndarray`
+        :param radius: radius of the cone in radians
+        :type radius: float
+
+        :return: (start, end) of the ranges
+        :rtype: list(tuple(int))
+        """
+        nside = self.nside
+        x = v.tolist()
+        a = max(range(3), key=lambda k: abs(x[k]))
+        m = abs(x[a])
+        u = math.atan(x[(a + 1) % 3]/m)
+        w = math.atan(x[(a + 2) % 3]/m)
+        half = math.sqrt(2)*radius
+        if max(abs(u), abs(w)) + half < math.pi/4:
+            face = 2*a + (x[a] < 0)
+            scale = 2*nside/math.pi
+            i0 = int((u - half)*scale + nside/2)
+            i1 = int((u + half)*scale + nside/2)
+            j0 = int((w - half)*scale + nside/2)
+            j1 = int((w + half)*scale + nside/2)
+            offsets = self.offsets
+            rows = []
+            for i in range(i0, i1 + 1):
+                p = (face*nside + i)*nside
+                rows.append((int(offsets[p + j0]), int(offsets[p + j1 + 1])))
+            return rows
+
+        limit = radius + self.pixel_radius
+        if limit >= math.pi:
+            return [(0, len(self.vectors))]
+        pix = np.flatnonzero(self.centers @ v >= math.cos(limit))
+
+        "merge the consecutive pixels"
+        breaks = np.flatnonzero(np.diff(pix) != 1)
+        first = np.concatenate(([0], breaks + 1))
+        last = np.concatenate((breaks, [len(pix) - 1]))
+        return list(zip(self.offsets[pix[first]].tolist(), self.offsets[pix[last] + 1].tolist()))
+
+    def query(self, v, radius, mag_limit=None):
+        """
+        Objects within a cone.
+
+        :param v: unit vector of the center of the cone
+        :type v: :obj:`np.ndarray`
+        :param radius: radius of the cone in radians
+        :type radius: float
+        :param mag_limit: ignore the objects fainter than this magnitude, optional
+        :type mag_limit: float or None
+
+        :return: indices of the objects and their cosines to the center, unsorted
+        :rtype: tuple(:obj:`np.ndarray`)
+        """
+        ranges = [(start, end) for start, end in self.ranges(v, radius) if end > start]
+        if not ranges:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        start = ranges[0][0]
+        end = ranges[-1][1]
+        if end - start <= 4*sum(e - s for s, e in ranges) + SPAN_SLACK:
+            "the rows are close, a single slice is cheaper than gathering them"
+            cos = self.vectors[start:end] @ v
+            index = np.flatnonzero(cos >= math.cos(radius))
+            cos = cos[index]
+            index += start
+        else:
+            index = np.concatenate([np.arange(s, e) for s, e in ranges])
+            cos = np.concatenate([self.vectors[s:e] for s, e in ranges]) @ v
+            keep = cos >= math.cos(radius)
+            index = index[keep]
+            cos = cos[keep]
+        if mag_limit is not None:
+            keep = self.mags[index] <= mag_limit
+            index = index[keep]
+            cos = cos[keep]
+        return index, cos
+
+    def cone(self, ra, dec, radius, mag_limit=None):
+        """
+        Objects within a cone, nearest first.
+
+        :param ra: right ascension of the center in hours
+        :type ra: float
+        :param dec: declination of the center in degrees
+        :type dec: float
+        :param radius: radius of the cone in degrees
+        :type radius: float
+        :param mag_limit: ignore the objects fainter than this magnitude, optional
+        :type mag_limit: float or None
+
+        :return: indices of the objects and their separations to the center in degrees
+        :rtype: tuple(:obj:`np.ndarray`)
+        """
+        v = vec_from_angles(ra*360/24, dec)
+        index, cos = self.query(v, math.radians(radius), mag_limit)
+        order = np.argsort(-cos)
+        return index[order], self.separation(cos[order])
+
+    def nearest(self, ra, dec, k=1, mag_limit=None):
+        """
+        The k nearest objects.
+
+        :param ra: right ascension in hours
+        :type ra: float
+        :param dec: declination in degrees
+        :type dec: float
+        :param k: number of objects, optional
+        :type k: int
+        :param mag_limit: ignore the objects fainter than this magnitude, optional
+        :type mag_limit: float or None
+
+        :return: indices of the objects and their separations in degrees, nearest first
+        :rtype: tuple(:obj:`np.ndarray`)
+        """
+        v = vec_from_angles(ra*360/24, dec)
+        radius = self.pixel_radius
+        while True:
+            index, cos = self.query(v, radius, mag_limit)
+            if len(index) >= k or radius >= np.pi:
+                break
+            radius *= 2
+        order = np.argsort(-cos)[:k]
+        return index[order], self.separation(cos[order])
+
+    @staticmethod
+    def separation(cos):
+        """
+        Separations from their cosines, to a few milli-arcseconds at small angles.
+
+        :param cos: cosines of the separations
+        :type cos: :obj:`np.ndarray`
+
+        :return: separations in degrees
+        :rtype: :obj:`np.ndarray`
+        """
+        return np.degrees(np.arccos(np.minimum(cos, 1.0)))
+
+    def name(self, index):
+        """
+        Name of an object.
+
+        :param index: index of the object
+        :type index: int
+
+        :return: the name
+        :rtype: str
+        """
+        return self.names[index].decode('utf-8')
+
+    def radec(self, index):
+        """
+        Equatorial coordinates of objects.
+
+        :param index: index of the objects
+        :type index: int or :obj:`np.ndarray`
+
+        :return: ra in hours, dec in degrees
+        :rtype: tuple
+        """
+        ra, dec = angles_from_vec(np.asarray(self.vectors[index]).T)
+        return ra*24/360, dec
+
+    def close(self):
+        """
+        Release the memory maps.
+        """
+        self.vectors = self.mags = self.names = self.offsets = None
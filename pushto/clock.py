@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+"""
+Clock synchronisation between the Arduino and the host.
+
+Provides:
+    - ClockSync
+    - fit_clock
+
+
+The Arduino stamps every sample with millis(), its own clock. The host only knows
+when a line arrives, which is the acquisition time plus the transmission time plus
+a variable queueing delay. Assuming the two clocks differ by an offset and a drift:
+
+    arrival = offset + rate*millis/1000 + delay,    delay >= 0
+
+a rolling linear fit of the arrival times against millis, with outlier rejection,
+gives the offset and the rate. The fit is shifted to the lower envelope of the
+arrival times, the samples that were delayed the least, so that the queueing jitter
+is removed from the time stamps and can be measured instead.
+
+The binary frames of the Arduino are stamped with micros() instead, the fit is the
+same with the tick of the clock set to a microsecond.
+
+"""
+import logging
+from collections import deque
+#
+import numpy as np
+
+"millis() and micros() are unsigned longs, they wrap after 2^32 ticks (~49.7 days, ~71.6 minutes)"
+MILLIS_WRAP = 2**32
+
+
+def fit_clock(x, y, reject=3.0):
+    """
+    Robust linear fit of the arrival times against the Arduino times, shifted to the
+    lower envelope of the arrival times.
+
+    :param x: Arduino times in seconds
+    :type x: :obj:`np.ndarray`
+    :param y: arrival times in seconds
+    :type y: :obj:`np.ndarray`
+    :param reject: outliers further than reject robust sigmas from the fit are rejected, optional
+    :type reject: float
+
+    :return: rate, offset, latency and jitter, or None if the times can't be fitted
+    :rtype: tuple(float) or None
+    """
+    if len(x) < 2 or np.ptp(x) == 0:
+        return None
+    keep = np.ones(len(x), dtype=bool)
+
+    for _ in range(3):
+        rate, offset = np.polyfit(x[keep], y[keep], 1)
+        res = y - (offset + rate*x)
+        med = np.median(res[keep])
+        sigma = 1.4826*np.median(np.abs(res[keep] - med))
+        new_keep = np.abs(res - med) <= max(reject*sigma, 1e-4)
+        if np.array_equal(new_keep, keep) or new_keep.sum() < 2:
+            break
+        keep = new_keep
+
+    "shift the fit to the lower envelope: the least delayed samples"
+    floor = np.min(res[keep])
+    return rate, offset + floor, np.median(res[keep]) - floor, sigma
+
+
+class ClockSync(object):
+    """
+    Online fit of the Arduino millis() clock to host UTC.
+
+    :param window: number of (millis, arrival) pairs used in the fit, optional
+    :type window: int
+    :param min_samples: number of pairs needed before the fit is used, optional
+    :type min_samples: int
+    :param refit: refit every refit-th pair, optional
+    :type refit: int
+    :param reject: outliers further than reject robust sigmas from the fit are rejected, optional
+    :type reject: float
+    :param delay: fixed transmission delay in seconds, subtracted from the time stamps, optional
+    :type delay: float
+    :param tick: duration in seconds of a tick of the Arduino clock, 1e-3 for millis(), 1e-6 for micros(), optional
+    :type tick: float
+
+    >>> clock = ClockSync()
+    >>> utc = clock.update(millis, time.time())
+    """
+
+    def __init__(self, window=200, min_samples=10, refit=10, reject=3.0, delay=0.0, tick=1e-3):
+        self.window = window
+        self.min_samples = min_samples
+        self.refit = refit
+        self.reject = reject
+        self.delay = delay
+        self.tick = tick
+
+        self.samples = None
+        self.last_millis = None
+        self.wraps = None
+        self.x0 = None
+        self.y0 = None
+        self.offset = None
+        self.rate = None
+        self.jitter = None
+        self.latency = None
+        self.n = None
+        self.reset()
+
+    def reset(self):
+        """
+        Forget all pairs, for example after the Arduino has been reset.
+        """
+        self.samples = deque(maxlen=self.window)
+        self.last_millis = None
+        self.wraps = 0
+        self.x0 = None
+        self.y0 = None
+        self.offset = None
+        self.rate = None
+        self.jitter = None
+        self.latency = None
+        self.n = 0
+
+    @property
+    def synced(self):
+        """
+        True when the fit is available.
+        """
+        return self.rate is not None
+
+    def unwrap(self, millis):
+        """
+        Convert millis into seconds on a continuous Arduino time axis.
+
+        :param millis: Arduino millis() value
+        :type millis: int
+
+        :return: seconds since the first sample
+        :rtype: float
+        """
+        millis = int(millis)
+        if self.last_millis is not None and millis < self.last_millis:
+            if self.last_millis - millis > MILLIS_WRAP//2:
+                self.wraps += 1
+            else:
+                logging.info('Arduino clock went backwards, resetting the clock sync')
+                self.reset()
+        self.last_millis = millis
+        x = (millis + self.wraps*MILLIS_WRAP)*self.tick
+        if self.x0 is None:
+            self.x0 = x
+        return x - self.x0
+
+    def update(self, millis, arrival):
+        """
+        Add a (millis, arrival) pair and return the acquisition time of the sample.
+
+        :param millis: Arduino millis() value of the sample
+        :type millis: int
+        :param arrival: host arrival time in seconds since epoch
+        :type arrival: float
+
+        :return: acquisition time in seconds since epoch
+        :rtype: float
+        """
+        x = self.unwrap(millis)
+        if self.y0 is None:
+            self.y0 = arrival
+        self.samples.append((x, arrival - self.y0))
+        self.n += 1
+
+        if len(self.samples) >= self.min_samples and (self.rate is None or self.n % self.refit == 0):
+            self.fit()
+
+        if self.rate is None:
+            return arrival - self.delay
+        return self.y0 + self.offset + self.rate*x - self.delay
+
+    def fit(self):
+        """
+        Fit the offset and the rate to the current window of pairs.
+        """
+        xy = np.array(self.samples)
+        result = fit_clock(xy[:, 0], xy[:, 1], self.reject)
+        if result is None:
+            "repeated millis, e.g. a replayed line, there is nothing to fit"
+            return
+        self.rate, self.offset, self.latency, self.jitter = result
+        logging.debug('clock sync: rate=%.9f latency=%.6f jitter=%.6f', self.rate, self.latency, self.jitter)
+
+    def convert(self, millis, arrival):
+        """
+        Fit a whole array of (millis, arrival) pairs at once and return the acquisition
+        times of the samples, e.g. for offline processing. The state of the online fit
+        is not changed.
+
+        The Arduino clock is unwrapped, and the pairs are split where it goes backwards
+        (an Arduino reset), every segment being fitted separately.
+
+        :param millis: Arduino millis() values
+        :type millis: :obj:`np.ndarray`
+        :param arrival: host arrival times in seconds since epoch
+        :type arrival: :obj:`np.ndarray`
+
+        :return: acquisition times in seconds since epoch
+        :rtype: :obj:`np.ndarray`
+        """
+        millis = np.asarray(millis, dtype=np.int64)
+        arrival = np.asarray(arrival, dtype=float)
+        step = np.diff(millis)
+        wraps = np.concatenate(([0], np.cumsum(step < -MILLIS_WRAP//2)))
+        x = (millis + wraps*MILLIS_WRAP)*self.tick
+        resets = np.flatnonzero((step < 0) & (step >= -MILLIS_WRAP//2)) + 1
+
+        utc = arrival - self.delay
+        for start, stop in zip(np.concatenate(([0], resets)), np.concatenate((resets, [len(x)]))):
+            if stop - start < self.min_samples:
+                continue
+            xs = x[start:stop] - x[start]
+            ys = arrival[start:stop] - arrival[start]
+            result = fit_clock(xs, ys, self.reject)
+            if result is not None:
+                rate, offset, _, _ = result
+                utc[start:stop] = arrival[start] + offset + rate*xs - self.delay
+        return utc
+
+    def to_unix(self, millis):
+        """
+        Convert an Arduino millis() value to seconds since epoch, without updating the fit.
+
+        :param millis: Arduino millis() value
+        :type millis: int
+
+        :return: acquisition time in seconds since epoch, or None if not synced
+        :rtype: float or None
+        """
+        if self.rate is None:
+            return None
+        x = (int(millis) + self.wraps*MILLIS_WRAP)*self.tick - self.x0
+        return self.y0 + self.offset + self.rate*x - self.delay
@@ -5,11 +5,43 @@ Configuration stuff
 [COMMUNICATION]
     - host_ip:      computer IP address, can be 127.0.0.1
     - serial_port:  serial port to which the Arduino is connected to
+    - serial_baudrate: baud rate of the serial port, must match the Arduino sketch
+    - serial_protocol: protocol of the Arduino data, text lines or binary frames
+    - sample_period: sample period of the Arduino in ms, 0 to keep the period of the sketch
     - stc_port:     port on which the Telescope Control is attached to
+    - stc_buffer:   number of positions buffered for a Telescope Control client that does not keep up
+    - stc_horizon:  max extrapolation in seconds of the positions sent to the Telescope Control,
+                    0 to not extrapolate
+    - stc_deadband: angular speed in deg/s below which the telescope is at rest, and its
+                    position is not extrapolated
+    - stc_rate:     rate in Hz of the positions sent to the Telescope Control between the
+                    samples, 0 to only send the samples
+    - stc_delay:    delay in seconds of the positions sent to the Telescope Control, e.g. one
+                    sample interval to interpolate between the samples rather than extrapolate
     - td_ta_port:   port on which the TD telescope attitudes are published
     - td_eq_port:   port on which the TD equatorial coords are published
     - pd_eq_port:   port on which the PD equatorial coords ars published
     - pd_ta_port:   port on which the pointing model pairs are published
+    - gd_port:      port on which the push-to guidance toward the goto target is published
+    - td_ta_format: wire format of the TD telescope attitudes, json or binary
+    - td_eq_format: wire format of the TD equatorial coords, json or binary
+    - pd_eq_format: wire format of the PD equatorial coords, json or binary
+    - gd_format:    wire format of the guidance, json or binary
+    - td_eq_decimation: publish every n-th sample on the TD equatorial port
+    - moni_port:    port on which the monitoring snapshots are published
+    - moni_interval: interval in seconds between monitoring snapshots, 0 to disable monitoring
+    - capture_file: session file to which the raw serial lines are appended, empty to not capture
+    - runtime:      runtime of the pointing pipeline, threads or asyncio (a single event loop)
+    - td_ta_transport: transport of the TD telescope attitudes, tcp, ipc or inproc
+    - td_eq_transport: transport of the TD equatorial coords, tcp, ipc or inproc
+    - pd_eq_transport: transport of the PD equatorial coords, tcp, ipc or inproc
+    - pd_ta_transport: transport of the pointing model pairs, tcp, ipc or inproc
+    - gd_transport: transport of the guidance, tcp, ipc or inproc
+
+The edges default to tcp, which any subscriber can reach. Components on one host
+can talk over ipc (unix sockets), and the components of a pipeline deployed in one
+process, sharing one zmq context, over inproc (no network stack). inproc is opt-in,
+since no other process can subscribe to an inproc edge.
 
 [LOCATION]
     - latitude:     latitude as decimal degree
@@ -18,12 +50,25 @@ Configuration stuff
     - pressure:     pressure in hPa, used for refraction correction
     - temperature:  temperature in C, used for refraction correction
     - rel_humidity: relative humidity [0:1], used for refraction correction
+    - transform_refresh: refresh interval in seconds of the cached equatorial transformation,
+                    0 to use the full astropy transformation for every sample
 
 [ENCODERS]
     - theta_npr:    number of counts per revolution for polar encoder, including gearing
     - phi_npr:      number of counts per revolution for azimuthal encoder, including gearing
     - flip_theta:   flip the sense of the polar encoder if true
     - flip_phi:     flip the sense of the azimuthal encoder if true
+    - filter:       smoothing of the encoder counts, none, alpha-beta or kalman
+    - filter_alpha: gain of the position of the alpha-beta filter
+    - filter_beta:  gain of the velocity of the alpha-beta filter
+    - filter_accel: standard deviation of the acceleration of the telescope in deg/s^2,
+                    the process noise of the kalman filter
+
+[ALIGNMENT]
+    - window:       max number of alignment stars kept, the oldest is dropped, 0 for no limit
+    - forget:       forgetting factor (0:1] applied to previous stars when a star is added
+    - goto:         what a Goto from Stellarium does, sync (add an alignment star) or guide
+                    (stream the offsets to the target on the guidance port)
 
 [POINTING]
     - ia:           index error in azimuth
@@ -34,11 +79,14 @@ Configuration stuff
     - npae:         non-perpendicularity of elevation axis and azimuth axis
     - tx:           tube flexure term proportional to cot(el)
     - tf:           tube flexure term proportional to cos(el)
+    - grid_resolution: spacing in degrees of the precomputed correction grid, 0 for the analytic corrections
+    - grid_order:   interpolation order of the correction grid, 1 (bilinear) or 3 (bicubic)
 
 """
 import sys
 import os
 import logging
+import tempfile
 from configparser import ConfigParser
 from importlib.resources import files
 #
@@ -47,6 +95,19 @@ from astropy.coordinates import EarthLocation, Latitude, Longitude
 
 DEFAULT_CONFIG_FILE = os.fspath(files('pushto').joinpath('pushto_default.cfg'))
 
+"Edges of the pipeline, and the zmq transports they can use"
+EDGES = ('td_ta', 'td_eq', 'pd_eq', 'pd_ta', 'gd')
+TRANSPORTS = ('tcp', 'ipc', 'inproc')
+
+"Protocols of the Arduino data, see :mod:`pushto.telescope`"
+SERIAL_PROTOCOLS = ('text', 'binary')
+
+"What a Goto from Stellarium does"
+GOTO_MODES = ('sync', 'guide')
+
+"Smoothing filters of the encoder counts, see :mod:`pushto.smoothing`"
+FILTER_KINDS = ('none', 'alpha-beta', 'kalman')
+
 
 class Configuration(object):
     """
@@ -119,6 +180,68 @@ class Configuration(object):
         logging.debug('setting serial port to %s' % value)
         self.config['COMMUNICATION']['serial_port'] = value
 
+    def get_serial_baudrate(self):
+        """
+        Get the baud rate of the serial port as an int
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_serial_baudrate()
+        9600
+        """
+        return self.config['COMMUNICATION'].getint('serial_baudrate', fallback=9600)
+        
+    def set_serial_baudrate(self, value):
+        """
+        Set the baud rate of the serial port
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_serial_baudrate(250000)
+        """
+        logging.debug('setting serial baud rate to %s' % str(value))
+        self.config['COMMUNICATION']['serial_baudrate'] = str(int(value))
+
+    def get_serial_protocol(self):
+        """
+        Get the protocol of the Arduino data, text or binary
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_serial_protocol()
+        'text'
+        """
+        return self.config['COMMUNICATION'].get('serial_protocol', 'text')
+        
+    def set_serial_protocol(self, value):
+        """
+        Set the protocol of the Arduino data, text or binary
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_serial_protocol('binary')
+        """
+        if value not in SERIAL_PROTOCOLS:
+            raise ValueError('unknown serial protocol %s, expected one of %s' % (value, SERIAL_PROTOCOLS))
+        logging.debug('setting serial protocol to %s' % value)
+        self.config['COMMUNICATION']['serial_protocol'] = value
+
+    def get_sample_period(self):
+        """
+        Get the sample period of the Arduino in ms, 0 to keep the period of the sketch
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_sample_period()
+        0.0
+        """
+        return self.config['COMMUNICATION'].getfloat('sample_period', fallback=0.0)
+        
+    def set_sample_period(self, value):
+        """
+        Set the sample period of the Arduino in ms
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_sample_period(2)
+        """
+        logging.debug('setting sample period to %s' % str(value))
+        self.config['COMMUNICATION']['sample_period'] = str(value)
+
     def get_stc_port(self):
         """
         Get the STC port number as an int
@@ -139,6 +262,106 @@ class Configuration(object):
         logging.debug('setting STC port to %s' % str(value))
         self.config['COMMUNICATION']['stc_port'] = str(value)
 
+    def get_stc_buffer(self):
+        """
+        Get the number of positions buffered for every STC client as an int
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_stc_buffer()
+        32
+        """
+        return self.config['COMMUNICATION'].getint('stc_buffer', fallback=32)
+        
+    def set_stc_buffer(self, value):
+        """
+        Set the number of positions buffered for every STC client
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_stc_buffer(32)
+        """
+        logging.debug('setting STC buffer to %s' % str(value))
+        self.config['COMMUNICATION']['stc_buffer'] = str(int(value))
+
+    def get_stc_horizon(self):
+        """
+        Get the max extrapolation in seconds of the positions sent to the STC, 0 to not extrapolate
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_stc_horizon()
+        0.0
+        """
+        return self.config['COMMUNICATION'].getfloat('stc_horizon', fallback=0.0)
+        
+    def set_stc_horizon(self, value):
+        """
+        Set the max extrapolation in seconds of the positions sent to the STC, 0 to not extrapolate
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_stc_horizon(0.25)
+        """
+        logging.debug('setting STC horizon to %s' % str(value))
+        self.config['COMMUNICATION']['stc_horizon'] = str(value)
+
+    def get_stc_deadband(self):
+        """
+        Get the angular speed in deg/s below which the positions sent to the STC are not extrapolated
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_stc_deadband()
+        0.01
+        """
+        return self.config['COMMUNICATION'].getfloat('stc_deadband', fallback=0.01)
+        
+    def set_stc_deadband(self, value):
+        """
+        Set the angular speed in deg/s below which the positions sent to the STC are not extrapolated
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_stc_deadband(0.005)
+        """
+        logging.debug('setting STC deadband to %s' % str(value))
+        self.config['COMMUNICATION']['stc_deadband'] = str(value)
+
+    def get_stc_rate(self):
+        """
+        Get the rate in Hz of the positions sent to the STC between the samples, 0 for none
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_stc_rate()
+        0.0
+        """
+        return self.config['COMMUNICATION'].getfloat('stc_rate', fallback=0.0)
+        
+    def set_stc_rate(self, value):
+        """
+        Set the rate in Hz of the positions sent to the STC between the samples, 0 for none
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_stc_rate(20)
+        """
+        logging.debug('setting STC rate to %s' % str(value))
+        self.config['COMMUNICATION']['stc_rate'] = str(value)
+
+    def get_stc_delay(self):
+        """
+        Get the delay in seconds of the positions sent to the STC, to interpolate between the samples
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_stc_delay()
+        0.0
+        """
+        return self.config['COMMUNICATION'].getfloat('stc_delay', fallback=0.0)
+        
+    def set_stc_delay(self, value):
+        """
+        Set the delay in seconds of the positions sent to the STC, to interpolate between the samples
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_stc_delay(0.1)
+        """
+        logging.debug('setting STC delay to %s' % str(value))
+        self.config['COMMUNICATION']['stc_delay'] = str(value)
+
     def get_td_ta_port(self):
         """
         Get the telescope data: telescope attitude port
@@ -219,6 +442,252 @@ class Configuration(object):
         logging.debug('setting PD-TA port to %s' % value)
         self.config['COMMUNICATION']['pd_ta_port'] = value
 
+    def get_gd_port(self):
+        """
+        Get the guidance data port
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_gd_port()
+        '10016'
+        """
+        return self.config['COMMUNICATION'].get('gd_port', '10016')
+        
+    def set_gd_port(self, value):
+        """
+        Set the guidance data port
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_gd_port('10016')
+        """
+        logging.debug('setting GD port to %s' % value)
+        self.config['COMMUNICATION']['gd_port'] = value
+
+    def get_td_ta_format(self):
+        """
+        Get the telescope data: telescope attitude wire format
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_td_ta_format()
+        'json'
+        """
+        return self.config['COMMUNICATION'].get('td_ta_format', 'json')
+        
+    def set_td_ta_format(self, value):
+        """
+        Set the telescope data: telescope attitude wire format
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_td_ta_format('binary')
+        """
+        logging.debug('setting TD-TA format to %s' % value)
+        self.config['COMMUNICATION']['td_ta_format'] = value
+
+    def get_td_eq_format(self):
+        """
+        Get the telescope data: equatorial wire format
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_td_eq_format()
+        'json'
+        """
+        return self.config['COMMUNICATION'].get('td_eq_format', 'json')
+        
+    def set_td_eq_format(self, value):
+        """
+        Set the telescope data: equatorial wire format
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_td_eq_format('binary')
+        """
+        logging.debug('setting TD-EQ format to %s' % value)
+        self.config['COMMUNICATION']['td_eq_format'] = value
+
+    def get_td_eq_decimation(self):
+        """
+        Get the telescope data: equatorial decimation factor
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_td_eq_decimation()
+        10
+        """
+        return self.config['COMMUNICATION'].getint('td_eq_decimation', fallback=10)
+        
+    def set_td_eq_decimation(self, value):
+        """
+        Set the telescope data: equatorial decimation factor
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_td_eq_decimation(10)
+        """
+        logging.debug('setting TD-EQ decimation to %s' % str(value))
+        self.config['COMMUNICATION']['td_eq_decimation'] = str(value)
+
+    def get_pd_eq_format(self):
+        """
+        Get the pointing data: equatorial wire format
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_pd_eq_format()
+        'json'
+        """
+        return self.config['COMMUNICATION'].get('pd_eq_format', 'json')
+        
+    def set_pd_eq_format(self, value):
+        """
+        Set the pointing data: equatorial wire format
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_pd_eq_format('binary')
+        """
+        logging.debug('setting PD-EQ format to %s' % value)
+        self.config['COMMUNICATION']['pd_eq_format'] = value
+
+    def get_gd_format(self):
+        """
+        Get the guidance data wire format
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_gd_format()
+        'json'
+        """
+        return self.config['COMMUNICATION'].get('gd_format', 'json')
+        
+    def set_gd_format(self, value):
+        """
+        Set the guidance data wire format
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_gd_format('binary')
+        """
+        logging.debug('setting GD format to %s' % value)
+        self.config['COMMUNICATION']['gd_format'] = value
+
+    def get_moni_port(self):
+        """
+        Get the monitoring port number as an int
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_moni_port()
+        10015
+        """
+        return self.config['COMMUNICATION'].getint('moni_port', fallback=10015)
+        
+    def set_moni_port(self, value):
+        """
+        Set the monitoring port number
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_moni_port(10015)
+        """
+        logging.debug('setting monitoring port to %s' % str(value))
+        self.config['COMMUNICATION']['moni_port'] = str(value)
+
+    def get_moni_interval(self):
+        """
+        Get the monitoring snapshot interval in seconds, 0 when monitoring is disabled
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_moni_interval()
+        5.0
+        """
+        return self.config['COMMUNICATION'].getfloat('moni_interval', fallback=5.0)
+        
+    def set_moni_interval(self, value):
+        """
+        Set the monitoring snapshot interval in seconds
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_moni_interval(5)
+        """
+        logging.debug('setting monitoring interval to %s' % str(value))
+        self.config['COMMUNICATION']['moni_interval'] = str(value)
+
+    def get_capture_file(self):
+        """
+        Get the name of the session file capturing the raw serial lines, None when not capturing
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_capture_file()
+        """
+        return self.config['COMMUNICATION'].get('capture_file', '') or None
+        
+    def set_capture_file(self, value):
+        """
+        Set the name of the session file capturing the raw serial lines, empty to not capture
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_capture_file('session.ptsc')
+        """
+        logging.debug('setting capture file to %s' % value)
+        self.config['COMMUNICATION']['capture_file'] = value or ''
+
+    def get_runtime(self):
+        """
+        Get the runtime of the pointing pipeline, threads or asyncio
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_runtime()
+        'threads'
+        """
+        return self.config['COMMUNICATION'].get('runtime', 'threads')
+        
+    def set_runtime(self, value):
+        """
+        Set the runtime of the pointing pipeline, threads or asyncio
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_runtime('asyncio')
+        """
+        logging.debug('setting runtime to %s' % value)
+        self.config['COMMUNICATION']['runtime'] = value
+
+    def get_transport(self, edge):
+        """
+        Get the transport of an edge of the pipeline, tcp, ipc or inproc
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_transport('pd_ta')
+        'tcp'
+        """
+        value = self.config['COMMUNICATION'].get('%s_transport' % edge, 'tcp')
+        if value not in TRANSPORTS:
+            raise ValueError('unknown transport %s for %s, expected one of %s' % (value, edge, ', '.join(TRANSPORTS)))
+        return value
+        
+    def set_transport(self, edge, value):
+        """
+        Set the transport of an edge of the pipeline, tcp, ipc or inproc
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_transport('td_ta', 'inproc')
+        """
+        if edge not in EDGES:
+            raise ValueError('unknown edge %s, expected one of %s' % (edge, ', '.join(EDGES)))
+        if value not in TRANSPORTS:
+            raise ValueError('unknown transport %s, expected one of %s' % (value, ', '.join(TRANSPORTS)))
+        logging.debug('setting %s transport to %s' % (edge, value))
+        self.config['COMMUNICATION']['%s_transport' % edge] = value
+
+    def get_address(self, edge):
+        """
+        Get the zmq address of an edge of the pipeline, from its transport and port:
+        
+            - tcp:    tcp://<host_ip>:<port>
+            - ipc:    ipc://<temporary directory>/pushto-<port>
+            - inproc: inproc://pushto-<edge>
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_address('pd_ta')
+        'tcp://127.0.0.1:10014'
+        """
+        transport = self.get_transport(edge)
+        port = getattr(self, 'get_%s_port' % edge)()
+        if transport == 'inproc':
+            return 'inproc://pushto-%s' % edge
+        if transport == 'ipc':
+            return 'ipc://%s' % os.path.join(tempfile.gettempdir(), 'pushto-%s' % port)
+        return 'tcp://%s:%s' % (self.get_host_ip(), port)
+
     """
     Location info
     """
@@ -376,6 +845,26 @@ class Configuration(object):
         logging.debug('setting relative humidity to %s' % str(humidity))
         self.config.set('LOCATION', 'rel_humidity', str(humidity))   
 
+    def get_transform_refresh(self):
+        """
+        Get the refresh interval of the cached equatorial transformation in seconds
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_transform_refresh()
+        2.0
+        """
+        return self.config['LOCATION'].getfloat('transform_refresh', fallback=0.0)
+        
+    def set_transform_refresh(self, value):
+        """
+        Set the refresh interval of the cached equatorial transformation in seconds
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_transform_refresh(2)
+        """
+        logging.debug('setting transform refresh to %s' % str(value))
+        self.config['LOCATION']['transform_refresh'] = str(value)
+
     """
     Encoder info
     """
@@ -459,6 +948,159 @@ class Configuration(object):
         logging.debug('setting flip_phi to %s' % str(flip_phi))
         self.config['ENCODERS']['flip_phi'] = str(flip_phi)
 
+    def get_filter(self):
+        """
+        Get the smoothing filter of the encoder counts, none, alpha-beta or kalman
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_filter()
+        'none'
+        """
+        return self.config.get('ENCODERS', 'filter', fallback='none')
+        
+    def set_filter(self, value):
+        """
+        Set the smoothing filter of the encoder counts, none, alpha-beta or kalman
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_filter('kalman')
+        """
+        if value not in FILTER_KINDS:
+            raise ValueError('unknown filter %s, expected one of %s' % (value, FILTER_KINDS))
+        logging.debug('setting filter to %s' % value)
+        self.config['ENCODERS']['filter'] = value
+
+    def get_filter_alpha(self):
+        """
+        Get the gain of the position of the alpha-beta filter
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_filter_alpha()
+        0.5
+        """
+        return self.config.getfloat('ENCODERS', 'filter_alpha', fallback=0.5)
+        
+    def set_filter_alpha(self, value):
+        """
+        Set the gain of the position of the alpha-beta filter
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_filter_alpha(0.3)
+        """
+        logging.debug('setting filter alpha to %s' % str(value))
+        self.config['ENCODERS']['filter_alpha'] = str(value)
+
+    def get_filter_beta(self):
+        """
+        Get the gain of the velocity of the alpha-beta filter
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_filter_beta()
+        0.1
+        """
+        return self.config.getfloat('ENCODERS', 'filter_beta', fallback=0.1)
+        
+    def set_filter_beta(self, value):
+        """
+        Set the gain of the velocity of the alpha-beta filter
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_filter_beta(0.05)
+        """
+        logging.debug('setting filter beta to %s' % str(value))
+        self.config['ENCODERS']['filter_beta'] = str(value)
+
+    def get_filter_accel(self):
+        """
+        Get the standard deviation of the acceleration of the telescope in deg/s^2, for the kalman filter
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_filter_accel()
+        1.0
+        """
+        return self.config.getfloat('ENCODERS', 'filter_accel', fallback=1.0)
+        
+    def set_filter_accel(self, value):
+        """
+        Set the standard deviation of the acceleration of the telescope in deg/s^2, for the kalman filter
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_filter_accel(2)
+        """
+        logging.debug('setting filter acceleration to %s' % str(value))
+        self.config['ENCODERS']['filter_accel'] = str(value)
+
+    """
+    Alignment info
+    """
+    def get_align_window(self):
+        """
+        Get the max number of alignment stars kept, 0 means no limit
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_align_window()
+        0
+        """
+        return self.config.getint('ALIGNMENT', 'window', fallback=0)
+        
+    def set_align_window(self, value):
+        """
+        Set the max number of alignment stars kept, 0 means no limit
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_align_window(10)
+        """
+        logging.debug('setting alignment window to %s' % str(value))
+        if not self.config.has_section('ALIGNMENT'):
+            self.config.add_section('ALIGNMENT')
+        self.config['ALIGNMENT']['window'] = str(value)
+
+    def get_align_forget(self):
+        """
+        Get the alignment forgetting factor
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_align_forget()
+        1.0
+        """
+        return self.config.getfloat('ALIGNMENT', 'forget', fallback=1.0)
+        
+    def set_align_forget(self, value):
+        """
+        Set the alignment forgetting factor
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_align_forget(0.9)
+        """
+        logging.debug('setting alignment forgetting factor to %s' % str(value))
+        if not self.config.has_section('ALIGNMENT'):
+            self.config.add_section('ALIGNMENT')
+        self.config['ALIGNMENT']['forget'] = str(value)
+
+    def get_goto_mode(self):
+        """
+        Get what a Goto from Stellarium does, sync or guide
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_goto_mode()
+        'sync'
+        """
+        return self.config.get('ALIGNMENT', 'goto', fallback='sync')
+        
+    def set_goto_mode(self, value):
+        """
+        Set what a Goto from Stellarium does, sync or guide
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_goto_mode('guide')
+        """
+        if value not in GOTO_MODES:
+            raise ValueError('unknown goto mode %s, expected one of %s' % (value, GOTO_MODES))
+        logging.debug('setting goto mode to %s' % value)
+        if not self.config.has_section('ALIGNMENT'):
+            self.config.add_section('ALIGNMENT')
+        self.config['ALIGNMENT']['goto'] = value
+
     """
     Pointing info
     """
@@ -622,6 +1264,47 @@ class Configuration(object):
         logging.debug('setting tf to %s' % str(value))
         self.config['POINTING']['tf'] = str(value)
 
+    def get_grid_resolution(self):
+        """
+        Get the resolution in degrees of the precomputed correction grid, 0 when the
+        corrections are evaluated analytically
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_grid_resolution()
+        0.0
+        """
+        return self.config['POINTING'].getfloat('grid_resolution', fallback=0.0)
+        
+    def set_grid_resolution(self, value):
+        """
+        Set the resolution in degrees of the precomputed correction grid, 0 to disable it
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_grid_resolution(0.5)
+        """
+        logging.debug('setting grid resolution to %s' % str(value))
+        self.config['POINTING']['grid_resolution'] = str(value)
+
+    def get_grid_order(self):
+        """
+        Get the interpolation order of the correction grid, 1 (bilinear) or 3 (bicubic)
+        
+        >>> cfg = Configuration()
+        >>> cfg.get_grid_order()
+        1
+        """
+        return self.config['POINTING'].getint('grid_order', fallback=1)
+        
+    def set_grid_order(self, value):
+        """
+        Set the interpolation order of the correction grid, 1 (bilinear) or 3 (bicubic)
+        
+        >>> cfg = Configuration()
+        >>> cfg.set_grid_order(3)
+        """
+        logging.debug('setting grid order to %s' % str(value))
+        self.config['POINTING']['grid_order'] = str(value)
+
     def get_pointing_model(self):
         """
         Get the parameters of the pointing model as a list
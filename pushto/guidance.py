@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+"""
+Push-to guidance toward a target.
+
+Provides:
+    - Guide
+
+
+In guide mode, a Goto from Stellarium is not a sync star but a target to push the
+telescope to. For every sample of the encoders, the remaining offsets to the target
+in the telescope frame (d_phi, d_theta) and the separation on the sky are published,
+at the full sample rate.
+
+The target is fixed on the sky, but it moves in the horizontal frame. It is converted
+once per span (10s by default) with the full equatorial to horizontal transformation,
+at the start and at the end of the span, and linearly interpolated in between. Over
+10s the target moves by less than 3 arcmin, and the interpolated direction is within
+0.01 arcsec of the exact one (0.007 arcsec at most, in the middle of the span). The alignment rotation is applied to the interpolated
+direction, so a change of the alignment takes effect immediately.
+
+Per sample, the offsets cost a 3x3 rotation and a few trigonometric functions of
+scalars, done with :mod:`math`: a few microseconds, negligible at 20-100 Hz even on
+a Raspberry Pi.
+
+"""
+import math
+import time
+#
+import numpy as np
+#
+from pushto.alignment import vec_from_angles
+from pushto.messages import GuideMessage
+
+
+class Guide(object):
+    """
+    Offsets of the telescope to a target.
+
+    :param location: the location of the telescope
+    :type location: :obj:`pushto.site.Location`
+    :param aligner: the telescope aligner
+    :type aligner: :obj:`pushto.alignment.Aligner`
+    :param span: interval in seconds between two conversions of the target, optional
+    :type span: float
+    :param now: the host clock, used for the samples without an acquisition time, optional
+    :type now: callable
+
+    >>> guide = Guide(location, aligner)
+    >>> guide.set_target(ra, dec)
+    >>> d_phi, d_theta, sep = guide.offsets(phi, theta, time.time())
+    """
+
+    def __init__(self, location, aligner, span=10, now=time.time):
+        self.location = location
+        self.aligner = aligner
+        self.span = span
+        self.now = now
+
+        self.ra = None
+        self.dec = None
+        self.epoch = None
+        self.h0 = None
+        self.dh = None
+        self.R_inv = None
+        self.rows = None
+
+    @property
+    def active(self):
+        """
+        True if there is a target.
+        """
+        return self.ra is not None
+
+    def set_target(self, ra, dec, utc=None):
+        """
+        Set the target.
+
+        :param ra: right ascension of the target in hours
+        :type ra: float
+        :param dec: declination of the target in degrees
+        :type dec: float
+        :param utc: time in seconds since epoch of the first conversion, optional (default is now)
+        :type utc: float or None
+        """
+        self.ra = float(ra)
+        self.dec = float(dec)
+        self.convert(self.now() if utc is None else float(utc))
+
+    def clear(self):
+        """
+        Forget the target.
+        """
+        self.ra = None
+        self.dec = None
+        self.epoch = None
+
+    def convert(self, unix):
+        """
+        Convert the target to horizontal directions at the start and at the end of a span.
+
+        :param unix: start of the span in seconds since epoch
+        :type unix: float
+        """
+        h0 = vec_from_angles(*self.location.equatorial_to_horizontal(self.ra, self.dec, unix))
+        h1 = vec_from_angles(*self.location.equatorial_to_horizontal(self.ra, self.dec, unix + self.span))
+        self.epoch = unix
+        self.h0 = h0.tolist()
+        self.dh = ((h1 - h0)/self.span).tolist()
+
+    def target(self, unix):
+        """
+        Direction of the target in the telescope frame.
+
+        :param unix: time in seconds since epoch
+        :type unix: float
+
+        :return: unit vector
+        :rtype: list(float)
+        """
+        dt = unix - self.epoch
+        if dt < 0 or dt > self.span:
+            self.convert(unix)
+            dt = 0.0
+        h0 = self.h0
+        dh = self.dh
+        h = (h0[0] + dh[0]*dt, h0[1] + dh[1]*dt, h0[2] + dh[2]*dt)
+
+        "the aligner replaces its matrices when it is updated"
+        if self.aligner.R_inv is not self.R_inv:
+            self.R_inv = self.aligner.R_inv
+            self.rows = np.asarray(self.R_inv).tolist()
+        v = [r[0]*h[0] + r[1]*h[1] + r[2]*h[2] for r in self.rows]
+        norm = math.sqrt(v[0]*v[0] + v[1]*v[1] + v[2]*v[2])
+        return [v[0]/norm, v[1]/norm, v[2]/norm]
+
+    def offsets(self, phi, theta, unix):
+        """
+        Offsets of the telescope to the target.
+
+        :param phi: azimuthal angle of the telescope in degrees
+        :type phi: float
+        :param theta: elevation angle of the telescope in degrees
+        :type theta: float
+        :param unix: time in seconds since epoch
+        :type unix: float
+
+        :return: d_phi (wrapped to [-180:180]), d_theta and the separation, in degrees
+        :rtype: tuple(float)
+        """
+        t = self.target(unix)
+        p = math.radians(phi)
+        e = math.radians(theta)
+        cos_e = math.cos(e)
+        s = (cos_e*math.cos(p), cos_e*math.sin(p), math.sin(e))
+
+        "atan2 of the cross and dot products is accurate at small separations"
+        cx = s[1]*t[2] - s[2]*t[1]
+        cy = s[2]*t[0] - s[0]*t[2]
+        cz = s[0]*t[1] - s[1]*t[0]
+        sep = math.atan2(math.sqrt(cx*cx + cy*cy + cz*cz), s[0]*t[0] + s[1]*t[1] + s[2]*t[2])
+
+        t_phi = math.degrees(math.atan2(t[1], t[0]))
+        t_theta = math.degrees(math.asin(max(-1.0, min(1.0, t[2]))))
+        d_phi = (t_phi - phi + 180) % 360 - 180
+        return d_phi, t_theta - theta, math.degrees(sep)
+
+    def handle(self, msg):
+        """
+        Guidance for a transformed or untransformed DATA message.
+
+        :param msg: data message with time, phi and theta
+        :type msg: :obj:`pushto.messages.DataMessage`
+
+        :return: the guidance, or None if there is no target
+        :rtype: :obj:`pushto.messages.GuideMessage` or None
+        """
+        if self.ra is None or msg.phi is None:
+            return None
+        unix = msg.time if msg.utc else self.now()
+        d_phi, d_theta, sep = self.offsets(msg.phi, msg.theta, unix)
+        return GuideMessage(time=unix, phi=msg.phi, theta=msg.theta, d_phi=d_phi, d_theta=d_theta, sep=sep)
@@ -0,0 +1,317 @@
+#!/usr/bin/env python
+"""
+Bulk harvesting of Stellarium object data into a local cache.
+
+Provides:
+    - InfoCache
+    - Harvester
+
+
+The Remote Control plugin answers one object per request. The harvester pulls the
+object lists and the info of many objects ahead of time, with a pooled keep-alive
+session (:func:`pushto.stellarium.rpc_session`, which also retries the failed
+requests) and a bounded number of concurrent requests, and stores the results in
+an :class:`InfoCache`. Lookups during a session are then served from the cache,
+without any HTTP request.
+
+The cache is a :mod:`sqlite3` table of JSON documents, every entry with its own
+expiry time:
+
+    - 'types': the object types
+    - 'objects:<type>': the names of the objects of a type
+    - 'info:<name>': the info of an object
+
+"""
+import json
+import time
+import logging
+import sqlite3
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+#
+import requests
+#
+from pushto.stellarium import StellariumRPC, rpc_session
+
+"Number of harvested objects written to the cache in one transaction"
+HARVEST_BATCH = 100
+
+
+class InfoCache(object):
+    """
+    On-disk cache of JSON documents with a time to live.
+
+    :param filename: name of the cache file, ':memory:' for a cache in memory
+    :type filename: str
+    :param ttl: default time to live of the entries in seconds, optional
+    :type ttl: float
+    :param now: the clock, optional
+    :type now: callable
+
+    >>> cache = InfoCache('stellarium.sqlite', ttl=3600)
+    >>> cache.put('info:Polaris', info)
+    >>> info = cache.get('info:Polaris')
+    """
+
+    def __init__(self, filename, ttl=3600, now=time.time):
+        self.filename = filename
+        self.ttl = ttl
+        self.now = now
+        self.db = sqlite3.connect(filename)
+        self.db.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires REAL)')
+        self.db.commit()
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM cache WHERE expires > ?', (self.now(),)).fetchone()[0]
+
+    def get(self, key):
+        """
+        Get an entry.
+
+        :param key: the key
+        :type key: str
+
+        :return: the document, or None if it is missing or expired
+        :rtype: dict or list or None
+        """
+        row = self.db.execute('SELECT value FROM cache WHERE key = ? AND expires > ?',
+                              (key, self.now())).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, key, value, ttl=None):
+        """
+        Store an entry.
+
+        :param key: the key
+        :type key: str
+        :param value: the document
+        :type value: dict or list
+        :param ttl: time to live in seconds, optional (default is the ttl of the cache)
+        :type ttl: float or None
+        """
+        self.put_many([(key, value)], ttl)
+
+    def put_many(self, items, ttl=None):
+        """
+        Store entries, in one transaction.
+
+        :param items: (key, document) pairs
+        :type items: iterable
+        :param ttl: time to live in seconds, optional (default is the ttl of the cache)
+        :type ttl: float or None
+        """
+        expires = self.now() + (self.ttl if ttl is None else ttl)
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO cache VALUES (?, ?, ?)',
+                                ((key, json.dumps(value), expires) for key, value in items))
+
+    def missing(self, keys):
+        """
+        Keys that are missing or expired.
+
+        :param keys: the keys
+        :type keys: iterable(str)
+
+        :return: the keys without a fresh entry, in order
+        :rtype: list(str)
+        """
+        now = self.now()
+        fresh = set()
+        keys = list(keys)
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self.db.execute('SELECT key FROM cache WHERE expires > ? AND key IN (%s)' % ','.join('?'*len(chunk)),
+                                   [now] + chunk)
+            fresh.update(row[0] for row in rows)
+        return [key for key in keys if key not in fresh]
+
+    def purge(self):
+        """
+        Delete the expired entries.
+
+        :return: number of deleted entries
+        :rtype: int
+        """
+        with self.db:
+            return self.db.execute('DELETE FROM cache WHERE expires <= ?', (self.now(),)).rowcount
+
+    def close(self):
+        """
+        Close the cache file.
+        """
+        self.db.close()
+
+
+class Harvester(object):
+    """
+    Pulls object lists and info from the Stellarium Remote Control plugin into a cache.
+
+    :param rpc: the Remote Control interface
+    :type rpc: :obj:`pushto.stellarium.StellariumRPC`
+    :param cache: the cache
+    :type cache: :obj:`InfoCache`
+    :param workers: max number of concurrent requests, optional
+    :type workers: int
+    :param list_ttl: time to live of the object lists in seconds, optional
+    :type list_ttl: float
+    :param info_ttl: time to live of the object info in seconds, optional
+    :type info_ttl: float
+
+    >>> harvester = Harvester(StellariumRPC(), InfoCache('stellarium.sqlite'))
+    >>> harvester.harvest(types=['StarMgr'])
+    >>> info = harvester.lookup('Polaris')
+
+    The requests are issued by a pool of workers sharing the keep-alive connections
+    of the session of the rpc, its pool should hold at least as many connections as
+    there are workers.
+    """
+
+    def __init__(self, rpc, cache, workers=4, list_ttl=86400, info_ttl=3600):
+        self.rpc = rpc
+        self.cache = cache
+        self.workers = workers
+        self.list_ttl = list_ttl
+        self.info_ttl = info_ttl
+
+    def object_types(self):
+        """
+        The types of objects, from the cache or from Stellarium.
+
+        :return: the types, with their 'key' and 'name'
+        :rtype: list(dict)
+        """
+        types = self.cache.get('types')
+        if types is None:
+            types = self.rpc.get_object_types()
+            self.cache.put('types', types, self.list_ttl)
+        return types
+
+    def objects(self, obj_type):
+        """
+        The names of the objects of a type, from the cache or from Stellarium.
+
+        :param obj_type: key of the type
+        :type obj_type: str
+
+        :return: the names
+        :rtype: list(str)
+        """
+        key = 'objects:%s' % obj_type
+        names = self.cache.get(key)
+        if names is None:
+            names = self.rpc.get_objects(obj_type)
+            self.cache.put(key, names, self.list_ttl)
+        return names
+
+    def lookup(self, name):
+        """
+        The info of an object, from the cache only.
+
+        :param name: name of the object
+        :type name: str
+
+        :return: the info, or None if it is not cached
+        :rtype: dict or None
+        """
+        return self.cache.get('info:%s' % name)
+
+    def info(self, name):
+        """
+        The info of an object, from the cache or from Stellarium.
+
+        :param name: name of the object
+        :type name: str
+
+        :return: the info
+        :rtype: dict
+        """
+        info = self.lookup(name)
+        if info is None:
+            info = self.rpc.get_object_info(name)
+            self.cache.put('info:%s' % name, info, self.info_ttl)
+        return info
+
+    def fetch(self, name):
+        """
+        Request the info of an object, run by the workers.
+
+        :return: the name, and the info or None if the request failed
+        :rtype: tuple
+        """
+        try:
+            return name, self.rpc.get_object_info(name)
+        except (requests.RequestException, ValueError) as e:
+            logging.warning('could not get the info of %s: %s' % (name, e))
+            return name, None
+
+    def harvest(self, names=(), types=(), refresh=False):
+        """
+        Pull the info of objects into the cache.
+
+        :param names: names of the objects, optional
+        :type names: iterable(str)
+        :param types: keys of types whose objects are all harvested, optional
+        :type types: iterable(str)
+        :param refresh: also request the objects that are already cached, optional
+        :type refresh: bool
+
+        :return: numbers of harvested objects and of failed requests
+        :rtype: tuple(int)
+        """
+        names = list(dict.fromkeys(list(names) + [n for t in types for n in self.objects(t)]))
+        if not refresh:
+            names = [key[5:] for key in self.cache.missing('info:%s' % n for n in names)]
+        logging.info('harvesting %d objects with %d workers' % (len(names), self.workers))
+
+        done = 0
+        failed = 0
+        batch = []
+
+        def collect(result):
+            nonlocal done, failed
+            name, info = result
+            if info is None:
+                failed += 1
+                return
+            batch.append(('info:%s' % name, info))
+            done += 1
+            if len(batch) >= HARVEST_BATCH:
+                self.cache.put_many(batch, self.info_ttl)
+                batch.clear()
+
+        "keep a bounded number of requests in flight, the results are stored by this thread"
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = deque()
+            for name in names:
+                pending.append(pool.submit(self.fetch, name))
+                if len(pending) >= 2*self.workers:
+                    collect(pending.popleft().result())
+            while pending:
+                collect(pending.popleft().result())
+        if batch:
+            self.cache.put_many(batch, self.info_ttl)
+
+        logging.info('harvested %d objects, %d failed' % (done, failed))
+        return done, failed
+
+    @classmethod
+    def setup(cls, api_url, filename, workers=4, list_ttl=86400, info_ttl=3600):
+        """
+        Convenience method for creating a Harvester with a pool of as many connections as workers
+
+        :param api_url: url of the Remote Control api
+        :type api_url: str
+        :param filename: name of the cache file
+        :type filename: str
+        :param workers: max number of concurrent requests, optional
+        :type workers: int
+        :param list_ttl: time to live of the object lists in seconds, optional
+        :type list_ttl: float
+        :param info_ttl: time to live of the object info in seconds, optional
+        :type info_ttl: float
+
+        :return: the harvester
+        :rtype: :obj:`Harvester`
+        """
+        rpc = StellariumRPC(api_url, rpc_session(pool=workers))
+        return Harvester(rpc, InfoCache(filename, info_ttl), workers, list_ttl, info_ttl)
@@ -2,10 +2,134 @@
 """
 Messages
 
-    - data: azi_cnt, alt_cnt, phi, theta, azi, alt, ra, dec
+    - data: azi_cnt, alt_cnt, phi, theta, azi, alt, ra, dec, and the angular velocities
+            phi_rate, theta_rate (deg/s) of the raw attitude, folded past the zenith like it,
+            if the encoder counts are smoothed
+    - guide: phi, theta, d_phi, d_theta, sep (remaining offsets to the goto target)
+    - time: seconds since the unix epoch as a float, except for raw telescope data
+            which carries the Arduino time stamp
+    - utc:  DATA only, True if the time is an acquisition time in seconds since the
+            unix epoch, unset if it is the Arduino time stamp (or there is no time)
+
+Messages travel either as JSON dictionaries or in a compact binary format. The
+binary format is a 4B header followed by a fixed little-endian layout per type:
+
+    - version (1B): wire format version, currently 3 (1 had no angular velocities,
+                    2 no utc flag)
+    - type    (1B): 1 for DATA, 2 for ALIGN, 3 for CMD, 4 for GUIDE
+    - mask    (2B): bit i is set if field i is present (not None)
+
+DATA, ALIGN and GUIDE fields are packed as float64, counts as int64, flags as bool, with
+absent fields packed as zero. CMD messages carry a utf-8 JSON payload. Times are packed as seconds,
+ISO strings are converted to seconds since the unix epoch.
+
+Provides:
+    - Message, DataMessage, AlignMessage, CmdMessage, GuideMessage
+    - send_message, recv_message
+    - send_messages, recv_messages
+
 """
+import json
+import struct
+from datetime import datetime, timezone
+
+message_types = ('DATA', 'ALIGN', 'CMD', 'GUIDE')
+message_formats = ('json', 'binary')
+
+WIRE_VERSION = 3
+WIRE_HEADER = struct.Struct('<BBH')
+
+DATA_FIELDS = (('time', 'd'), ('phi_cnt', 'q'), ('theta_cnt', 'q'), ('phi_raw', 'd'), ('theta_raw', 'd'),
+               ('phi', 'd'), ('theta', 'd'), ('azi', 'd'), ('alt', 'd'), ('ra', 'd'), ('dec', 'd'),
+               ('phi_rate', 'd'), ('theta_rate', 'd'), ('utc', '?'))
+ALIGN_FIELDS = (('time', 'd'), ('ra', 'd'), ('dec', 'd'), ('azi', 'd'), ('alt', 'd'), 
+                ('phi', 'd'), ('theta', 'd'))
+GUIDE_FIELDS = (('time', 'd'), ('phi', 'd'), ('theta', 'd'), ('d_phi', 'd'), ('d_theta', 'd'), ('sep', 'd'))
+
+
+def wire_time(value):
+    """
+    Convert a message time into seconds for the binary format.
+
+    :param value: time as a number, a numeric string or an ISO formatted utc string
+    :type value: float or str
+
+    :return: seconds (since the unix epoch for ISO strings)
+    :rtype: float
+    """
+    if not isinstance(value, str):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        utc = datetime.fromisoformat(value)
+        if utc.tzinfo is None:
+            utc = utc.replace(tzinfo=timezone.utc)
+        return utc.timestamp()
+
+
+def send_message(socket, msg, fmt='json'):
+    """
+    Send a message on a :mod:`zmq` socket.
+
+    :param socket: the socket
+    :type socket: :obj:`zmq.Socket`
+    :param msg: the message
+    :type msg: :obj:`Message`
+    :param fmt: the wire format, 'json' or 'binary'
+    :type fmt: str
+    """
+    if fmt == 'binary':
+        socket.send(msg.to_bytes())
+    else:
+        socket.send_json(msg.to_json())
+
+
+def send_messages(socket, msgs, fmt='json'):
+    """
+    Send a batch of messages on a :mod:`zmq` socket, in one call, as the frames of
+    one multipart message. A receiver reading one frame at a time with
+    :func:`recv_message` gets them one by one.
+
+    :param socket: the socket
+    :type socket: :obj:`zmq.Socket`
+    :param msgs: the messages
+    :type msgs: list(:obj:`Message`)
+    :param fmt: the wire format, 'json' or 'binary'
+    :type fmt: str
+    """
+    if fmt == 'binary':
+        socket.send_multipart([msg.to_bytes() for msg in msgs])
+    else:
+        socket.send_multipart([json.dumps(msg.to_json()).encode('utf-8') for msg in msgs])
+
+
+def recv_messages(socket):
+    """
+    Receive all the messages of a multipart message from a :mod:`zmq` socket, see
+    :func:`send_messages`.
+
+    :param socket: the socket
+    :type socket: :obj:`zmq.Socket`
+
+    :return: the messages
+    :rtype: list(:obj:`Message`)
+    """
+    return [Message.from_wire(frame) for frame in socket.recv_multipart()]
+
+
+def recv_message(socket):
+    """
+    Receive a message from a :mod:`zmq` socket. The wire format is detected from
+    the first byte, so a receiver understands any sender.
+
+    :param socket: the socket
+    :type socket: :obj:`zmq.Socket`
 
-message_types = ('DATA', 'ALIGN', 'CMD')
+    :return: the message
+    :rtype: :obj:`Message`
+    """
+    return Message.from_wire(socket.recv())
 
 
 class Message(object):
@@ -13,6 +137,10 @@ class Message(object):
     Base class for messages.
     """
 
+    code = 0
+    fields = ()
+    layout = WIRE_HEADER
+
     def __init__(self, *args, **kwargs):
         self.type = kwargs['type']
         self.msg = {'type': self.type, }
@@ -20,6 +148,31 @@ class Message(object):
     def __repr__(self):
         return str(self.msg)
 
+    def to_bytes(self):
+        """
+        Encode the message in the binary wire format.
+
+        :return: encoded message
+        :rtype: bytes
+        """
+        mask = 0
+        values = []
+        for i, (name, kind) in enumerate(self.fields):
+            value = getattr(self, name)
+            if value is None:
+                values.append(0)
+                continue
+            mask |= 1 << i
+            if name == 'time':
+                values.append(wire_time(value))
+            elif kind == 'q':
+                values.append(int(value))
+            elif kind == '?':
+                values.append(bool(value))
+            else:
+                values.append(float(value))
+        return self.layout.pack(WIRE_VERSION, self.code, mask, *values)
+
     @classmethod
     def from_json(cls, data):
         if data['type'] == 'DATA':
@@ -28,12 +181,55 @@ class Message(object):
             return AlignMessage(**data)
         elif data['type'] == 'CMD':
             return CmdMessage(**data)
+        elif data['type'] == 'GUIDE':
+            return GuideMessage(**data)
         else:
             return None
 
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Decode a message in the binary wire format.
+
+        :param data: encoded message
+        :type data: bytes
+
+        :return: the message, None for an unknown type
+        :rtype: :obj:`Message` or None
+        """
+        version, code, mask = WIRE_HEADER.unpack_from(data)
+        if version != WIRE_VERSION:
+            raise ValueError('unsupported wire format version %s' % version)
+        if code == CmdMessage.code:
+            return CmdMessage(**json.loads(bytes(data[WIRE_HEADER.size:])))
+        for msg_cls in (DataMessage, AlignMessage, GuideMessage):
+            if code == msg_cls.code:
+                values = msg_cls.layout.unpack(data)[3:]
+                kwargs = {name: value for i, ((name, _), value) in enumerate(zip(msg_cls.fields, values))
+                          if mask & (1 << i)}
+                return msg_cls(**kwargs)
+        return None
+
+    @classmethod
+    def from_wire(cls, data):
+        """
+        Decode a message in either wire format.
+
+        :param data: encoded message, JSON or binary
+        :type data: bytes
+
+        :return: the message
+        :rtype: :obj:`Message` or None
+        """
+        if data[:1] == b'{':
+            return cls.from_json(json.loads(data))
+        return cls.from_bytes(data)
+
 
 class CmdMessage(Message):
 
+    code = 3
+
     def __init__(self, *args, **kwargs):
         super().__init__(type='CMD')
 
@@ -47,41 +243,56 @@ class CmdMessage(Message):
         self.msg['opt'] = self.opt
         return self.msg
 
+    def to_bytes(self):
+        payload = json.dumps({'cmd': self.cmd, 'opt': self.opt}).encode('utf-8')
+        return WIRE_HEADER.pack(WIRE_VERSION, self.code, 0) + payload
+
 
 class DataMessage(Message):
     """
-    Unified key names for the various coordinate systems.
+    Unified key names for the various coordinate systems. utc is True if time is an
+    acquisition time in seconds since the unix epoch, rather than an Arduino time stamp.
     """
 
+    code = 1
+    fields = DATA_FIELDS
+    layout = struct.Struct(WIRE_HEADER.format + ''.join(kind for _, kind in DATA_FIELDS))
+
     def __init__(self, *args, **kwargs):
         super().__init__(type='DATA')
         
-        self.time      = kwargs['time']      if 'time'      in kwargs else None
-        self.phi_cnt   = kwargs['phi_cnt']   if 'phi_cnt'   in kwargs else None
-        self.theta_cnt = kwargs['theta_cnt'] if 'theta_cnt' in kwargs else None
-        self.phi_raw   = kwargs['phi_raw']   if 'phi_raw'   in kwargs else None
-        self.theta_raw = kwargs['theta_raw'] if 'theta_raw' in kwargs else None
-        self.phi       = kwargs['phi']       if 'phi'       in kwargs else None
-        self.theta     = kwargs['theta']     if 'theta'     in kwargs else None
-        self.azi       = kwargs['azi']       if 'azi'       in kwargs else None
-        self.alt       = kwargs['alt']       if 'alt'       in kwargs else None
-        self.ra        = kwargs['ra']        if 'ra'        in kwargs else None
-        self.dec       = kwargs['dec']       if 'dec'       in kwargs else None
+        self.time       = kwargs['time']       if 'time'       in kwargs else None
+        self.phi_cnt    = kwargs['phi_cnt']    if 'phi_cnt'    in kwargs else None
+        self.theta_cnt  = kwargs['theta_cnt']  if 'theta_cnt'  in kwargs else None
+        self.phi_raw    = kwargs['phi_raw']    if 'phi_raw'    in kwargs else None
+        self.theta_raw  = kwargs['theta_raw']  if 'theta_raw'  in kwargs else None
+        self.phi        = kwargs['phi']        if 'phi'        in kwargs else None
+        self.theta      = kwargs['theta']      if 'theta'      in kwargs else None
+        self.azi        = kwargs['azi']        if 'azi'        in kwargs else None
+        self.alt        = kwargs['alt']        if 'alt'        in kwargs else None
+        self.ra         = kwargs['ra']         if 'ra'         in kwargs else None
+        self.dec        = kwargs['dec']        if 'dec'        in kwargs else None
+        self.phi_rate   = kwargs['phi_rate']   if 'phi_rate'   in kwargs else None
+        self.theta_rate = kwargs['theta_rate'] if 'theta_rate' in kwargs else None
+        self.utc        = kwargs['utc']        if 'utc'        in kwargs else None
 
         self.msg = self.to_json()
         
     def to_json(self):
-        self.msg['time']      = self.time
-        self.msg['phi_cnt']   = self.phi_cnt
-        self.msg['theta_cnt'] = self.theta_cnt
-        self.msg['phi_raw']   = self.phi_raw
-        self.msg['theta_raw'] = self.theta_raw
-        self.msg['phi']       = self.phi
-        self.msg['theta']     = self.theta
-        self.msg['azi']       = self.azi
-        self.msg['alt']       = self.alt
-        self.msg['ra']        = self.ra
-        self.msg['dec']       = self.dec
+        self.msg['time']       = self.time
+        self.msg['phi_cnt']    = self.phi_cnt
+        self.msg['theta_cnt']  = self.theta_cnt
+        self.msg['phi_raw']    = self.phi_raw
+        self.msg['theta_raw']  = self.theta_raw
+        self.msg['phi']        = self.phi
+        self.msg['theta']      = self.theta
+        self.msg['azi']        = self.azi
+        self.msg['alt']        = self.alt
+        self.msg['ra']         = self.ra
+        self.msg['dec']        = self.dec
+        self.msg['phi_rate']   = self.phi_rate
+        self.msg['theta_rate'] = self.theta_rate
+        self.msg['utc']        = self.utc
         return self.msg
 
 
@@ -90,15 +301,19 @@ class AlignMessage(Message):
     Unified key names for the various coordinate systems.
     """
 
+    code = 2
+    fields = ALIGN_FIELDS
+    layout = struct.Struct(WIRE_HEADER.format + ''.join(kind for _, kind in ALIGN_FIELDS))
+
     def __init__(self, *args, **kwargs):
         super().__init__(type='ALIGN')
         
-        self.time  = kwargs['time']  if 'time'  in kwargs else None
-        self.ra    = kwargs['ra']    if 'ra'    in kwargs else None
-        self.dec   = kwargs['dec']   if 'dec'   in kwargs else None
-        self.azi   = kwargs['azi']   if 'azi'   in kwargs else None
-        self.alt   = kwargs['alt']   if 'alt'   in kwargs else None
-        self.phi   = kwargs['phi']   if 'phi'   in kwargs else None
+        self.time  = kwargs['time'] if 'time' in kwargs else None
+        self.ra    = kwargs['ra']   if 'ra'   in kwargs else None
+        self.dec   = kwargs['dec']  if 'dec'  in kwargs else None
+        self.azi   = kwargs['azi']  if 'azi'  in kwargs else None
+        self.alt   = kwargs['alt']  if 'alt'  in kwargs else None
+        self.phi   = kwargs['phi']  if 'phi'  in kwargs else None
         self.theta = kwargs['theta'] if 'theta' in kwargs else None
 
         self.msg = self.to_json()
@@ -112,3 +327,35 @@ class AlignMessage(Message):
         self.msg['phi']   = self.phi
         self.msg['theta'] = self.theta
         return self.msg
+
+
+class GuideMessage(Message):
+    """
+    Push-to guidance: the telescope attitude and what remains to the goto target,
+    in degrees. d_phi is wrapped to [-180:180].
+    """
+
+    code = 4
+    fields = GUIDE_FIELDS
+    layout = struct.Struct(WIRE_HEADER.format + ''.join(kind for _, kind in GUIDE_FIELDS))
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(type='GUIDE')
+
+        self.time    = kwargs['time']   if 'time'   in kwargs else None
+        self.phi     = kwargs['phi']    if 'phi'    in kwargs else None
+        self.theta   = kwargs['theta']  if 'theta'  in kwargs else None
+        self.d_phi   = kwargs['d_phi']  if 'd_phi'  in kwargs else None
+        self.d_theta = kwargs['d_theta'] if 'd_theta' in kwargs else None
+        self.sep     = kwargs['sep']    if 'sep'    in kwargs else None
+
+        self.msg = self.to_json()
+
+    def to_json(self):
+        self.msg['time']    = self.time
+        self.msg['phi']     = self.phi
+        self.msg['theta']   = self.theta
+        self.msg['d_phi']   = self.d_phi
+        self.msg['d_theta'] = self.d_theta
+        self.msg['sep']     = self.sep
+        return self.msg
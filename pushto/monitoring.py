@@ -0,0 +1,312 @@
+#!/usr/bin/env python
+"""
+Monitoring of the pointing pipeline.
+
+Provides:
+    - Histogram
+    - Monitor
+    - MonitorHub
+    - format_snapshot
+
+
+The hot path of every component records the time spent in each of its stages into
+fixed-bucket histograms: recording a duration is a bisection in a constant list of
+bucket edges and an increment, there is no allocation. Every interval seconds the
+histograms are summarized into a snapshot and reset:
+
+    {'type': 'MONI', 'source': 'site', 'time': 1668701698.967, 'interval': 5.01,
+     'stages': {'equatorial': {'count': 50, 'rate': 9.98, 'p50_us': 56.2, 'p95_us': 89.1,
+                               'p99_us': 112.2, 'max_us': 130.5}, ...}}
+
+The monitors of all components publish their snapshots to a :class:`MonitorHub`
+over inproc, which forwards them to the monitoring PUB port. This requires the
+components and the hub to share the :mod:`zmq` context.
+
+Stages whose name starts with 'age' record the time elapsed since the acquisition of
+the sample when it reaches the component, the difference between two components is
+the latency of the zmq hop between them.
+
+"""
+import time
+import logging
+import threading
+from bisect import bisect_left
+#
+import zmq
+
+"Address of the hub input, the monitors of all components publish to it"
+MONI_HUB_ADDRESS = 'inproc://pushto-monitoring'
+
+"Bucket edges in seconds, 20 per decade from 1us to 10s (~12% resolution)"
+BUCKET_EDGES = tuple(1e-6*10**(i/20) for i in range(141))
+
+
+class Histogram(object):
+    """
+    Histogram of durations with fixed buckets.
+
+    :param edges: increasing upper edges of the buckets in seconds, optional
+    :type edges: tuple(float)
+
+    Durations above the last edge fall in an overflow bucket.
+    """
+
+    def __init__(self, edges=BUCKET_EDGES):
+        self.edges = edges
+        self.counts = None
+        self.count = None
+        self.total = None
+        self.max = None
+        self.reset()
+
+    def reset(self):
+        """
+        Clear the histogram.
+        """
+        self.counts = [0]*(len(self.edges) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        """
+        Add a duration.
+
+        :param seconds: the duration in seconds
+        :type seconds: float
+        """
+        self.counts[bisect_left(self.edges, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        """
+        Upper edge of the bucket containing the q-th percentile.
+
+        :param q: percentile in [0:100]
+        :type q: float
+
+        :return: the percentile in seconds, None if the histogram is empty
+        :rtype: float or None
+        """
+        if self.count == 0:
+            return None
+        rank = q/100*self.count
+        cumulative = 0
+        for i, c in enumerate(self.counts):
+            cumulative += c
+            if c and cumulative >= rank:
+                return min(self.edges[i], self.max) if i < len(self.edges) else self.max
+        return self.max
+
+    def summary(self, interval=None):
+        """
+        Summarize the histogram.
+
+        :param interval: time covered by the histogram in seconds, for the rate, optional
+        :type interval: float or None
+
+        :return: count, rate in Hz, p50, p95, p99 and max in microseconds
+        :rtype: dict
+        """
+        def us(seconds):
+            return None if seconds is None else round(1e6*seconds, 1)
+
+        return {'count': self.count,
+                'rate': round(self.count/interval, 2) if interval else None,
+                'p50_us': us(self.percentile(50)),
+                'p95_us': us(self.percentile(95)),
+                'p99_us': us(self.percentile(99)),
+                'max_us': us(self.max)}
+
+
+class Monitor(object):
+    """
+    Per stage histograms of a component, published periodically.
+
+    :param source: name of the component
+    :type source: str
+    :param pub_address: address to publish the snapshots to, optional (None to not publish)
+    :type pub_address: str or None
+    :param ctx: the :mod:`zmq` context, optional
+    :type ctx: :obj:`zmq.Context` or None
+    :param interval: publication interval in seconds, optional
+    :type interval: float
+
+    >>> monitor = Monitor('site', MONI_HUB_ADDRESS, ctx)
+    >>> t0 = time.perf_counter()
+    >>> monitor.record('equatorial', time.perf_counter() - t0)
+    >>> monitor.tick()
+
+    The snapshots are published from :meth:`tick`, which the component calls after each
+    sample, so nothing is published while no data is flowing.
+    """
+
+    def __init__(self, source, pub_address=None, ctx=None, interval=5.0):
+        self.source = source
+        self.interval = interval
+        self.stages = {}
+        self.start = time.time()
+
+        self.socket = None
+        if pub_address is not None:
+            ctx = ctx or zmq.Context.instance()
+            self.socket = ctx.socket(zmq.PUB)
+            self.socket.connect(pub_address)
+
+    def record(self, stage, seconds):
+        """
+        Add a duration to the histogram of a stage.
+
+        :param stage: name of the stage
+        :type stage: str
+        :param seconds: the duration in seconds
+        :type seconds: float
+        """
+        hist = self.stages.get(stage)
+        if hist is None:
+            hist = self.stages[stage] = Histogram()
+        hist.record(seconds)
+
+    def snapshot(self, now=None):
+        """
+        Summarize and reset the histograms of all stages.
+
+        :param now: current time in seconds since epoch, optional
+        :type now: float or None
+
+        :return: the snapshot
+        :rtype: dict
+        """
+        now = time.time() if now is None else now
+        interval = now - self.start
+        snapshot = {'type': 'MONI', 'source': self.source, 'time': now, 'interval': round(interval, 3),
+                    'stages': {name: hist.summary(interval) for name, hist in self.stages.items()}}
+        for hist in self.stages.values():
+            hist.reset()
+        self.start = now
+        return snapshot
+
+    def tick(self, now=None):
+        """
+        Publish a snapshot if the interval has elapsed.
+
+        :param now: current time in seconds since epoch, optional
+        :type now: float or None
+        """
+        now = time.time() if now is None else now
+        if now - self.start >= self.interval:
+            snapshot = self.snapshot(now)
+            if self.socket is not None:
+                self.socket.send_json(snapshot)
+
+    def close(self):
+        """
+        Close the PUB socket.
+        """
+        if self.socket is not None:
+            self.socket.close(linger=1)
+            self.socket = None
+
+    @classmethod
+    def setup(cls, cfg, source, ctx=None):
+        """
+        Convenience method for creating a Monitor object based on a Configuration object
+
+        :param cfg: the configuration object to use
+        :type cfg: :obj:`Configuration`
+        :param source: name of the component
+        :type source: str
+        :param ctx: the zmq context, shared with the :class:`MonitorHub`, optional
+        :type ctx: :obj:`zmq.Context` or None
+
+        :return: the monitor, None if monitoring is disabled
+        :rtype: :obj:`Monitor` or None
+        """
+        interval = cfg.get_moni_interval()
+        if not interval:
+            return None
+        return Monitor(source, MONI_HUB_ADDRESS, ctx, interval)
+
+
+class MonitorHub(threading.Thread):
+    """
+    Forwards the snapshots of all monitors to the monitoring PUB port.
+
+    :param pub_address: address to publish the snapshots on
+    :type pub_address: str
+    :param ctx: the :mod:`zmq` context, shared with the monitors
+    :type ctx: :obj:`zmq.Context`
+
+    The hub runs until the context is terminated or destroyed.
+
+    >>> hub = MonitorHub('tcp://127.0.0.1:10015', ctx)
+    >>> hub.start()
+    """
+
+    def __init__(self, pub_address, ctx):
+        super().__init__(daemon=True, name='monitoring')
+        self.pub_address = pub_address
+        self.ctx = ctx
+
+        self.xsub = self.ctx.socket(zmq.XSUB)
+        self.xsub.bind(MONI_HUB_ADDRESS)
+        self.xpub = self.ctx.socket(zmq.XPUB)
+        self.xpub.bind(self.pub_address)
+
+    def run(self):
+        try:
+            zmq.proxy(self.xsub, self.xpub)
+        except zmq.ZMQError:
+            "the context was terminated, or destroyed with the sockets"
+            pass
+        finally:
+            self.xsub.close(linger=0)
+            self.xpub.close(linger=0)
+            logging.debug('monitoring hub stopped')
+
+    @classmethod
+    def setup(cls, cfg, ctx):
+        """
+        Convenience method for creating a MonitorHub object based on a Configuration object
+
+        :param cfg: the configuration object to use
+        :type cfg: :obj:`Configuration`
+        :param ctx: the zmq context, shared with the monitors
+        :type ctx: :obj:`zmq.Context`
+
+        :return: the hub, None if monitoring is disabled
+        :rtype: :obj:`MonitorHub` or None
+        """
+        if not cfg.get_moni_interval():
+            return None
+        pub_address = "tcp://%s:%s" % (cfg.get_host_ip(), cfg.get_moni_port())
+        return MonitorHub(pub_address, ctx)
+
+
+def format_snapshot(snapshot):
+    """
+    Render a snapshot as a table.
+
+    :param snapshot: the snapshot
+    :type snapshot: dict
+
+    :return: the table
+    :rtype: str
+    """
+    lines = ['[%s] %s, %.1f s' % (snapshot['source'],
+                                  time.strftime('%H:%M:%S', time.gmtime(snapshot['time'])),
+                                  snapshot['interval']),
+             '  %-16s %8s %8s %10s %10s %10s %10s' % ('stage', 'count', 'rate', 'p50 [us]', 'p95 [us]',
+                                                      'p99 [us]', 'max [us]')]
+
+    def fmt(value):
+        return '-' if value is None else '%.1f' % value
+
+    for name, s in snapshot['stages'].items():
+        lines.append('  %-16s %8d %8s %10s %10s %10s %10s' % (name, s['count'], fmt(s['rate']), fmt(s['p50_us']),
+                                                              fmt(s['p95_us']), fmt(s['p99_us']),
+                                                              fmt(s['max_us'])))
+    return '\n'.join(lines)
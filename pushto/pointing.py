@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+"""
+Fitting of the pointing model.
+
+Provides:
+    - PointingFitter
+
+
+A sync pair is the raw telescope attitude (phi, theta), read from the encoders while
+the telescope points at a known target, and the attitude the telescope should have
+had, the horizontal coordinates of the target in the telescope frame. The
+corrections of :class:`pushto.telescope.PointingModel` are linear in its 8 terms:
+
+    da = A_a(phi, theta) . x        de = A_e(phi, theta) . x
+
+with A_a and A_e given analytically by :meth:`pushto.telescope.PointingModel.partials`,
+so the terms x minimizing the residuals on the sky,
+
+    chi2 = sum w*((cos(theta)*(da - da_obs))^2 + (de - de_obs)^2)
+
+are the solution of the 8x8 normal equations N x = r. N and r are accumulated as the
+pairs are added, so a refit costs the same with ten or ten thousand pairs.
+
+"""
+import logging
+#
+import numpy as np
+#
+from pushto.telescope import PointingModel, PM_TERMS
+
+
+class PointingFitter(object):
+    """
+    Least-squares fit of the pointing model terms to sync pairs.
+
+    :param terms: the terms to fit, the others are kept at zero, optional (default is all of them)
+    :type terms: tuple(str)
+
+    >>> fitter = PointingFitter()
+    >>> fitter.add(phi_raw, theta_raw, phi, theta)
+    >>> params = fitter.fit()
+    >>> fitter.save(cfg)
+
+    After a fit, the terms are in params (in arcsec, in the order of :data:`pushto.telescope.PM_TERMS`),
+    their covariance matrix in cov and the rms of the residuals on the sky in rms (arcsec).
+    """
+
+    def __init__(self, terms=PM_TERMS):
+        self.terms = tuple(terms)
+        self.columns = [PM_TERMS.index(t) for t in self.terms]
+
+        self.N = None
+        self.r = None
+        self.bb = None
+        self.n = None
+        self.pairs = None
+        self.params = None
+        self.cov = None
+        self.rms = None
+        self.reset()
+
+    def reset(self):
+        """
+        Forget all pairs and the fit.
+        """
+        k = len(self.columns)
+        self.N = np.zeros((k, k))
+        self.r = np.zeros(k)
+        self.bb = 0.0
+        self.n = 0
+        self.pairs = []
+        self.params = [0.0]*len(PM_TERMS)
+        self.cov = None
+        self.rms = None
+
+    def design(self, phi, theta, azi, alt):
+        """
+        Weighted design matrix and observed corrections of sync pairs.
+
+        :param phi: raw azimuthal angles in degrees
+        :type phi: :obj:`np.ndarray`
+        :param theta: raw altitude angles in degrees
+        :type theta: :obj:`np.ndarray`
+        :param azi: target azimuthal angles in degrees
+        :type azi: :obj:`np.ndarray`
+        :param alt: target altitude angles in degrees
+        :type alt: :obj:`np.ndarray`
+
+        :return: design matrix of shape (2N, k) and observations of shape (2N,), in arcsec
+        :rtype: list(:obj:`np.ndarray`)
+        """
+        pa, pe = PointingModel().partials(phi, theta)
+        cos_t = np.cos(np.radians(theta))
+
+        "observed corrections, with the azimuth wrapped to [-180:180]"
+        da = ((azi - phi + 180) % 360 - 180)*3600
+        de = (alt - theta)*3600
+
+        A = np.concatenate((pa[:, self.columns]*cos_t[:, None], pe[:, self.columns]))
+        b = np.concatenate((da*cos_t, de))
+        return A, b
+
+    def add(self, phi, theta, azi, alt, weight=1):
+        """
+        Add sync pairs.
+
+        :param phi: raw azimuthal angle in degrees
+        :type phi: float or :obj:`np.ndarray`
+        :param theta: raw altitude angle in degrees
+        :type theta: float or :obj:`np.ndarray`
+        :param azi: target azimuthal angle in the telescope frame in degrees
+        :type azi: float or :obj:`np.ndarray`
+        :param alt: target altitude angle in the telescope frame in degrees
+        :type alt: float or :obj:`np.ndarray`
+        :param weight: weight of the pairs, optional
+        :type weight: float or :obj:`np.ndarray`
+        """
+        phi, theta, azi, alt, weight = (np.atleast_1d(np.asarray(x, dtype=float))
+                                        for x in np.broadcast_arrays(phi, theta, azi, alt, weight))
+        A, b = self.design(phi, theta, azi, alt)
+        w = np.concatenate((weight, weight))
+
+        self.N += A.T @ (A*w[:, None])
+        self.r += A.T @ (w*b)
+        self.bb += float(np.sum(w*b*b))
+        self.n += len(phi)
+        self.pairs.extend(zip(phi.tolist(), theta.tolist(), azi.tolist(), alt.tolist(), weight.tolist()))
+
+    def fit(self):
+        """
+        Solve for the terms.
+
+        Degenerate combinations of terms (e.g. with too few pairs, or pairs at a single
+        altitude) get the minimum-norm solution.
+
+        :return: the terms in arcsec, in the order of :data:`pushto.telescope.PM_TERMS`
+        :rtype: list(float)
+        """
+        if self.n == 0:
+            return self.params
+
+        N_inv = np.linalg.pinv(self.N)
+        x = N_inv @ self.r
+        chi2 = max(self.bb - float(x @ self.r), 0.0)
+        dof = 2*self.n - np.linalg.matrix_rank(self.N)
+
+        params = [0.0]*len(PM_TERMS)
+        for i, x_i in zip(self.columns, x):
+            params[i] = float(x_i)
+        self.params = params
+        self.cov = N_inv*(chi2/dof if dof > 0 else 0.0)
+        self.rms = float(np.sqrt(chi2/self.n))
+        logging.debug('pointing model fit to %d pairs: rms=%.1f arcsec %s', self.n, self.rms,
+                      dict(zip(PM_TERMS, np.round(params, 1))))
+        return self.params
+
+    def errors(self):
+        """
+        Standard errors of the fitted terms.
+
+        :return: errors in arcsec, keyed by term
+        :rtype: dict
+        """
+        if self.cov is None:
+            return {}
+        return dict(zip(self.terms, np.sqrt(np.diag(self.cov)).tolist()))
+
+    def residuals(self, params=None):
+        """
+        Residuals on the sky of the pairs.
+
+        :param params: the terms, optional (default is the fitted terms)
+        :type params: list(float) or None
+
+        :return: azimuthal residuals (scaled by cos(theta)) and altitude residuals, in arcsec
+        :rtype: list(:obj:`np.ndarray`)
+        """
+        params = self.params if params is None else params
+        phi, theta, azi, alt, _ = (np.array(x) for x in zip(*self.pairs))
+        A, b = self.design(phi, theta, azi, alt)
+        res = b - A @ np.array([params[i] for i in self.columns])
+        return res[:len(phi)], res[len(phi):]
+
+    def model(self):
+        """
+        The fitted pointing model.
+
+        :return: the pointing model
+        :rtype: :obj:`pushto.telescope.PointingModel`
+        """
+        return PointingModel(*self.params)
+
+    def save(self, cfg):
+        """
+        Write the fitted terms to the configuration.
+
+        :param cfg: the configuration
+        :type cfg: :obj:`pushto.config.Configuration`
+        """
+        cfg.set_pointing_model(self.params)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+"""
+Latency compensation of the positions sent to Stellarium.
+
+Provides:
+    - Predictor
+
+
+By the time a position reaches Stellarium it is already old: the sample period,
+the zmq hops, the transformations and the decimation all add up to tens or hundreds
+of milliseconds. The predictor keeps the recent samples (time, ra, dec), estimates
+the angular velocity of the telescope on the sky, and gives the position at any time:
+
+    - between two samples, interpolated
+    - after the last sample, extrapolated with the angular velocity, by at most the
+      horizon (beyond, the position is held)
+
+A telescope at rest on the alt-az mount drifts on the sky at the sidereal rate at
+most, and its samples jitter by the resolution of the encoders. Below the deadband
+speed the position is not extrapolated, so the jitter is not amplified.
+
+The samples are kept as unit vectors, so there is no wrap of the right ascension
+and no singularity at the poles. The velocity is the least squares slope of the
+vectors over the window (1s by default), done with :mod:`math` on a few samples: a
+few microseconds per position.
+
+"""
+import math
+import time
+from collections import deque
+
+
+class Predictor(object):
+    """
+    Interpolates and extrapolates the position of the telescope.
+
+    :param horizon: max extrapolation in seconds after the last sample, optional
+    :type horizon: float
+    :param deadband: angular speed in deg/s below which the position is not extrapolated, optional
+    :type deadband: float
+    :param window: time span in seconds of the samples used for the velocity, optional
+    :type window: float
+    :param delay: the positions are given at this many seconds before the send time,
+                  e.g. to interpolate between the samples rather than extrapolate, optional
+    :type delay: float
+    :param now: the host clock, optional
+    :type now: callable
+
+    >>> predictor = Predictor(horizon=0.5, deadband=0.01)
+    >>> predictor.add(msg.time, msg.ra, msg.dec)
+    >>> utc, ra, dec = predictor.position()
+    """
+
+    def __init__(self, horizon=0.25, deadband=0.01, window=1.0, delay=0.0, now=time.time):
+        self.horizon = horizon
+        self.deadband = math.radians(deadband)
+        self.window = window
+        self.delay = delay
+        self.now = now
+
+        self.samples = deque()
+        self.velocity = (0.0, 0.0, 0.0)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def clear(self):
+        """
+        Forget the samples.
+        """
+        self.samples.clear()
+        self.velocity = (0.0, 0.0, 0.0)
+
+    def add(self, utc, ra, dec):
+        """
+        Add a sample, and update the velocity.
+
+        :param utc: time in seconds since epoch
+        :type utc: float
+        :param ra: right ascension in hours
+        :type ra: float
+        :param dec: declination in degrees
+        :type dec: float
+        """
+        samples = self.samples
+        if samples and utc <= samples[-1][0]:
+            "out of order, or a restart of the clock"
+            samples.clear()
+        a = math.radians(15*ra)
+        d = math.radians(dec)
+        cos_d = math.cos(d)
+        samples.append((utc, cos_d*math.cos(a), cos_d*math.sin(a), math.sin(d)))
+        while utc - samples[0][0] > self.window:
+            samples.popleft()
+
+        "least squares slope of every component of the vectors"
+        n = len(samples)
+        if n < 2:
+            self.velocity = (0.0, 0.0, 0.0)
+            return
+        t_mean = sum(s[0] for s in samples)/n
+        stt = sum((s[0] - t_mean)**2 for s in samples)
+        self.velocity = tuple(sum((s[0] - t_mean)*s[i] for s in samples)/stt for i in (1, 2, 3))
+
+    @property
+    def speed(self):
+        """
+        Angular speed of the telescope on the sky in deg/s.
+        """
+        vx, vy, vz = self.velocity
+        return math.degrees(math.sqrt(vx*vx + vy*vy + vz*vz))
+
+    def position(self, utc=None):
+        """
+        Position of the telescope at a time.
+
+        :param utc: time in seconds since epoch, optional (default is now, less the delay)
+        :type utc: float or None
+
+        :return: the time, right ascension in hours and declination in degrees, or None
+                 without samples
+        :rtype: tuple(float) or None
+        """
+        samples = self.samples
+        if not samples:
+            return None
+        if utc is None:
+            utc = self.now() - self.delay
+        last = samples[-1]
+        dt = utc - last[0]
+        if dt >= 0:
+            "extrapolate, unless at rest"
+            vx, vy, vz = self.velocity
+            if dt > self.horizon:
+                dt = self.horizon
+            if vx*vx + vy*vy + vz*vz < self.deadband*self.deadband:
+                dt = 0.0
+            x, y, z = last[1] + vx*dt, last[2] + vy*dt, last[3] + vz*dt
+        else:
+            "interpolate between the samples around the time, or hold the first one"
+            i = len(samples) - 1
+            while i > 0 and samples[i - 1][0] > utc:
+                i -= 1
+            if i == 0:
+                x, y, z = samples[0][1:]
+            else:
+                t0, x0, y0, z0 = samples[i - 1]
+                t1, x1, y1, z1 = samples[i]
+                f = (utc - t0)/(t1 - t0)
+                x, y, z = x0 + f*(x1 - x0), y0 + f*(y1 - y0), z0 + f*(z1 - z0)
+
+        norm = math.sqrt(x*x + y*y + z*z)
+        ra = math.degrees(math.atan2(y, x))/15 % 24
+        dec = math.degrees(math.asin(max(-1.0, min(1.0, z/norm))))
+        return utc, ra, dec
+
+    def stale(self):
+        """
+        True without samples, or if the last one is older than the window.
+        """
+        return not self.samples or self.now() - self.delay - self.samples[-1][0] > self.window
+
+    def handle(self, msg):
+        """
+        Add the sample of a transformed DATA message, and give the position now.
+
+        :param msg: data message with time, ra and dec
+        :type msg: :obj:`pushto.messages.DataMessage`
+
+        :return: the time, right ascension and declination, see :meth:`position`
+        :rtype: tuple(float)
+        """
+        if not msg.utc:
+            "no acquisition time, nothing to predict from"
+            return msg.time, msg.ra, msg.dec
+        self.add(msg.time, msg.ra, msg.dec)
+        return self.position()
+
+    @classmethod
+    def setup(cls, cfg, now=time.time):
+        """
+        Convenience method for creating a Predictor object based on a Configuration object
+
+        :param cfg: the configuration object to use
+        :type cfg: :obj:`Configuration`
+        :param now: the host clock, optional
+        :type now: callable
+
+        :return: the predictor, None if the positions are sent as they are
+        :rtype: :obj:`Predictor` or None
+        """
+        horizon = cfg.get_stc_horizon()
+        delay = cfg.get_stc_delay()
+        if not (horizon or delay or cfg.get_stc_rate()):
+            return None
+        return Predictor(horizon, cfg.get_stc_deadband(), delay=delay, now=now)
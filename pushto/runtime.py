@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+"""
+Single event loop runtime of the pointing pipeline.
+
+Provides:
+    - Pipeline
+    - AsyncRuntime
+
+
+The threaded runtime is made of three threads, the serial reader of the
+:class:`pushto.telescope.Telescope`, the :class:`pushto.site.Site` and the
+:class:`pushto.stellarium.StellariumTC`, passing messages over :mod:`zmq` sockets.
+Every sample costs two socket round trips and wakes up every thread in turn.
+
+The asyncio runtime runs the same stages in a single :mod:`asyncio` event loop:
+
+    - the serial port is read when its file descriptor is readable
+    - every complete line goes through the encoders, the pointing model, the
+      alignment and the equatorial transformation with direct calls
+    - the position is written to Stellarium, served with :func:`asyncio.start_server`
+
+:mod:`zmq` is only used where other processes listen: the pointing data of the
+alignment (pd_ta) and the guidance (gd) are published, and the monitoring snapshots
+are published to the :class:`pushto.monitoring.MonitorHub` as usual. These are plain
+PUB sockets: a PUB send never blocks (messages beyond the high water mark are
+dropped), so it is done in place rather than scheduled on the loop.
+
+In library mode there is no runtime at all: :class:`Pipeline` chains the stages
+with direct calls, without sockets, threads or serialization, for programs that
+read the encoders themselves.
+
+"""
+import asyncio
+import logging
+import threading
+#
+import zmq
+#
+from pushto.telescope import Telescope, Encoders, PointingModel
+from pushto.site import Site, Location
+from pushto.stellarium import AsyncStellariumTC
+from pushto.alignment import Aligner
+from pushto.pointing import PointingFitter
+from pushto.smoothing import AttitudeFilter
+from pushto.messages import DataMessage, AlignMessage, send_messages
+
+"Runtimes of the pointing pipeline"
+RUNTIMES = ('threads', 'asyncio')
+
+
+class Pipeline(object):
+    """
+    Library mode: the stages of the pointing pipeline chained by direct calls.
+
+    :param enc: the encoders
+    :type enc: :obj:`pushto.telescope.Encoders`
+    :param pm: the pointing model
+    :type pm: :obj:`pushto.telescope.PointingModel`
+    :param site: the site, driven directly (it is neither connected nor started)
+    :type site: :obj:`pushto.site.Site`
+    :param smoother: smooths the encoder counts, optional
+    :type smoother: :obj:`pushto.smoothing.AttitudeFilter` or None
+
+    >>> pipeline = Pipeline.setup(cfg)
+    >>> msg = pipeline.process((1200, 800), time.time())
+    >>> print(msg.ra, msg.dec)
+    >>> pd = pipeline.sync(ra, dec, time.time())
+    """
+
+    def __init__(self, enc, pm, site, smoother=None):
+        self.enc = enc
+        self.pm = pm
+        self.site = site
+        self.smoother = smoother
+
+    def process(self, counts, t=None):
+        """
+        Process a sample of the encoders.
+
+        :param counts: azimuthal and polar encoder counts
+        :type counts: tuple(int)
+        :param t: acquisition time in seconds since epoch, optional (default is now)
+        :type t: float or None
+
+        :return: the sample, with the raw and corrected telescope attitudes, and the
+                 horizontal and equatorial coordinates
+        :rtype: :obj:`pushto.messages.DataMessage`
+        """
+        phi_cnt, theta_cnt = counts
+        phi_rate = theta_rate = None
+        if self.smoother is None:
+            phi_raw, theta_raw = self.enc.convert(phi_cnt, theta_cnt)
+        else:
+            smoothed = self.smoother.update(self.site.now() if t is None else float(t), phi_cnt, theta_cnt)
+            phi_raw, theta_raw = self.enc.convert(smoothed[0], smoothed[1])
+            phi_rate, theta_rate = self.enc.convert_rate(smoothed[2], smoothed[3], smoothed[1])
+        phi, theta = self.pm.apply(phi_raw, theta_raw)
+        msg = DataMessage(time=None if t is None else float(t), phi_cnt=phi_cnt, theta_cnt=theta_cnt,
+                          phi_raw=phi_raw, theta_raw=theta_raw, phi=phi, theta=theta,
+                          phi_rate=phi_rate, theta_rate=theta_rate, utc=t is not None)
+        self.site.handle_data(msg)
+        return msg
+
+    def sync(self, ra, dec, t=None):
+        """
+        Align on a target, the telescope pointing at it since the last sample.
+
+        :param ra: right ascension of the target in hours
+        :type ra: float
+        :param dec: declination of the target in degrees
+        :type dec: float
+        :param t: time in seconds since epoch, optional (default is now)
+        :type t: float or None
+
+        :return: the pointing data, see :meth:`pushto.site.Site.handle_align`
+        :rtype: dict or None
+        """
+        t = self.site.now() if t is None else float(t)
+        return self.site.handle_align(AlignMessage(time=t, ra=ra, dec=dec))
+
+    @classmethod
+    def setup(cls, cfg):
+        """
+        Convenience method for creating a Pipeline object based on a Configuration object
+
+        :param cfg: the configuration object to use
+        :type cfg: :obj:`Configuration`
+
+        :return: the pipeline
+        :rtype: :obj:`Pipeline`
+        """
+        enc = Encoders()
+        enc.config(cfg)
+        pm = PointingModel()
+        pm.config(cfg)
+        aligner = Aligner(window=cfg.get_align_window() or None, forget=cfg.get_align_forget())
+        "every sample is transformed, and there are no sockets"
+        site = Site(None, None, None, None, Location.setup(cfg), aligner=aligner, decimation=1,
+                    fitter=PointingFitter())
+        return Pipeline(enc, pm, site, AttitudeFilter.setup(cfg))
+
+
+class AsyncRuntime(object):
+    """
+    Runs the Telescope, the Site and the Stellarium TC in one :mod:`asyncio` event loop.
+
+    :param telescope: the telescope, its serial port is read by the loop
+    :type telescope: :obj:`pushto.telescope.Telescope`
+    :param site: the site, driven directly
+    :type site: :obj:`pushto.site.Site`
+    :param stel: the Stellarium TC
+    :type stel: :obj:`pushto.stellarium.AsyncStellariumTC`
+    :param ctx: the :mod:`zmq` context, optional
+    :type ctx: :obj:`zmq.Context` or None
+
+    >>> runtime = AsyncRuntime.setup(cfg, ctx)
+    >>> runtime.start()
+    >>> runtime.close()
+
+    The loop is run by a thread with :meth:`start`, or by the caller with:
+
+    >>> asyncio.run(runtime.serve())
+    """
+
+    def __init__(self, telescope, site, stel, ctx=None):
+        self.telescope = telescope
+        self.site = site
+        self.stel = stel
+        self.stel.on_goto = self.on_goto
+        self.ctx = ctx or zmq.Context.instance()
+
+        self.pd_ta_socket = None
+        self.gd_socket = None
+        self.loop = None
+        self.stopped = None
+        self.started = threading.Event()
+        self.thread = None
+        self.error = None
+
+    def on_data(self, msg):
+        """
+        Transform a DATA message from the telescope and send it to Stellarium.
+
+        :param msg: data message with phi and theta
+        :type msg: :obj:`pushto.messages.DataMessage`
+        """
+        if self.site.handle_data(msg) is not None:
+            self.stel.send(msg)
+        guide = self.site.guidance(msg)
+        if guide is not None and self.gd_socket is not None:
+            send_messages(self.gd_socket, [guide], self.site.gd_format)
+        if self.site.monitor is not None:
+            self.site.monitor.tick()
+
+    def on_goto(self, msg):
+        """
+        Align on the target of a 'Goto' from Stellarium and publish the pointing data,
+        or guide the telescope to it, depending on the goto mode of the site.
+
+        :param msg: alignment message
+        :type msg: :obj:`pushto.messages.AlignMessage`
+        """
+        logging.info("On goto: %s" % msg)
+        pd = self.site.handle_goto(msg)
+        if pd is not None:
+            self.pd_ta_socket.send_json(pd)
+
+    async def open(self):
+        """
+        Start serving Stellarium and reading the serial port.
+        """
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        self.pd_ta_socket = self.ctx.socket(zmq.PUB)
+        self.pd_ta_socket.bind(self.site.pd_ta_address)
+        if self.site.gd_address is not None:
+            self.gd_socket = self.ctx.socket(zmq.PUB)
+            self.gd_socket.bind(self.site.gd_address)
+        await self.stel.start()
+        self.telescope.start_async(self.on_data, self.loop)
+
+    async def aclose(self):
+        """
+        Stop reading the serial port, close the connections and sockets.
+        """
+        self.telescope.close()
+        await self.stel.close()
+        self.site.close()
+        self.pd_ta_socket.close(linger=1)
+        if self.gd_socket is not None:
+            self.gd_socket.close(linger=1)
+
+    async def serve(self):
+        """
+        Run the pipeline until :meth:`stop` is called.
+        """
+        try:
+            await self.open()
+        except Exception as e:
+            self.error = e
+            self.started.set()
+            raise
+        self.started.set()
+        await self.stopped.wait()
+        await self.aclose()
+
+    def stop(self):
+        """
+        Stop the pipeline, from any thread.
+        """
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set)
+
+    def run(self):
+        try:
+            asyncio.run(self.serve())
+        except Exception as e:
+            logging.error('asyncio runtime failed: %s' % e)
+
+    def start(self, timeout=10):
+        """
+        Run the event loop in a thread, and wait until the pipeline is started.
+
+        :param timeout: time in seconds to wait, optional
+        :type timeout: float
+        """
+        self.thread = threading.Thread(target=self.run, daemon=True, name='asyncio')
+        self.thread.start()
+        self.started.wait(timeout)
+        if self.error is not None:
+            raise self.error
+
+    def close(self, timeout=10):
+        """
+        Stop the pipeline and wait for the event loop to finish.
+
+        :param timeout: time in seconds to wait, optional
+        :type timeout: float
+        """
+        self.stop()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+    @classmethod
+    def setup(cls, cfg, ctx=None):
+        """
+        Convenience method for creating an AsyncRuntime object based on a Configuration object
+
+        :param cfg: the configuration object to use
+        :type cfg: :obj:`Configuration`
+        :param ctx: the zmq context, optional
+        :type ctx: :obj:`zmq.Context` or None
+
+        :return: the runtime
+        :rtype: :obj:`AsyncRuntime`
+        """
+        telescope = Telescope.setup(cfg, ctx)
+        site = Site.setup(cfg, ctx)
+        stel = AsyncStellariumTC.setup(cfg, ctx=ctx)
+        return AsyncRuntime(telescope, site, stel, ctx)
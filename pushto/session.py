@@ -0,0 +1,379 @@
+#!/usr/bin/env python
+"""
+Capture and replay of raw serial sessions.
+
+Provides:
+    - SessionWriter
+    - SessionReader
+    - ReplayClock
+    - SessionReplay
+
+
+A session file records every raw line received from the Arduino together with its
+host arrival time. It is a 24B header followed by fixed-size 24B records, so that
+the records can be memory-mapped as a :mod:`numpy` structured array:
+
+    header:
+        - magic   (4B): b'PTSC'
+        - version (2B): 2 (1 had no gap records)
+        - size    (2B): record size, 24
+        - t0      (8B): arrival time of the first line in seconds since epoch
+        - unused  (8B)
+
+    record:
+        - dt        (4B): arrival time since the previous line in microseconds
+        - millis    (4B): delta of the Arduino time stamp
+        - phi       (4B): delta of the azimuthal count
+        - theta     (4B): delta of the polar count
+        - phi_err   (2B): delta of the azimuthal error count
+        - theta_err (2B): delta of the polar error count
+        - kind      (1B): 0 for a data line, 1 for a text line, 2 for a gap
+        - length    (1B): length of a text line
+        - unused    (2B)
+
+Data lines, '<msec> <azi_cnt> <alt_cnt> <azi_err> <alt_err>', are stored as deltas
+from the previous data line. Any other line (or a data line that would not be
+reproduced exactly) is stored as a text record followed by the utf-8 encoded line,
+padded to a whole number of records. Text lines are cut to 255 bytes, on a character
+boundary.
+
+An interval between two lines that does not fit in dt (about 71.6 min, e.g. between
+two nights appended to the same file) is stored exactly, as gap records of the max dt
+before the line.
+
+"""
+import os
+import time
+import logging
+import struct
+import threading
+#
+import numpy as np
+
+SESSION_MAGIC = b'PTSC'
+SESSION_VERSION = 2
+SESSION_VERSIONS = (1, 2)
+SESSION_HEADER = struct.Struct('<4sHHdQ')
+
+RECORD = np.dtype([('dt', '<u4'), ('millis', '<i4'), ('phi', '<i4'), ('theta', '<i4'),
+                   ('phi_err', '<i2'), ('theta_err', '<i2'), ('kind', 'u1'), ('length', 'u1'),
+                   ('unused', '<u2')])
+RECORD_STRUCT = struct.Struct('<IiiihhBBH')
+
+KIND_DATA = 0
+KIND_TEXT = 1
+KIND_GAP = 2
+
+"Limits of the stored deltas, the larger ones are stored as text"
+INT32 = 2**31
+INT16 = 2**15
+MAX_DT = 2**32 - 1
+MAX_TEXT = 255
+
+
+class SessionWriter(object):
+    """
+    Appends raw serial lines to a session file.
+
+    :param filename: name of the session file, appended to if it exists
+    :type filename: str
+
+    >>> capture = SessionWriter('session.ptsc')
+    >>> capture.write('1234 -548 870 0 0', time.time())
+    >>> capture.close()
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.t0 = None
+        "arrival time of the last line since t0 in microseconds, as encoded"
+        self.elapsed = 0
+        self.last = None
+
+        if os.path.exists(filename) and os.path.getsize(filename) > 0:
+            "continue the deltas of the existing session"
+            reader = SessionReader(filename)
+            self.t0 = reader.t0
+            self.elapsed = reader.elapsed
+            data = reader.data()
+            if len(data[0]):
+                self.last = [int(data[i][-1]) for i in range(1, 6)]
+            version = reader.version
+            reader.close()
+            if version != SESSION_VERSION:
+                "the records are the same, this version adds the gap records"
+                with open(filename, 'r+b') as f:
+                    f.write(SESSION_HEADER.pack(SESSION_MAGIC, SESSION_VERSION, RECORD.itemsize, self.t0, 0))
+            self.file = open(filename, 'ab')
+        else:
+            self.file = open(filename, 'wb')
+
+    def write(self, line, arrival):
+        """
+        Append a line.
+
+        :param line: the raw line, without the line terminator
+        :type line: str
+        :param arrival: host arrival time in seconds since epoch
+        :type arrival: float
+        """
+        if self.t0 is None:
+            self.t0 = arrival
+            self.file.write(SESSION_HEADER.pack(SESSION_MAGIC, SESSION_VERSION, RECORD.itemsize, arrival, 0))
+
+        "the deltas follow the arrival times from t0, so the rounding does not add up"
+        dt = max(int(round(1e6*(arrival - self.t0))) - self.elapsed, 0)
+        self.elapsed += dt
+        while dt > MAX_DT:
+            self.file.write(RECORD_STRUCT.pack(MAX_DT, 0, 0, 0, 0, 0, KIND_GAP, 0, 0))
+            dt -= MAX_DT
+
+        values = self.parse(line)
+        if values is not None:
+            last = self.last or [0, 0, 0, 0, 0]
+            deltas = [v - l for v, l in zip(values, last)]
+            if (all(-INT32 <= d < INT32 for d in deltas[:3])
+                    and all(-INT16 <= d < INT16 for d in deltas[3:])):
+                self.file.write(RECORD_STRUCT.pack(dt, *deltas, KIND_DATA, 0, 0))
+                self.last = values
+                return
+
+        "anything else is kept verbatim"
+        text = line.encode('utf-8')
+        if len(text) > MAX_TEXT:
+            logging.warning('Captured line cut to %d bytes: %s' % (MAX_TEXT, line))
+            text = text[:MAX_TEXT].decode('utf-8', 'ignore').encode('utf-8')
+        padding = -len(text) % RECORD.itemsize
+        self.file.write(RECORD_STRUCT.pack(dt, 0, 0, 0, 0, 0, KIND_TEXT, len(text), 0))
+        self.file.write(text + b'\0'*padding)
+
+    @staticmethod
+    def parse(line):
+        """
+        Parse a data line, if it can be reproduced exactly from its values.
+
+        :param line: the raw line
+        :type line: str
+
+        :return: millis, phi count, theta count, phi errors and theta errors, or None
+        :rtype: list(int) or None
+        """
+        fields = line.split(' ')
+        if len(fields) != 5:
+            return None
+        try:
+            values = [int(f) for f in fields]
+        except ValueError:
+            return None
+        if ' '.join(str(v) for v in values) != line:
+            return None
+        return values
+
+    def flush(self):
+        """
+        Flush the file.
+        """
+        self.file.flush()
+
+    def close(self):
+        """
+        Close the file.
+        """
+        self.file.close()
+
+
+class SessionReader(object):
+    """
+    Reads a session file through a memory map.
+
+    :param filename: name of the session file
+    :type filename: str
+
+    >>> session = SessionReader('session.ptsc')
+    >>> utc, millis, phi_cnt, theta_cnt, phi_err, theta_err = session.data()
+    >>> for arrival, line in session.lines():
+    ...     print(arrival, line)
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            magic, self.version, size, self.t0, _ = SESSION_HEADER.unpack(f.read(SESSION_HEADER.size))
+        if magic != SESSION_MAGIC or self.version not in SESSION_VERSIONS or size != RECORD.itemsize:
+            raise ValueError('%s is not a version %d session file' % (filename, SESSION_VERSION))
+
+        n = (os.path.getsize(filename) - SESSION_HEADER.size)//RECORD.itemsize
+        if n > 0:
+            self.records = np.memmap(filename, dtype=RECORD, mode='r', offset=SESSION_HEADER.size, shape=(n,))
+        else:
+            self.records = np.zeros(0, dtype=RECORD)
+
+        "index the records with a dt, skipping the continuation records of the text lines"
+        is_timed = np.ones(n, dtype=bool)
+        position = 0
+        for i in np.flatnonzero(self.records['kind'] == KIND_TEXT):
+            if i < position:
+                continue
+            size = -(-int(self.records['length'][i])//RECORD.itemsize)
+            is_timed[i + 1:i + 1 + size] = False
+            position = i + 1 + size
+        timed = np.flatnonzero(is_timed)
+        elapsed = np.cumsum(self.records['dt'][timed], dtype=np.int64)
+        self.elapsed = int(elapsed[-1]) if len(elapsed) else 0
+
+        "the gap records only carry time"
+        is_line = self.records['kind'][timed] != KIND_GAP
+        self.index = timed[is_line]
+        self.is_data = self.records['kind'][self.index] == KIND_DATA
+        self.arrival = self.t0 + elapsed[is_line]/1e6
+
+    def __len__(self):
+        return len(self.index)
+
+    def data(self):
+        """
+        Decode the data lines.
+
+        :return: arrival times, millis, phi counts, theta counts, phi errors and theta errors
+        :rtype: tuple(:obj:`np.ndarray`)
+        """
+        records = self.records[self.index[self.is_data]]
+        return (self.arrival[self.is_data],) + tuple(np.cumsum(records[name], dtype=np.int64)
+                                                     for name in ('millis', 'phi', 'theta', 'phi_err', 'theta_err'))
+
+    def iter_data(self, size=100000):
+        """
+        Decode the data lines in chunks, to bound the memory used by large sessions.
+
+        :param size: number of data lines per chunk, optional
+        :type size: int
+
+        :return: generator of (arrival times, millis, phi counts, theta counts, phi errors, theta errors)
+        :rtype: generator
+        """
+        index = self.index[self.is_data]
+        arrival = self.arrival[self.is_data]
+        names = ('millis', 'phi', 'theta', 'phi_err', 'theta_err')
+        carry = [0]*len(names)
+        for start in range(0, len(index), size):
+            records = self.records[index[start:start + size]]
+            values = tuple(np.cumsum(records[name], dtype=np.int64) + c for name, c in zip(names, carry))
+            carry = [int(v[-1]) for v in values]
+            yield (arrival[start:start + size],) + values
+
+    def lines(self, start=0):
+        """
+        Decode the raw lines.
+
+        :param start: index of the first line, optional
+        :type start: int
+
+        :return: generator of (arrival, line)
+        :rtype: generator
+        """
+        _, *values = self.data()
+        values = np.stack(values, axis=1).tolist() if len(values[0]) else []
+        j = int(np.count_nonzero(self.is_data[:start]))
+        for i in range(start, len(self.index)):
+            if self.is_data[i]:
+                line = '%d %d %d %d %d' % tuple(values[j])
+                j += 1
+            else:
+                k = self.index[i]
+                length = int(self.records['length'][k])
+                line = self.records[k + 1:k + 1 + -(-length//RECORD.itemsize)].tobytes()[:length].decode('utf-8', 'replace')
+            yield float(self.arrival[i]), line
+
+    def close(self):
+        """
+        Release the memory map.
+        """
+        self.records = None
+
+
+class ReplayClock(object):
+    """
+    Replacement for :func:`time.time` that follows the replayed time.
+
+    :param start: initial time in seconds since epoch, optional
+    :type start: float or None
+
+    The clock returns the arrival time of the line being replayed, and advances with
+    the wall time in between lines.
+    """
+
+    def __init__(self, start=None):
+        self.offset = 0.0 if start is None else start - time.time()
+
+    def set(self, utc):
+        """
+        Set the current time.
+
+        :param utc: the time in seconds since epoch
+        :type utc: float
+        """
+        self.offset = utc - time.time()
+
+    def __call__(self):
+        return time.time() + self.offset
+
+
+class SessionReplay(threading.Thread):
+    """
+    Feeds a session back into a serial protocol, as if it came from the serial port.
+
+    :param session: the session to replay
+    :type session: :obj:`SessionReader`
+    :param protocol: the protocol receiving the data, e.g. a :class:`pushto.telescope.SerialHandler`
+    :type protocol: :obj:`serial.threaded.Protocol`
+    :param speed: replay speed, 1 for real time, N for N times faster, 0 for as fast as possible, optional
+    :type speed: float
+    :param clock: the clock used by the protocol, set to the arrival time of every line, optional
+    :type clock: :obj:`ReplayClock` or None
+    :param terminator: line terminator, optional
+    :type terminator: bytes
+    :param delay: time in seconds to wait before the first line, e.g. for subscribers to connect, optional
+    :type delay: float
+
+    >>> clock = ReplayClock()
+    >>> handler = SerialHandler(enc, pm, pub_address, ctx, clock=ClockSync(), now=clock)
+    >>> replay = SessionReplay(SessionReader('session.ptsc'), handler, speed=10, clock=clock)
+    >>> replay.start()
+    """
+
+    def __init__(self, session, protocol, speed=1.0, clock=None, terminator=b'\r\n', delay=0.0):
+        super().__init__(daemon=True, name='replay')
+        self.session = session
+        self.protocol = protocol
+        self.speed = speed
+        self.clock = clock
+        self.terminator = terminator
+        self.delay = delay
+        self.stopped = threading.Event()
+        self.count = 0
+
+    def stop(self):
+        """
+        Stop the replay.
+        """
+        self.stopped.set()
+
+    def run(self):
+        if self.delay and self.stopped.wait(self.delay):
+            return
+        wall_start = time.perf_counter()
+        session_start = None
+        for arrival, line in self.session.lines():
+            if self.stopped.is_set():
+                break
+            if session_start is None:
+                session_start = arrival
+            if self.speed:
+                delay = (arrival - session_start)/self.speed - (time.perf_counter() - wall_start)
+                if delay > 0 and self.stopped.wait(delay):
+                    break
+            if self.clock is not None:
+                self.clock.set(arrival)
+            self.protocol.data_received(line.encode('utf-8') + self.terminator)
+            self.count += 1
+        logging.debug('replayed %d lines from %s', self.count, self.session.filename)
@@ -4,22 +4,243 @@ Handles site-dependent transformations between the telescope attitude and equato
 coordinates.
 
 Provides:
+    - TransformCache
     - Location
     - Site
 
 """
+import copy
 import logging
 import threading
+import time
 #
+import erfa
+import numpy as np
 import zmq
 import astropy.units as u
 from astropy.time import Time
 from astropy.coordinates import EarthLocation, AltAz, SkyCoord
+from astropy.coordinates.erfa_astrom import erfa_astrom
 #
 from pushto.stellarium import StellariumTC
 from pushto.telescope import Telescope
-from pushto.alignment import Aligner
-from pushto.messages import Message
+from pushto.alignment import Aligner, vec_from_angles, angles_from_vec
+from pushto.messages import send_message, recv_message, send_messages, recv_messages
+from pushto.monitoring import Monitor
+from pushto.pointing import PointingFitter
+from pushto.guidance import Guide
+
+"Earth rotation angle rate in radians per UT1 second"
+ERA_RATE = 2*np.pi*1.00273781191135448/86400
+
+"Guards used by ERFA to keep the refraction model finite near the horizon"
+CELMIN = 1e-6
+SELMIN = 0.05
+
+
+def unix_time(utc):
+    """
+    Convert a time into seconds since the unix epoch.
+
+    :param utc: utc time, optional (default is current utc)
+    :type utc: :obj:`astropy.time.Time` or float or None
+
+    :return: seconds since epoch
+    :rtype: float
+    """
+    if utc is None:
+        return time.time()
+    if isinstance(utc, Time):
+        return utc.unix
+    return float(utc)
+
+
+def rotation_z(angle):
+    """
+    Rotation matrix about the z axis, using the ERFA (frame rotation) convention.
+
+    :param angle: rotation angle in radians
+    :type angle: float
+
+    :return: rotation matrix
+    :rtype: :obj:`np.ndarray`
+    """
+    c = np.cos(angle)
+    s = np.sin(angle)
+    return np.array([[c, s, 0], [-s, c, 0], [0, 0, 1]])
+
+
+class TransformCache(object):
+    """
+    Cached transformation between ICRS and observed horizontal unit vectors.
+
+    The full ERFA chain (bias-precession-nutation, aberration, earth rotation,
+    polar motion and refraction constants) is evaluated with :mod:`astropy` once
+    per refresh interval. Between refreshes a direction is transformed with:
+
+        - aberration, applied as a vector correction
+        - a cached 3x3 rotation, advanced by the earth rotation angle
+        - refraction, applied with the ERFA A*tan(z)+B*tan^3(z) model
+
+    Light deflection by the Sun and diurnal aberration are neglected, together
+    they amount to less than 0.5 arcsec away from the Sun.
+
+    Horizontal vectors use the :func:`pushto.alignment.vec_from_angles`
+    convention: x to the North, y to the East and z to the zenith.
+
+    :param location: the location of the telescope
+    :type location: :obj:`astropy.coordinates.EarthLocation`
+    :param pres: site pressure in hPa
+    :type pres: float
+    :param temp: site temperature in Celsius
+    :type temp: float
+    :param relh: site relative humidity
+    :type relh: float
+    :param refresh: refresh interval in seconds
+    :type refresh: float
+
+    >>> cache = TransformCache(location, 1013, 15, 0.75, refresh=2)
+    >>> hori = cache.icrs_to_horizontal(vec_from_angles(ra, dec), time.time())
+    """
+
+    def __init__(self, location, pres=0, temp=0, relh=0, refresh=2):
+        self.location = location
+        self.pres = pres
+        self.temp = temp
+        self.relh = relh
+        self.refresh = refresh
+
+        self.epoch = None
+        self.rot = None
+        self.bpn = None
+        self.v = None
+        self.em = None
+        self.bm1 = None
+        self.refa = 0
+        self.refb = 0
+
+    def update(self, unix):
+        """
+        Evaluate the full ERFA chain at the given time.
+
+        :param unix: seconds since epoch
+        :type unix: float
+        """
+        utc = Time(unix, format='unix')
+        altaz = AltAz(obstime=utc, location=self.location,
+                      pressure=self.pres, temperature=self.temp,
+                      relative_humidity=self.relh, obswl=550*u.nm)
+        astrom = erfa_astrom.get().apco(altaz)
+
+        "CIRS -> horizontal rotation: transform the basis vectors without refraction"
+        rigid = astrom.copy()
+        rigid['refa'] = 0
+        rigid['refb'] = 0
+        rigid['diurab'] = 0
+        aob, zob, _, _, _ = erfa.atioq(np.array([0, np.pi/2, 0]), np.array([0, 0, np.pi/2]), rigid)
+        
+        self.epoch = unix
+        self.rot = vec_from_angles(np.degrees(aob), 90 - np.degrees(zob))
+        self.bpn = astrom['bpn']
+        self.v = astrom['v']
+        self.em = astrom['em']
+        self.bm1 = astrom['bm1']
+        self.refa = astrom['refa']
+        self.refb = astrom['refb']
+        logging.debug('refreshed transform cache at %s' % utc.iso)
+
+    def matrix(self, unix):
+        """
+        Get the rotation from proper (aberrated) ICRS directions to unrefracted
+        horizontal directions, refreshing the cache if necessary.
+
+        :param unix: seconds since epoch
+        :type unix: float
+
+        :return: rotation matrix
+        :rtype: :obj:`np.ndarray`
+        """
+        if self.epoch is None or abs(unix - self.epoch) > self.refresh:
+            self.update(unix)
+        return self.rot @ rotation_z(ERA_RATE*(unix - self.epoch)) @ self.bpn
+
+    def refract(self, v):
+        """
+        Apply refraction to unrefracted horizontal vectors (ERFA atioq).
+
+        :param v: unit vectors, shape (3,) or (3, N)
+        :type v: :obj:`np.ndarray`
+
+        :return: refracted unit vectors
+        :rtype: :obj:`np.ndarray`
+        """
+        if self.refa == 0 and self.refb == 0:
+            return v
+        r = np.maximum(np.hypot(v[0], v[1]), CELMIN)
+        z = np.maximum(v[2], SELMIN)
+        tz = r/z
+        w = self.refb*tz*tz
+        dz = (self.refa + w)*tz/(1 + (self.refa + 3*w)/(z*z))
+        cosdz = 1 - dz*dz/2
+        f = cosdz - dz*z/r
+        return np.array([v[0]*f, v[1]*f, cosdz*v[2] + dz*r])
+
+    def unrefract(self, v):
+        """
+        Remove refraction from observed horizontal vectors (ERFA atoiq).
+
+        :param v: unit vectors, shape (3,) or (3, N)
+        :type v: :obj:`np.ndarray`
+
+        :return: unrefracted unit vectors
+        :rtype: :obj:`np.ndarray`
+        """
+        if self.refa == 0 and self.refb == 0:
+            return v
+        r = np.hypot(v[0], v[1])
+        tz = r/np.maximum(v[2], SELMIN)
+        zd = np.arctan2(r, v[2]) + (self.refa + self.refb*tz*tz)*tz
+        f = np.sin(zd)/np.maximum(r, CELMIN)
+        return np.array([v[0]*f, v[1]*f, np.cos(zd)])
+
+    def icrs_to_horizontal(self, v, unix):
+        """
+        Transform ICRS unit vectors to observed horizontal unit vectors.
+
+        :param v: unit vectors, shape (3,) or (3, N)
+        :type v: :obj:`np.ndarray`
+        :param unix: seconds since epoch
+        :type unix: float
+
+        :return: horizontal unit vectors
+        :rtype: :obj:`np.ndarray`
+        """
+        m = self.matrix(unix)
+        ppr = erfa.ab(v.T, self.v, self.em, self.bm1).T
+        return self.refract(m @ ppr)
+
+    def horizontal_to_icrs(self, v, unix):
+        """
+        Transform observed horizontal unit vectors to ICRS unit vectors.
+
+        :param v: unit vectors, shape (3,) or (3, N)
+        :type v: :obj:`np.ndarray`
+        :param unix: seconds since epoch
+        :type unix: float
+
+        :return: ICRS unit vectors
+        :rtype: :obj:`np.ndarray`
+        """
+        m = self.matrix(unix)
+        ppr = (m.T @ self.unrefract(v)).T
+
+        "Remove aberration by iteration, as ERFA aticq does"
+        pnat = ppr
+        for _ in range(2):
+            d = erfa.ab(pnat, self.v, self.em, self.bm1) - pnat
+            pnat = ppr - d
+            pnat = pnat/np.sqrt(np.sum(pnat*pnat, axis=-1, keepdims=True))
+        return pnat.T
 
 
 class Location(object):
@@ -38,32 +259,46 @@ class Location(object):
     :type temp: float
     :param relh: site relative humidity
     :type relh: float
+    :param refresh: refresh interval of the cached transformation in seconds, optional
+                    (default is None, every transformation uses the full :mod:`astropy` path)
+    :type refresh: float or None
 
     """
 
-    def __init__(self, lat, lon, elev, pres=0, temp=0, relh=0):
+    def __init__(self, lat, lon, elev, pres=0, temp=0, relh=0, refresh=None):
         self.location = EarthLocation(lat=lat, lon=lon, height=elev)
         self.pres = pres
         self.temp = temp
         self.relh = relh
+        self.refresh = refresh
+        self.cache = None
+        if refresh:
+            self.cache = TransformCache(self.location, pres, temp, relh, refresh)
     
     def horizontal_to_equatorial(self, azi, alt, utc=None):
         """
         Convert from horizontal to equatorial coordinates.
         
         :param azi: local azimuth in degrees
-        :type azi: float
+        :type azi: float or :obj:`np.ndarray`
         :param alt: local altitude in degrees
-        :type alt: float
+        :type alt: float or :obj:`np.ndarray`
         :param utc: utc time, optional (default is current utc)
-        :type utc: :obj:`astropy.time.Time` or None
+        :type utc: :obj:`astropy.time.Time` or float (unix) or None
         
         :return: ra in hours, dec in degrees
         :rtype: list(floats)
         
         """
+        if self.cache is not None:
+            v = self.cache.horizontal_to_icrs(vec_from_angles(azi, alt), unix_time(utc))
+            ra, dec = angles_from_vec(v)
+            return ra*24/360, dec
+
         if utc is None:
             utc = Time.now()
+        elif not isinstance(utc, Time):
+            utc = Time(utc, format='unix')
         altaz = AltAz(obstime=utc, location=self.location, 
                       pressure=self.pres, temperature=self.temp,
                       relative_humidity=self.relh, obswl=550*u.nm)
@@ -76,25 +311,77 @@ class Location(object):
         Convert from equatorial to horizontal coordinates.
         
         :param ra: right ascension in hours
-        :type ra: float
+        :type ra: float or :obj:`np.ndarray`
         :param dec: declination in degrees
-        :type dec: float
+        :type dec: float or :obj:`np.ndarray`
         :param utc: utc time, optional (default is current utc)
-        :type utc: :obj:`astropy.time.Time` or None
+        :type utc: :obj:`astropy.time.Time` or float (unix) or None
         
         :return: azi in degrees, alt in degrees
         :rtype: list(floats)
         
         """
+        if self.cache is not None:
+            v = self.cache.icrs_to_horizontal(vec_from_angles(ra*360/24, dec), unix_time(utc))
+            return angles_from_vec(v)
+
         if utc is None:
             utc = Time.now()
+        elif not isinstance(utc, Time):
+            utc = Time(utc, format='unix')
         altaz = AltAz(obstime=utc, location=self.location, 
                       pressure=self.pres, temperature=self.temp,
                       relative_humidity=self.relh, obswl=550*u.nm)
         hori = SkyCoord(ra=(ra*360/24)*u.deg, dec=dec*u.deg, frame='icrs').transform_to(altaz)
     
         return hori.az.to_value(), hori.alt.to_value()
-    
+
+    def transform_error(self, utc=None, n=20, min_alt=10):
+        """
+        Maximum error of the cached transformation against the full :mod:`astropy` path.
+        
+        The comparison is done at the start and at the end of a refresh interval, on
+        an n x n grid of horizontal directions above min_alt, in both directions.
+        
+        :param utc: utc time, optional (default is current utc)
+        :type utc: :obj:`astropy.time.Time` or float (unix) or None
+        :param n: size of the grid along each axis, optional
+        :type n: int
+        :param min_alt: minimum altitude of the grid in degrees, optional
+        :type min_alt: float
+        
+        :return: maximum angular separation in arcsec
+        :rtype: float
+        
+        """
+        if self.cache is None:
+            return 0.0
+
+        azi, alt = np.meshgrid(np.linspace(0, 360, n, endpoint=False),
+                               np.linspace(min_alt, 89, n))
+        azi = azi.ravel()
+        alt = alt.ravel()
+
+        unix = unix_time(utc)
+        exact = Location(self.location.lat, self.location.lon, self.location.height,
+                         self.pres, self.temp, self.relh)
+        self.cache.update(unix)
+
+        err = 0
+        for t in (unix, unix + self.refresh):
+            utc = Time(t, format='unix')
+            ra0, dec0 = exact.horizontal_to_equatorial(azi, alt, utc)
+            ra1, dec1 = self.horizontal_to_equatorial(azi, alt, t)
+            cos = np.sum(vec_from_angles(ra0*360/24, dec0)*vec_from_angles(ra1*360/24, dec1), axis=0)
+            err = max(err, np.max(np.arccos(np.clip(cos, -1, 1))))
+
+            azi0, alt0 = exact.equatorial_to_horizontal(ra0, dec0, utc)
+            azi1, alt1 = self.equatorial_to_horizontal(ra0, dec0, t)
+            cos = np.sum(vec_from_angles(azi0, alt0)*vec_from_angles(azi1, alt1), axis=0)
+            err = max(err, np.max(np.arccos(np.clip(cos, -1, 1))))
+
+        return 3600*np.degrees(err)
+
     @classmethod
     def setup(cls, cfg):
         lat = cfg.get_latitude()
@@ -103,7 +390,8 @@ class Location(object):
         pres = cfg.get_pressure()
         temp = cfg.get_temperature()
         relh = cfg.get_rel_humidity()
-        return Location(lat, lon, elev, pres, temp, relh)
+        refresh = cfg.get_transform_refresh()
+        return Location(lat, lon, elev, pres, temp, relh, refresh)
 
 
 class Site(threading.Thread):
@@ -122,16 +410,47 @@ class Site(threading.Thread):
     :type location: :obj:`pushto.site.Location`
     :param ctx: :mod:`zmq` context, optional
     :type ctx: :obj:`zmq.Context` or None
+    :param aligner: the telescope aligner, optional
+    :type aligner: :obj:`pushto.alignment.Aligner` or None
+    :param td_eq_format: wire format of the telescope data/equatorial socket, optional
+    :type td_eq_format: str
+    :param decimation: publish every decimation-th sample to the telescope data/equatorial
+                       socket, optional
+    :type decimation: int
+    :param monitor: records the time spent in every stage, optional
+    :type monitor: :obj:`pushto.monitoring.Monitor` or None
+    :param fitter: fits the pointing model to the sync pairs, refitted after every sync, optional
+    :type fitter: :obj:`pushto.pointing.PointingFitter` or None
+    :param now: the host clock, used for the samples without an acquisition time, optional
+                (e.g. a :class:`pushto.session.ReplayClock` when replaying a session)
+    :type now: callable
+    :param gd_address: guidance data address, optional (default is no guidance socket)
+    :type gd_address: str or None
+    :param gd_format: wire format of the guidance data socket, optional
+    :type gd_format: str
+    :param goto: what an ALIGN message (a Goto from Stellarium) does, 'sync' to add an
+                 alignment star or 'guide' to guide the telescope to the target, optional
+    :type goto: str
+    
+    Only the telescope attitude of every sample is kept; the transformation to
+    equatorial coordinates is done when a sample is published or used for alignment.
     
     >>> site = Site.setup(cfg, ctx)
     >>> site.connect()
     >>> site.start()
     >>> site.close()
 
+    Without connecting, the messages can also be handed over directly with
+    :meth:`handle_data` and :meth:`handle_goto`, as :class:`pushto.runtime.AsyncRuntime` does.
+
+    In guide mode, every sample is followed by a GUIDE message on the guidance data
+    socket, with the offsets to the target, see :class:`pushto.guidance.Guide`.
+
     """
     
     def __init__(self, td_ta_address, td_eq_address, pd_eq_address, pd_ta_address, 
-                 location, ctx=None):
+                 location, ctx=None, aligner=None, td_eq_format='json', decimation=10, monitor=None,
+                 fitter=None, now=time.time, gd_address=None, gd_format='json', goto='sync'):
         super().__init__(daemon=True, name='site')
    
         "process arguments"
@@ -140,40 +459,191 @@ class Site(threading.Thread):
         self.pd_eq_address = pd_eq_address
         self.pd_ta_address = pd_ta_address
         self.location = location
-        if ctx is None:
-            ctx = zmq.Context()
+        self.td_eq_format = td_eq_format
+        self.decimation = max(1, int(decimation))
+        self.monitor = monitor
+        self.fitter = fitter
+        self.now = now
+        self.gd_address = gd_address
+        self.gd_format = gd_format
+        self.goto = goto
+        self.ctx = ctx
 
-        "setup communications"
-        self.td_ta_socket = ctx.socket(zmq.SUB)
-        self.td_ta_socket.subscribe("")
-        self.td_eq_socket = ctx.socket(zmq.PUB)
-        self.pd_eq_socket = ctx.socket(zmq.SUB)
-        self.pd_eq_socket.subscribe("")
-        self.pd_ta_socket = ctx.socket(zmq.PUB)
+        "the sockets are created by connect, they are not needed when the site is driven directly"
+        self.td_ta_socket = None
+        self.td_eq_socket = None
+        self.pd_eq_socket = None
+        self.pd_ta_socket = None
+        self.gd_socket = None
         
-        self.aligner = Aligner()
+        self.aligner = aligner or Aligner()
+        self.guide = Guide(location, self.aligner, now=now)
+        "the alignment and the fitter are also read and reset from the user interface"
+        self.lock = threading.Lock()
+        self.last_data = None
+        self.n = 0
      
     def close(self):
         """
         Close all sockets.
         """
-        logging.debug('closing the sockets')
-        self.td_ta_socket.disconnect(self.td_ta_address)
-        self.pd_eq_socket.disconnect(self.pd_eq_address)
-        self.td_ta_socket.close(linger=1)
-        self.pd_eq_socket.close(linger=1)
-        self.td_eq_socket.close(linger=1)
-        self.pd_ta_socket.close(linger=1)
+        if self.td_ta_socket is not None:
+            logging.debug('closing the sockets')
+            self.td_ta_socket.disconnect(self.td_ta_address)
+            self.pd_eq_socket.disconnect(self.pd_eq_address)
+            self.td_ta_socket.close(linger=1)
+            self.pd_eq_socket.close(linger=1)
+            self.td_eq_socket.close(linger=1)
+            self.pd_ta_socket.close(linger=1)
+            if self.gd_socket is not None:
+                self.gd_socket.close(linger=1)
+        if self.monitor is not None:
+            self.monitor.close()
 
     def connect(self):
         """
         Bind and connect the sockets.
         """
         logging.debug('connecting the sockets')
+        if self.ctx is None:
+            self.ctx = zmq.Context()
+        self.td_ta_socket = self.ctx.socket(zmq.SUB)
+        self.td_ta_socket.subscribe("")
+        self.td_eq_socket = self.ctx.socket(zmq.PUB)
+        self.pd_eq_socket = self.ctx.socket(zmq.SUB)
+        self.pd_eq_socket.subscribe("")
+        self.pd_ta_socket = self.ctx.socket(zmq.PUB)
+
         self.td_ta_socket.connect(self.td_ta_address)
         self.td_eq_socket.bind(self.td_eq_address)
         self.pd_eq_socket.connect(self.pd_eq_address)
         self.pd_ta_socket.bind(self.pd_ta_address)
+        if self.gd_address is not None:
+            self.gd_socket = self.ctx.socket(zmq.PUB)
+            self.gd_socket.bind(self.gd_address)
+
+    def transform(self, msg):
+        """
+        Transform a DATA message from telescope attitude to horizontal and equatorial
+        coordinates at its acquisition time, or at the current time if the message
+        does not carry one, i.e. utc is not set (seconds since epoch, from the host clock).
+            - theta,phi -> alt,azi: requires alignment calibration
+            - alt,azi -> dec, ra:   requires time and location
+
+        :param msg: data message with phi and theta
+        :type msg: :obj:`pushto.messages.DataMessage`
+
+        :return: the same message, with time (seconds since epoch), utc, azi, alt, ra and dec set
+        :rtype: :obj:`pushto.messages.DataMessage`
+        """
+        "use the acquisition time if the telescope provides it"
+        utc = msg.time if msg.utc else self.now()
+        t0 = time.perf_counter()
+        azi, alt = self.aligner.telescope_to_horizontal(msg.phi, msg.theta)
+        t1 = time.perf_counter()
+        ra, dec = self.location.horizontal_to_equatorial(azi, alt, utc)
+        if self.monitor is not None:
+            self.monitor.record('alignment', t1 - t0)
+            self.monitor.record('equatorial', time.perf_counter() - t1)
+        msg.time = utc
+        msg.utc = True
+        msg.alt = alt
+        msg.azi = azi
+        msg.ra = ra
+        msg.dec = dec
+        return msg
+
+    def handle_data(self, msg):
+        """
+        Keep the telescope attitude of a DATA message for the alignment, and transform
+        every decimation-th message.
+
+        :param msg: data message with phi and theta
+        :type msg: :obj:`pushto.messages.DataMessage`
+
+        :return: the transformed message, or None if it is not to be published
+        :rtype: :obj:`pushto.messages.DataMessage` or None
+        """
+        self.n += 1
+        self.last_data = msg
+        if (self.n % self.decimation) != 0:
+            return None
+        return self.transform(msg)
+
+    def guidance(self, msg):
+        """
+        Offsets of a DATA message to the guide target.
+
+        :param msg: data message with phi and theta
+        :type msg: :obj:`pushto.messages.DataMessage`
+
+        :return: the guidance, or None if there is no target
+        :rtype: :obj:`pushto.messages.GuideMessage` or None
+        """
+        if not self.guide.active:
+            return None
+        t0 = time.perf_counter()
+        guide = self.guide.handle(msg)
+        if self.monitor is not None:
+            self.monitor.record('guidance', time.perf_counter() - t0)
+        return guide
+
+    def handle_goto(self, msg):
+        """
+        Handle an ALIGN message, as a sync star or as a guide target depending on the goto mode.
+
+        :param msg: alignment message with the time, ra and dec of the target
+        :type msg: :obj:`pushto.messages.AlignMessage`
+
+        :return: the pointing data of a sync, see :meth:`handle_align`, None in guide mode
+        :rtype: dict or None
+        """
+        if self.goto != 'guide':
+            return self.handle_align(msg)
+        utc = Time(msg.time, format='iso').unix if isinstance(msg.time, str) else msg.time
+        logging.info('Guiding to ra=%.4f dec=%.4f' % (msg.ra, msg.dec))
+        self.guide.set_target(msg.ra, msg.dec, utc)
+        return None
+
+    def handle_align(self, msg):
+        """
+        Add a sync pair: the last telescope attitude and the target of an ALIGN message.
+
+        :param msg: alignment message with the time, ra and dec of the target
+        :type msg: :obj:`pushto.messages.AlignMessage`
+
+        The pointing model is refitted with the star only if the telescope was already
+        aligned without it: the target of the fit then does not depend on the attitude
+        it is compared with.
+
+        :return: the pointing data (synced and telescope attitudes, and the refitted
+                 pointing model), or None if there is no telescope data to align with
+        :rtype: dict or None
+        """
+        last_data = self.last_data
+        if last_data is None:
+            logging.warning('No telescope data to align with')
+            return None
+
+        utc = Time(msg.time, format='iso') if isinstance(msg.time, str) else msg.time
+        azi, alt = self.location.equatorial_to_horizontal(msg.ra, msg.dec, utc)
+
+        with self.lock:
+            "the target in the telescope frame for the fit, by an alignment that does not use this star"
+            aligned = len(self.aligner.stars) >= 2
+            target = self.aligner.horizontal_to_telescope(azi, alt)
+            self.aligner.add_star(last_data.phi, last_data.theta, azi, alt)
+
+            phi, theta = self.aligner.horizontal_to_telescope(azi, alt)
+            pd = {'s_phi': phi, 's_theta': theta, 't_phi': last_data.phi, 't_theta': last_data.theta}
+
+            "Refit the pointing model: raw attitude vs. target in the telescope frame"
+            if self.fitter is not None and last_data.phi_raw is not None:
+                if aligned:
+                    self.fitter.add(last_data.phi_raw, last_data.theta_raw, target[0], target[1])
+                pd['model'] = self.fitter.fit()
+                pd['rms'] = self.fitter.rms
+        return pd
 
     def run(self):
         logging.debug('entering run...')
@@ -185,79 +655,103 @@ class Site(threading.Thread):
         poller.register(self.td_ta_socket, zmq.POLLIN)
         poller.register(self.pd_eq_socket, zmq.POLLIN)
         
-        last_data = None
-        N = 10  # with T_arduino=50ms --> 500ms   Stellarium is smooth with N=10!
-        n = 0
         while True:
             "Poll the poller for incoming messages"
             socks = dict(poller.poll())
         
             if self.td_ta_socket in socks:
-                data_msg = self.td_ta_socket.recv_json()
-                msg = Message.from_json(data_msg)
-                logging.debug('TD SUB: %s' % msg)
-                
-                if msg.type == 'CMD':
-                    if msg.cmd == 'stop':
-                        logging.info("Sending kill signal to Stellarium: %s" % data_msg)
-                        self.td_eq_socket.send_json(data_msg)
-                        self.close()
-                        return
-                elif msg.type == 'DATA':
-                    n += 1
-                
-                    """
-                    Transform from TA to EQ
-                        - theta,phi -> alt,azi: requires alignment calibration
-                        - alt,azi -> dec, ra:   requires time and location
-                    """
-                    phi = msg.phi
-                    theta = msg.theta
-                    azi, alt = self.aligner.telescope_to_horizontal(phi, theta)
-                    ra, dec = self.location.horizontal_to_equatorial(azi, alt)
-                    msg.time = Time.now().iso
-                    msg.alt = alt
-                    msg.azi = azi
-                    msg.ra = ra
-                    msg.dec = dec
-
-                    "Store for alignment"
-                    last_data = msg.to_json()
-                    
-                    if (n % N) == 0:
-                        "Send RA, Dec to stellarium"
-                        self.td_eq_socket.send_json(msg.to_json())
-                        logging.info("On data PUB: %s" % msg.to_json())
+                "the telescope publishes every line of a serial read as one batch"
+                t0 = time.perf_counter()
+                msgs = recv_messages(self.td_ta_socket)
+                t1 = time.perf_counter()
+                logging.debug('TD SUB: %d messages' % len(msgs))
 
-            if self.pd_eq_socket in socks:
-                calib_msg = self.pd_eq_socket.recv_json()
-                logging.info("On calib SUB: %s" % calib_msg)
-                msg = Message.from_json(calib_msg)
+                out = []
+                guides = []
+                for msg in msgs:
+                    if msg.type == 'CMD':
+                        if msg.cmd == 'stop':
+                            if out:
+                                send_messages(self.td_eq_socket, out, self.td_eq_format)
+                            if guides:
+                                send_messages(self.gd_socket, guides, self.gd_format)
+                            logging.info("Sending kill signal to Stellarium: %s" % msg)
+                            send_message(self.td_eq_socket, msg, self.td_eq_format)
+                            self.close()
+                            return
+                    elif msg.type == 'DATA':
+                        "Store the telescope attitude for alignment, transform from TA to EQ"
+                        if self.handle_data(msg) is not None:
+                            out.append(msg)
+                            logging.info("On data PUB: %s" % msg.to_json())
+                        guide = self.guidance(msg)
+                        if guide is not None and self.gd_socket is not None:
+                            guides.append(guide)
 
-                azi, alt = self.location.equatorial_to_horizontal(msg.ra, msg.dec, Time(msg.time, format='iso'))                
-                self.aligner.add_star(last_data['phi'], last_data['theta'], azi, alt)
+                if out:
+                    "send RA, Dec to stellarium"
+                    t2 = time.perf_counter()
+                    send_messages(self.td_eq_socket, out, self.td_eq_format)
+                    if self.monitor is not None:
+                        self.monitor.record('td_eq_send', time.perf_counter() - t2)
 
-                phi, theta = self.aligner.horizontal_to_telescope(azi, alt)
-                pd = {'s_phi': phi, 's_theta': theta, 't_phi': last_data['phi'], 't_theta': last_data['theta']}
-                self.pd_ta_socket.send_json(pd)
+                if guides:
+                    "the guidance of every sample"
+                    send_messages(self.gd_socket, guides, self.gd_format)
+
+                if self.monitor is not None:
+                    now = time.time()
+                    self.monitor.record('td_ta_recv', t1 - t0)
+                    if msgs[-1].utc:
+                        self.monitor.record('age_td_ta', now - msgs[-1].time)
+                    self.monitor.tick(now)
+
+            if self.pd_eq_socket in socks:
+                msg = recv_message(self.pd_eq_socket)
+                logging.info("On calib SUB: %s" % msg)
+                pd = self.handle_goto(msg)
+                if pd is not None:
+                    self.pd_ta_socket.send_json(pd)
 
     def reset_alignment(self):
         """
-        Reset the alignment data.
+        Reset the alignment data, and the sync pairs of the pointing model fit, whose
+        targets depend on the alignment.
+        """
+        with self.lock:
+            self.aligner.reset()
+            if self.fitter is not None:
+                self.fitter.reset()
+
+    def fitter_snapshot(self):
+        """
+        A copy of the pointing model fitter, consistent while syncs go on.
+
+        :return: the copy, None without a fitter
+        :rtype: :obj:`pushto.pointing.PointingFitter` or None
         """
-        self.aligner.reset()
+        if self.fitter is None:
+            return None
+        with self.lock:
+            return copy.deepcopy(self.fitter)
         
     @classmethod
-    def setup(cls, cfg, ctx=None):
+    def setup(cls, cfg, ctx=None, now=time.time):
 
-        td_ta_address = "tcp://%s:%s" % (cfg.get_host_ip(), cfg.get_td_ta_port())
-        td_eq_address = "tcp://%s:%s" % (cfg.get_host_ip(), cfg.get_td_eq_port())
-        pd_eq_address = "tcp://%s:%s" % (cfg.get_host_ip(), cfg.get_pd_eq_port())
-        pd_ta_address = "tcp://%s:%s" % (cfg.get_host_ip(), cfg.get_pd_ta_port())
+        td_ta_address = cfg.get_address('td_ta')
+        td_eq_address = cfg.get_address('td_eq')
+        pd_eq_address = cfg.get_address('pd_eq')
+        pd_ta_address = cfg.get_address('pd_ta')
+        gd_address = cfg.get_address('gd')
         location = Location.setup(cfg)
+        aligner = Aligner(window=cfg.get_align_window() or None, forget=cfg.get_align_forget())
+   
+        monitor = Monitor.setup(cfg, 'site', ctx)
+        fitter = PointingFitter()
    
         return Site(td_ta_address, td_eq_address, pd_eq_address, pd_ta_address, 
-                    location, ctx)
+                    location, ctx, aligner, cfg.get_td_eq_format(), cfg.get_td_eq_decimation(), monitor,
+                    fitter, now, gd_address, cfg.get_gd_format(), cfg.get_goto_mode())
 
 
 if __name__ == '__main__':
@@ -292,7 +786,6 @@ if __name__ == '__main__':
     Start stellarium first
     """
     stellarium = StellariumTC.setup(cfg, ctx)
-    stellarium.handshake()
     stellarium.start()
 
     """
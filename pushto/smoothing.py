@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+"""
+Smoothing of the encoder stream.
+
+Provides:
+    - AlphaBetaFilter
+    - KalmanFilter
+    - AttitudeFilter
+
+
+With 49"/86" per count, the attitude of a telescope at rest jitters by whole counts
+from one sample to the next. A constant velocity filter per axis, between the
+encoders and the publication, turns the counts into a smooth attitude with sub-count
+resolution and an angular velocity, so every sample can be published.
+
+The axes are filtered in encoder counts, before the conversion to angles: the counts
+do not wrap at 360 degrees, and the conversion of the smoothed (fractional) counts
+with :meth:`pushto.telescope.Encoders.convert_array` gives the smoothed attitude.
+
+    - alpha-beta: fixed gains, alpha for the position and beta for the velocity
+    - kalman:     the gains follow the sample interval and the uncertainty of the state,
+                  the measurement noise is the quantization noise of the encoders
+                  (1/sqrt(12) counts) and the process noise is a random acceleration
+                  of the telescope (accel, in deg/s^2)
+
+A filter restarts from the sample after a gap in the stream (e.g. lost samples) or
+a jump of the counts (e.g. a reset of the Arduino).
+
+Per sample, a filter costs a few scalar operations done with plain floats: about a
+microsecond per axis.
+
+"""
+import math
+#
+from pushto.config import FILTER_KINDS
+
+"Interval in seconds between two samples beyond which a filter restarts"
+FILTER_GAP = 1.0
+
+"Residual in degrees beyond which a filter restarts"
+FILTER_JUMP = 2.0
+
+"Quantization noise of the encoders in counts"
+QUANTIZATION = 1/math.sqrt(12)
+
+"Uncertainty of the velocity in counts/s when a filter restarts"
+RESTART_RATE = 1000.0
+
+
+class AlphaBetaFilter(object):
+    """
+    Alpha-beta filter of one axis.
+
+    :param alpha: gain of the position, (0:1], optional
+    :type alpha: float
+    :param beta: gain of the velocity, (0:2), optional
+    :type beta: float
+    :param jump: residual in counts beyond which the filter restarts, optional
+    :type jump: float
+    :param gap: interval in seconds beyond which the filter restarts, optional
+    :type gap: float
+
+    >>> f = AlphaBetaFilter(alpha=0.5, beta=0.1)
+    >>> x, v = f.update(1200, 0.05)
+    """
+
+    def __init__(self, alpha=0.5, beta=0.1, jump=100.0, gap=FILTER_GAP):
+        self.alpha = alpha
+        self.beta = beta
+        self.jump = jump
+        self.gap = gap
+
+        self.t = None
+        self.x = None
+        self.v = 0.0
+
+    def restart(self, z, t):
+        """
+        Restart the filter at a sample, at rest.
+
+        :param z: the count
+        :type z: float
+        :param t: time in seconds
+        :type t: float
+        """
+        self.t = t
+        self.x = float(z)
+        self.v = 0.0
+
+    def gains(self, dt):
+        """
+        Gains of the position and of the velocity for a step.
+
+        :param dt: the step in seconds
+        :type dt: float
+
+        :return: the gains
+        :rtype: tuple(float)
+        """
+        return self.alpha, self.beta/dt
+
+    def update(self, z, t):
+        """
+        Filter a sample.
+
+        :param z: the count
+        :type z: float
+        :param t: time in seconds
+        :type t: float
+
+        :return: the smoothed count and the velocity in counts/s
+        :rtype: tuple(float)
+        """
+        dt = None if self.t is None else t - self.t
+        if dt is None or dt <= 0 or dt > self.gap:
+            self.restart(z, t)
+            return self.x, self.v
+        x = self.x + self.v*dt
+        r = z - x
+        if abs(r) > self.jump:
+            self.restart(z, t)
+            return self.x, self.v
+        k0, k1 = self.gains(dt)
+        self.t = t
+        self.x = x + k0*r
+        self.v += k1*r
+        return self.x, self.v
+
+
+class KalmanFilter(AlphaBetaFilter):
+    """
+    Constant velocity Kalman filter of one axis.
+
+    :param accel: standard deviation of the acceleration in counts/s^2, optional
+    :type accel: float
+    :param noise: standard deviation of the counts, optional (default is the quantization noise)
+    :type noise: float
+    :param jump: residual in counts beyond which the filter restarts, optional
+    :type jump: float
+    :param gap: interval in seconds beyond which the filter restarts, optional
+    :type gap: float
+
+    >>> f = KalmanFilter(accel=40)
+    >>> x, v = f.update(1200, 0.05)
+    """
+
+    def __init__(self, accel=40.0, noise=QUANTIZATION, jump=100.0, gap=FILTER_GAP):
+        super().__init__(jump=jump, gap=gap)
+        self.q = accel*accel
+        self.r = noise*noise
+
+        self.p00 = self.r
+        self.p01 = 0.0
+        self.p11 = RESTART_RATE*RESTART_RATE
+
+    def restart(self, z, t):
+        super().restart(z, t)
+        self.p00 = self.r
+        self.p01 = 0.0
+        self.p11 = RESTART_RATE*RESTART_RATE
+
+    def gains(self, dt):
+        """
+        Predict the covariance over a step, and update it with the gains.
+
+        :param dt: the step in seconds
+        :type dt: float
+
+        :return: the Kalman gains of the position and of the velocity
+        :rtype: tuple(float)
+        """
+        "a random acceleration, constant over the step"
+        dt2 = dt*dt
+        q = self.q*dt2
+        p00 = self.p00 + dt*(2*self.p01 + dt*self.p11) + q*dt2/4
+        p01 = self.p01 + dt*self.p11 + q*dt/2
+        p11 = self.p11 + q
+
+        s = p00 + self.r
+        k0 = p00/s
+        k1 = p01/s
+        self.p00 = (1 - k0)*p00
+        self.p01 = (1 - k0)*p01
+        self.p11 = p11 - k1*p01
+        return k0, k1
+
+
+class AttitudeFilter(object):
+    """
+    Smooths the counts of both encoders.
+
+    :param kind: kind of filter, 'alpha-beta' or 'kalman'
+    :type kind: str
+    :param phi_res: resolution of the azimuthal encoder in degrees per count
+    :type phi_res: float
+    :param theta_res: resolution of the polar encoder in degrees per count
+    :type theta_res: float
+    :param alpha: gain of the position of the alpha-beta filter, optional
+    :type alpha: float
+    :param beta: gain of the velocity of the alpha-beta filter, optional
+    :type beta: float
+    :param accel: standard deviation of the acceleration of the telescope in deg/s^2,
+                  the process noise of the kalman filter, optional
+    :type accel: float
+
+    >>> smoother = AttitudeFilter('kalman', 360/15507, 360/27196)
+    >>> phi_cnt, theta_cnt, phi_rate, theta_rate = smoother.update(time.time(), 1200, 800)
+    >>> phi_raw, theta_raw = encoders.convert(phi_cnt, theta_cnt)
+    """
+
+    def __init__(self, kind, phi_res, theta_res, alpha=0.5, beta=0.1, accel=1.0):
+        if kind not in FILTER_KINDS[1:]:
+            raise ValueError('unknown filter %s, expected one of %s' % (kind, FILTER_KINDS[1:]))
+        self.kind = kind
+        self.axes = []
+        for res in (phi_res, theta_res):
+            jump = FILTER_JUMP/res
+            if kind == 'kalman':
+                self.axes.append(KalmanFilter(accel/res, jump=jump))
+            else:
+                self.axes.append(AlphaBetaFilter(alpha, beta, jump=jump))
+
+    def update(self, t, phi_cnt, theta_cnt):
+        """
+        Filter a sample of the encoders.
+
+        :param t: acquisition time in seconds
+        :type t: float
+        :param phi_cnt: count of azimuthal encoder
+        :type phi_cnt: int
+        :param theta_cnt: count of polar encoder
+        :type theta_cnt: int
+
+        :return: smoothed counts, and their rates in counts/s, of the azimuthal and
+                 polar encoders
+        :rtype: tuple(float)
+        """
+        phi_cnt, phi_rate = self.axes[0].update(phi_cnt, t)
+        theta_cnt, theta_rate = self.axes[1].update(theta_cnt, t)
+        return phi_cnt, theta_cnt, phi_rate, theta_rate
+
+    def update_array(self, times, phi_cnt, theta_cnt):
+        """
+        Filter a batch of samples of the encoders, in order.
+
+        :param times: acquisition times in seconds
+        :type times: list(float)
+        :param phi_cnt: counts of azimuthal encoder
+        :type phi_cnt: list(int)
+        :param theta_cnt: counts of polar encoder
+        :type theta_cnt: list(int)
+
+        :return: smoothed counts, and their rates in counts/s, of the azimuthal and
+                 polar encoders
+        :rtype: tuple(list(float))
+        """
+        phi, theta = self.axes
+        phi_out = [phi.update(z, t) for z, t in zip(phi_cnt, times)]
+        theta_out = [theta.update(z, t) for z, t in zip(theta_cnt, times)]
+        return ([x for x, _ in phi_out], [x for x, _ in theta_out],
+                [v for _, v in phi_out], [v for _, v in theta_out])
+
+    @classmethod
+    def setup(cls, cfg):
+        """
+        Convenience method for creating an AttitudeFilter object based on a Configuration object
+
+        :param cfg: the configuration object to use
+        :type cfg: :obj:`Configuration`
+
+        :return: the filter, None if smoothing is disabled
+        :rtype: :obj:`AttitudeFilter` or None
+        """
+        kind = cfg.get_filter()
+        if kind == 'none':
+            return None
+        return AttitudeFilter(kind, 360./cfg.get_phi_npr(), 360./cfg.get_theta_npr(),
+                              cfg.get_filter_alpha(), cfg.get_filter_beta(), cfg.get_filter_accel())
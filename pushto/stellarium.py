@@ -5,19 +5,41 @@ Interface to Stellarium Telescope Control plugin.
 Provides:
     - stc_encode
     - stc_decode
+    - STCClient
     - StellariumTC
+    - AsyncStellariumTC
     - StellariumRPC
+    - rpc_session
 
 """
+import asyncio
 import logging
 import socket
+import struct
 import threading
+import time
+from collections import deque
 #
 import requests
 import zmq
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from astropy.time import Time
 #
-from pushto.messages import Message, AlignMessage
+from pushto.messages import AlignMessage, send_message, recv_message
+from pushto.monitoring import Monitor
+from pushto.prediction import Predictor
+
+
+"Precompiled layouts of the STC 'CurrentPosition' and 'Goto' messages"
+STC_POSITION = struct.Struct('<HHqIiI')
+STC_GOTO = struct.Struct('<HHqIi')
+
+"Number of pending STC connections"
+STC_BACKLOG = 8
+
+"HTTP statuses of the Remote Control plugin that are retried"
+RPC_RETRY_STATUSES = (429, 500, 502, 503, 504)
 
 
 def stc_encode(utc, ra, dec):
@@ -25,8 +47,9 @@ def stc_encode(utc, ra, dec):
     Encode a messsage for the Stellarium Telescope Control. 
     This is always a 'CurrentPosition' message.
         
-    :param utc: time 
-    :type utc: iso-formated string
+    :param utc: time in seconds since epoch (an iso-formated string is also accepted,
+                but requires a slow conversion)
+    :type utc: float or str
     :param ra: right ascension, in hours
     :type ra: float
     :param dec: declination, in degrees
@@ -43,33 +66,24 @@ def stc_encode(utc, ra, dec):
         - dec_int (4B): value in range -1073741824 to +1073741824
         - status  (4B): status, 0 means ok
 
-    >>> data = stc_encode(utc='2022-11-17T16:14:58.967345+00:00', ra=16.0, dec=70.0)
+    >>> data = stc_encode(utc=1668701698.967345, ra=16.0, dec=70.0)
     
     """
         
-    "convert ISO utc time into timestamp (microseconds since epoch)"
-    utc = Time(utc, format='iso')
-    timestamp = int(1e6*utc.unix)
+    "convert utc time into timestamp (microseconds since epoch)"
+    if isinstance(utc, str):
+        utc = Time(utc, format='iso').unix
+    timestamp = int(1e6*utc)
         
     "convert ra and dec into integer representation"
-    ra_int = int(ra*2147483648/12.0)
+    ra_int = int(ra*2147483648/12.0) % 4294967296
     dec_int = int(dec*1073741824/90.0)
 
-    size = 24
-    mtype = 0
-    status = 0
-
     "create and pack the bytearray"
-    data = bytearray(24)
-    data[ 0: 2] = int(size).to_bytes(2, 'little')
-    data[ 2: 4] = int(mtype).to_bytes(2, 'little')
-    data[ 4:12] = int(timestamp).to_bytes(8, 'little')
-    data[12:16] = ra_int.to_bytes(4, 'little')
-    data[16:20] = dec_int.to_bytes(4, 'little', signed=True)
-    data[20:24] = int(status).to_bytes(4, 'little')     
+    data = bytearray(STC_POSITION.size)
+    STC_POSITION.pack_into(data, 0, STC_POSITION.size, 0, timestamp, ra_int, dec_int, 0)
 
-    logging.debug('stc_encode: %s %s %s %s %s %s' % (size, mtype, timestamp, ra_int, dec_int, status))
-    logging.debug('stc_encode: %s' % str(data))
+    logging.debug('stc_encode: %s %s %s', timestamp, ra_int, dec_int)
 
     return data
 
@@ -82,8 +96,8 @@ def stc_decode(data):
     :param data: data read from Stellarium socket
     :type data: bytes
         
-    :return: (utc, ra, dec)
-    :rtype: list(str, float, float)
+    :return: (utc, ra, dec), with utc in seconds since epoch
+    :rtype: list(float, float, float)
         
     The message is 20B composed of:
         - size    (2B): should be 20
@@ -95,45 +109,98 @@ def stc_decode(data):
     """
     
     "Unpack the bytearray"
-    size    = int.from_bytes(data[ 0: 2], 'little')
-    mtype   = int.from_bytes(data[ 2: 4], 'little')
-    time    = int.from_bytes(data[ 4:12], 'little')
-    ra_int  = int.from_bytes(data[12:16], 'little')
-    dec_int = int.from_bytes(data[16:20], 'little', signed=True)
+    size, mtype, time, ra_int, dec_int = STC_GOTO.unpack_from(data)
 
-    logging.debug('stc_decode: %s' % str(data))
-    logging.debug('stc_decode: %s %s %s %s %s' % (size, mtype, time, ra_int, dec_int))
+    logging.debug('stc_decode: %s %s %s %s %s', size, mtype, time, ra_int, dec_int)
         
-    "The time is microseconds since epoch, convert it to utc"
-    utc = Time(time/1e6, format='unix').iso
+    "The time is microseconds since epoch"
+    utc = time/1e6
         
     "Now convert the ra_int and dec_int into angles"
     ra = ra_int*12.0/2147483648    # in hours
     dec = dec_int*90.0/1073741824  # in deg
-    if dec > 180:
-        dec -= 360
 
     return utc, ra, dec
 
 
+def rpc_session(pool=8, retries=3, backoff=0.2):
+    """
+    Create a :mod:`requests` session for the Remote Control plugin: the connections
+    are kept alive and pooled, and the failed requests are retried.
+
+    :param pool: max number of connections kept alive, optional
+    :type pool: int
+    :param retries: max number of retries of a request, optional
+    :type retries: int
+    :param backoff: backoff factor of the retries in seconds, optional
+    :type backoff: float
+
+    :return: the session
+    :rtype: :obj:`requests.Session`
+    """
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RPC_RETRY_STATUSES,
+                  allowed_methods=('GET',), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
 class StellariumRPC(object):
     """
     Handles interactions with the Stellarium Remote Control plugin.
     
     :param api_url: url of rpc api, defaults to 'http://localhost:8090/api'
     :type api_url: str or None
+    :param session: the session used for all the requests, optional (default is a
+                    :func:`rpc_session`)
+    :type session: :obj:`requests.Session` or None
+    :param timeout: timeout of a request in seconds, optional
+    :type timeout: float
     
     >>> rpc = StellariumRPC()
+    >>> info = rpc.get_object_info('Polaris')
     
     """
     
     DEFAULT_API_URL = 'http://localhost:8090/api'
     
-    def __init__(self, api_url=DEFAULT_API_URL):
+    def __init__(self, api_url=DEFAULT_API_URL, session=None, timeout=5):
         self.api_url = api_url
+        self.session = session or rpc_session()
+        self.timeout = timeout
         
         self.action_id = -2
         self.prop_id = -2
+
+    def get(self, path, **params):
+        """
+        GET a JSON document from the api.
+
+        :param path: path of the request, e.g. '/objects/info'
+        :type path: str
+        :param params: query parameters
+
+        :return: the decoded document
+        :rtype: dict or list
+        """
+        response = self.session.get(self.api_url + path, params=params or None, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def post(self, path, **data):
+        """
+        POST a form to the api.
+
+        :param path: path of the request, e.g. '/main/focus'
+        :type path: str
+        :param data: form fields
+
+        :return: the response
+        :rtype: :obj:`requests.Response`
+        """
+        return self.session.post(self.api_url + path, data=data, timeout=self.timeout)
         
     def get_status(self):
         """
@@ -143,8 +210,7 @@ class StellariumRPC(object):
         :rtype: dict
         
         """
-        url = self.api_url + "/main/status?propId=" + str(self.prop_id) + "&actionId=" + str(self.action_id)
-        contents = requests.get(url).json()
+        contents = self.get("/main/status", propId=self.prop_id, actionId=self.action_id)
         self.prop_id = contents['propertyChanges']['id']
         self.action_id = contents['actionChanges']['id']
         return contents
@@ -157,8 +223,43 @@ class StellariumRPC(object):
         :rtype: dict
         
         """
-        url = self.api_url + "/objects/info"
-        return requests.get(url, params={'format': 'json'}).json()
+        return self.get("/objects/info", format='json')
+
+    def get_object_info(self, name):
+        """
+        Get info on an object
+            
+        :param name: name of the object
+        :type name: str
+
+        :return: alot of info
+        :rtype: dict
+        
+        """
+        return self.get("/objects/info", name=name, format='json')
+
+    def get_object_types(self):
+        """
+        Get the types of objects known to Stellarium
+            
+        :return: the types, with their 'key' and 'name'
+        :rtype: list(dict)
+        
+        """
+        return self.get("/objects/listobjecttypes")
+
+    def get_objects(self, obj_type):
+        """
+        Get the names of the objects of a type
+            
+        :param obj_type: key of the type, see :meth:`get_object_types`
+        :type obj_type: str
+
+        :return: the english names
+        :rtype: list(str)
+        
+        """
+        return self.get("/objects/listobjectsbytype", type=obj_type, english=1)
 
     def get_utc(self):
         """
@@ -210,8 +311,7 @@ class StellariumRPC(object):
         :rtype: bool
 
         """
-        url = self.api_url + "/main/focus"
-        return requests.post(url, data={'target': target})
+        return self.post("/main/focus", target=target)
 
     def set_time_to_now(self):
         """
@@ -221,17 +321,136 @@ class StellariumRPC(object):
         :rtype: bool
 
         """
-        url = self.api_url + "/stelaction/do"
-        return requests.post(url, data={'id': 'actionReturn_To_Current_Time'}).text
+        return self.post("/stelaction/do", id='actionReturn_To_Current_Time').text
 
     def list_actions(self):
-        url = self.api_url + "/stelaction/list"
-        return requests.get(url).json()
+        return self.get("/stelaction/list")
+
+
+class STCClient(object):
+    """
+    A connection with a Stellarium Telescope Control (STC) client, with a bounded
+    send buffer: when the client does not keep up, the oldest positions are dropped.
+
+    :param sock: the connected socket, set non-blocking (None when the connection is
+                 handled by :mod:`asyncio`)
+    :type sock: :obj:`socket.socket` or None
+    :param address: address of the client
+    :type address: tuple
+    :param max_frames: number of frames kept in the send buffer, optional
+    :type max_frames: int
+
+    >>> client = STCClient(conn, address)
+    >>> client.queue(stc_encode(utc, ra, dec))
+    >>> client.flush()
+    >>> gotos = client.receive()
+    """
+
+    def __init__(self, sock, address, max_frames=32):
+        self.sock = sock
+        self.address = address
+        self.frames = deque(maxlen=max(int(max_frames), 1))
+        self.out = None
+        self.inbuf = bytearray()
+        self.dropped = 0
+        if sock is not None:
+            sock.setblocking(False)
+            if sock.family in (socket.AF_INET, socket.AF_INET6):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    @property
+    def pending(self):
+        """
+        True when there are frames waiting to be sent.
+        """
+        return self.out is not None or len(self.frames) > 0
+
+    def queue(self, frame):
+        """
+        Add a frame to the send buffer, dropping the oldest one if it is full.
+
+        :param frame: the encoded frame
+        :type frame: bytes
+        """
+        if len(self.frames) == self.frames.maxlen:
+            self.dropped += 1
+        self.frames.append(frame)
+
+    def flush(self):
+        """
+        Send as much of the buffer as the socket takes without blocking. A frame that is
+        partially sent is always completed, so that the stream stays aligned.
+
+        :return: False if the connection is lost
+        :rtype: bool
+        """
+        while True:
+            if self.out is None:
+                if not self.frames:
+                    return True
+                self.out = memoryview(self.frames.popleft())
+            try:
+                n = self.sock.send(self.out)
+            except (BlockingIOError, InterruptedError):
+                return True
+            except OSError:
+                return False
+            self.out = self.out[n:] if n < len(self.out) else None
+
+    def receive(self):
+        """
+        Read the available data and decode the complete 'Goto' messages.
+
+        :return: list of (utc, ra, dec), see :func:`stc_decode`, or None if the connection is closed
+        :rtype: list or None
+        """
+        try:
+            data = self.sock.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return []
+        except OSError:
+            return None
+        if not data:
+            return None
+        return self.decode(data)
+
+    def decode(self, data):
+        """
+        Buffer received data and decode the complete 'Goto' messages, other messages are skipped.
+
+        :param data: data read from the client
+        :type data: bytes
+
+        :return: list of (utc, ra, dec), see :func:`stc_decode`
+        :rtype: list
+        """
+        self.inbuf.extend(data)
+        gotos = []
+        while len(self.inbuf) >= 2:
+            "every message starts with its size"
+            size = max(struct.unpack_from('<H', self.inbuf)[0], 2)
+            if len(self.inbuf) < size:
+                break
+            if size == STC_GOTO.size:
+                gotos.append(stc_decode(self.inbuf))
+            del self.inbuf[:size]
+        return gotos
+
+    def close(self):
+        """
+        Close the connection.
+        """
+        if self.sock is not None:
+            self.sock.close()
+        logging.debug('disconnected from Stellarium %s (%d frames dropped)' % (self.address, self.dropped))
 
 
 class StellariumTC(threading.Thread):
     """
     Handles communications with the Stellarium Telescope Control (STC) over a tcp socket.
+    Any number of STC clients (e.g. Stellarium on a second screen or a tablet) can be
+    connected: every position is encoded once and sent to all of them, and a 'Goto'
+    from any of them is published.
     
     :param stel_host: host on which Stellarium is running
     :type stel_host: str
@@ -243,18 +462,38 @@ class StellariumTC(threading.Thread):
     :type calib_pub_address: str in form 'tcp://127.0.0.1:10001'
     :param ctx: the :mod:`zmq` context, optional
     :type ctx: :obj:`zmq.Context` or None
+    :param calib_pub_format: wire format of the calibration data, optional
+    :type calib_pub_format: str
+    :param monitor: records the time spent in every stage, optional
+    :type monitor: :obj:`pushto.monitoring.Monitor` or None
+    :param max_frames: number of frames buffered for a client that does not keep up, optional
+    :type max_frames: int
+    :param predictor: compensates the latency of the positions, optional
+    :type predictor: :obj:`pushto.prediction.Predictor` or None
+    :param rate: rate in Hz of the positions sent between the samples, with a predictor, optional
+    :type rate: float
 
     >>> stel = StellariumTC('localhost', 10002, 'tcp://127.0.0.1:10012', 'tcp://127.0.0.1:10013')
-    >>> stel.handshake()
     >>> stel.start()
     >>> stel.close()
+
+    Starting does not wait for Stellarium: the positions go to nobody until a client
+    connects, and a client that goes away (e.g. Stellarium is restarted) is dropped
+    and accepted again when it reconnects, without touching the rest of the pipeline.
+    :meth:`handshake` waits for a first client, if needed.
+
+    With a predictor, every sample is sent at the position predicted for the time it
+    is sent, and with a rate, positions are also sent between the samples, without
+    any transformation upstream.
     
     .. note::
 
-       RAW: connection to Stellarium
+       RAW: connections to Stellarium, all served by one poller
     
        - can send MoveTo commands with RA/Dec
        - can receive SlewTo commands with RA/Dec (requires pushing the button within Stellarium)
+       - every client has its own bounded send buffer, a slow client loses its oldest
+         positions instead of stalling the others
     
        SUB: connection to control
     
@@ -266,7 +505,8 @@ class StellariumTC(threading.Thread):
 
     """
 
-    def __init__(self, stel_host, stel_port, data_sub_address, calib_pub_address, ctx=None):
+    def __init__(self, stel_host, stel_port, data_sub_address, calib_pub_address, ctx=None,
+                 calib_pub_format='json', monitor=None, max_frames=32, predictor=None, rate=0):
         super().__init__(daemon=True, name='stellarium')
         
         "configure the raw socket"
@@ -274,13 +514,21 @@ class StellariumTC(threading.Thread):
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self.sock.bind(self.serverAddress)
-        self.sock.settimeout(600)  # Throws a timeout exception if connections are idle for 10 minutes
-        self.sock.listen(1)        # set the socket to listen, now it's a server!
-        self.connection = None
+        self.sock.listen(STC_BACKLOG)  # set the socket to listen, now it's a server!
+        self.sock.setblocking(False)
+        self.max_frames = max_frames
+        self.clients = {}
+        self.writing = set()
+        self.poller = zmq.Poller()
+        self.predictor = predictor
+        self.interval = 1/rate if rate and predictor is not None else None
+        self.next_tick = None
 
         "configure the zmq sockets"
         self.data_sub_address = data_sub_address
         self.calib_pub_address = calib_pub_address
+        self.calib_pub_format = calib_pub_format
+        self.monitor = monitor
         self.ctx = ctx
         if self.ctx is None:
             self.ctx = zmq.Context()
@@ -291,19 +539,119 @@ class StellariumTC(threading.Thread):
         self.calib_pub_socket = self.ctx.socket(zmq.PUB)
         self.calib_pub_socket.bind(self.calib_pub_address)
 
-    def handshake(self):
+    def handshake(self, timeout=600):
         """
-        Establish a connection with the STC.
+        Wait for a first connection with the STC, the following ones are accepted while running.
+
+        :param timeout: time in seconds to wait, optional
+        :type timeout: float
         """
+        logging.debug('attempting handshake')
+        self.sock.settimeout(timeout)
         try:
-            while True:
-                logging.debug('attempting handshake')
-                self.connection, clientAddress = self.sock.accept()
-                if self.connection is not None:
-                    logging.debug('connected to Stellarium')
-                    break
+            self.add_client(*self.sock.accept())
+            logging.debug('connected to Stellarium')
         except Exception as e:
             logging.error("failed handshake with Stellarium: %s" % e)
+        finally:
+            self.sock.setblocking(False)
+
+    def add_client(self, conn, address):
+        """
+        Serve a new STC client.
+
+        :param conn: the connected socket
+        :type conn: :obj:`socket.socket`
+        :param address: address of the client
+        :type address: tuple
+        """
+        client = STCClient(conn, address, self.max_frames)
+        self.clients[conn.fileno()] = client
+        self.poller.register(conn.fileno(), zmq.POLLIN)
+        logging.info('Stellarium connected from %s:%s (%d clients)' % (address[0], address[1], len(self.clients)))
+
+    def remove_client(self, client):
+        """
+        Stop serving an STC client.
+
+        :param client: the client
+        :type client: :obj:`STCClient`
+        """
+        fd = client.sock.fileno()
+        self.poller.unregister(fd)
+        del self.clients[fd]
+        self.writing.discard(fd)
+        client.close()
+        logging.info('Stellarium disconnected from %s:%s (%d clients)' % (client.address[0], client.address[1],
+                                                                          len(self.clients)))
+
+    def accept(self):
+        """
+        Accept all the pending connections.
+        """
+        while True:
+            try:
+                conn, address = self.sock.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logging.error('failed to accept Stellarium: %s' % e)
+                return
+            self.add_client(conn, address)
+
+    def broadcast(self, data):
+        """
+        Send a frame to every client, buffering what can't be sent right away.
+
+        :param data: the encoded frame
+        :type data: bytes
+        """
+        for client in list(self.clients.values()):
+            client.queue(data)
+            self.flush(client)
+
+    def flush(self, client):
+        """
+        Send the buffer of a client, and watch its socket for writing while frames are pending.
+
+        :param client: the client
+        :type client: :obj:`STCClient`
+        """
+        if not client.flush():
+            self.remove_client(client)
+            return
+        fd = client.sock.fileno()
+        if client.pending != (fd in self.writing):
+            if client.pending:
+                self.writing.add(fd)
+                self.poller.modify(fd, zmq.POLLIN | zmq.POLLOUT)
+            else:
+                self.writing.discard(fd)
+                self.poller.modify(fd, zmq.POLLIN)
+
+    def timeout(self):
+        """
+        Time in ms until the next position is due between the samples.
+
+        :return: the timeout of the poller, None to wait for the next sample
+        :rtype: float or None
+        """
+        if self.interval is None or self.next_tick is None or not self.clients:
+            return None
+        return max(0.0, 1000*(self.next_tick - time.monotonic()))
+
+    def tick(self):
+        """
+        Send the predicted position if it is due, and the samples are not stale.
+        """
+        now = time.monotonic()
+        if self.next_tick is None or now < self.next_tick:
+            return
+        if self.predictor.stale():
+            self.next_tick = None
+            return
+        self.next_tick = now + self.interval
+        self.broadcast(bytes(stc_encode(*self.predictor.position())))
 
     def close(self):
         """
@@ -311,8 +659,12 @@ class StellariumTC(threading.Thread):
         """
         self.data_sub_socket.close(linger=1)
         self.calib_pub_socket.close(linger=1)
-        self.connection.close()
+        for client in list(self.clients.values()):
+            client.close()
+        self.clients = {}
         self.sock.close()
+        if self.monitor is not None:
+            self.monitor.close()
         logging.debug('disconnected from Stellarium')
         
     def run(self):
@@ -324,36 +676,71 @@ class StellariumTC(threading.Thread):
         "connect the SUB socket"
         self.data_sub_socket.connect(self.data_sub_address)
         
-        "setup the poller to listen to the SUB and RAW sockets for input"
-        poller = zmq.Poller()
-        poller.register(self.data_sub_socket, zmq.POLLIN)
-        poller.register(self.connection.fileno(), zmq.POLLIN)
+        "setup the poller to listen to the SUB, the server and the client sockets"
+        self.poller.register(self.data_sub_socket, zmq.POLLIN)
+        self.poller.register(self.sock.fileno(), zmq.POLLIN)
 
         while True:
             "Poll the poller for incoming messages"
-            socks = dict(poller.poll())
+            socks = dict(self.poller.poll(self.timeout()))
             if self.data_sub_socket in socks:
-                data_msg = self.data_sub_socket.recv_json()
-                msg = Message.from_json(data_msg)
+                t0 = time.perf_counter()
+                msg = recv_message(self.data_sub_socket)
+                t1 = time.perf_counter()
                 logging.debug('SUB: %s' % msg)
-                if msg.type == 'DATA':
-                    data = stc_encode(msg.time, msg.ra, msg.dec)
-                    self.connection.send(data)
+                if msg.type == 'DATA' and not self.clients:
+                    "nobody is connected yet, or any more"
+                    pass
+                elif msg.type == 'DATA':
+                    "encode once, send to every client"
+                    if self.predictor is None:
+                        data = bytes(stc_encode(msg.time, msg.ra, msg.dec))
+                    else:
+                        data = bytes(stc_encode(*self.predictor.handle(msg)))
+                        if self.interval is not None:
+                            self.next_tick = time.monotonic() + self.interval
+                    t2 = time.perf_counter()
+                    self.broadcast(data)
+                    if self.monitor is not None:
+                        now = time.time()
+                        self.monitor.record('td_eq_recv', t1 - t0)
+                        self.monitor.record('stc_encode', t2 - t1)
+                        self.monitor.record('stc_send', time.perf_counter() - t2)
+                        if msg.utc:
+                            self.monitor.record('age_td_eq', now - msg.time)
+                        self.monitor.tick(now)
                 elif msg.type == 'CMD':
                     if msg.cmd == 'stop':
                         "shut it down"
                         self.close()
                         return
 
-            if self.connection.fileno() in socks:
-                "decode the data, this will only be a 'slew to'"
-                data = self.connection.recv(640)
-                utc, ra, dec = stc_decode(data)
+            if self.interval is not None and self.clients:
+                self.tick()
+
+            if self.sock.fileno() in socks:
+                self.accept()
 
-                "publish alignment data"
-                msg = AlignMessage(time=utc, ra=ra, dec=dec)
-                logging.debug('PUB: %s' % msg.to_json())
-                self.calib_pub_socket.send_json(msg.to_json())
+            "the poller returns the file descriptors of the raw sockets"
+            for fd, client in list(self.clients.items()):
+                event = socks.get(fd, 0)
+                if event & zmq.POLLOUT:
+                    self.flush(client)
+                    if fd not in self.clients:
+                        continue
+                if event & zmq.POLLIN:
+                    "decode the data, this will only be a 'slew to'"
+                    gotos = client.receive()
+                    if gotos is None:
+                        self.remove_client(client)
+                        continue
+                    for utc, ra, dec in gotos:
+                        "publish alignment data"
+                        msg = AlignMessage(time=utc, ra=ra, dec=dec)
+                        logging.debug('PUB: %s' % msg.to_json())
+                        send_message(self.calib_pub_socket, msg, self.calib_pub_format)
+                if event & zmq.POLLERR:
+                    self.remove_client(client)
 
     @classmethod
     def setup(cls, cfg, ctx=None):
@@ -368,18 +755,222 @@ class StellariumTC(threading.Thread):
         :return: the stellarium TC
         :rtype: :obj:`StellariumTC`
         """        
-        control_pub_address = "tcp://%s:%s" % (cfg.get_host_ip(), cfg.get_td_eq_port())
-        stellar_pub_address = "tcp://%s:%s" % (cfg.get_host_ip(), cfg.get_pd_eq_port())
+        control_pub_address = cfg.get_address('td_eq')
+        stellar_pub_address = cfg.get_address('pd_eq')
 
         return StellariumTC(stel_host=cfg.get_host_ip(),
                             stel_port=cfg.get_stc_port(),
                             data_sub_address=control_pub_address,
                             calib_pub_address=stellar_pub_address,
-                            ctx=ctx)
+                            ctx=ctx,
+                            calib_pub_format=cfg.get_pd_eq_format(),
+                            monitor=Monitor.setup(cfg, 'stellarium', ctx),
+                            max_frames=cfg.get_stc_buffer(),
+                            predictor=Predictor.setup(cfg),
+                            rate=cfg.get_stc_rate())
+
+
+class AsyncStellariumTC(object):
+    """
+    Serves the Stellarium Telescope Control (STC) from an :mod:`asyncio` event loop.
+    
+    The telescope position is written with :meth:`send` to every connected client, and
+    every 'Goto' received from any of them is passed as an :class:`pushto.messages.AlignMessage`
+    to on_goto. Every client is written by its own task from a bounded buffer, a slow
+    client loses its oldest positions instead of stalling the others.
+    With a predictor and a rate, a task writes the predicted positions between the samples.
+
+    :param stel_host: host on which Stellarium is running
+    :type stel_host: str
+    :param stel_port: port on which STC will connect
+    :type stel_port: int
+    :param on_goto: receives the alignment messages, optional
+    :type on_goto: callable or None
+    :param monitor: records the time spent in every stage, optional
+    :type monitor: :obj:`pushto.monitoring.Monitor` or None
+    :param max_frames: number of frames buffered for a client that does not keep up, optional
+    :type max_frames: int
+    :param predictor: compensates the latency of the positions, optional
+    :type predictor: :obj:`pushto.prediction.Predictor` or None
+    :param rate: rate in Hz of the positions sent between the samples, with a predictor, optional
+    :type rate: float
+
+    >>> stel = AsyncStellariumTC('localhost', 10002, on_goto=site.handle_align)
+    >>> await stel.start()
+    >>> stel.send(msg)
+    >>> await stel.close()
+    """
+
+    def __init__(self, stel_host, stel_port, on_goto=None, monitor=None, max_frames=32, predictor=None, rate=0):
+        self.serverAddress = (stel_host, stel_port)
+        self.on_goto = on_goto
+        self.monitor = monitor
+        self.max_frames = max_frames
+        self.predictor = predictor
+        self.interval = 1/rate if rate and predictor is not None else None
+        self.ticker = None
+        self.sample = asyncio.Event()
+        self.server = None
+        self.clients = {}
+        self.tasks = set()
+
+    async def start(self):
+        """
+        Start listening for the STC.
+        """
+        self.server = await asyncio.start_server(self.handle_client, *self.serverAddress, reuse_address=True)
+        if self.interval is not None:
+            self.ticker = asyncio.create_task(self.tick())
+        logging.debug('listening for Stellarium on %s:%s' % self.serverAddress)
+
+    async def handle_client(self, reader, writer):
+        """
+        Handle a connection with the STC, until it is closed.
+        """
+        client = STCClient(None, writer.get_extra_info('peername'), self.max_frames)
+        ready = asyncio.Event()
+        "keep the frames in the bounded buffer rather than in the transport"
+        writer.transport.set_write_buffer_limits(high=4*STC_POSITION.size)
+        self.clients[client] = (writer, ready)
+        task = asyncio.current_task()
+        self.tasks.add(task)
+        sender = asyncio.create_task(self.write_client(client, writer, ready))
+        logging.info('Stellarium connected from %s (%d clients)' % (client.address, len(self.clients)))
+        try:
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    break
+                for utc, ra, dec in client.decode(data):
+                    msg = AlignMessage(time=utc, ra=ra, dec=dec)
+                    logging.debug('GOTO: %s' % msg.to_json())
+                    if self.on_goto is not None:
+                        self.on_goto(msg)
+        except ConnectionError:
+            pass
+        finally:
+            del self.clients[client]
+            self.tasks.discard(task)
+            sender.cancel()
+            writer.close()
+            client.close()
+
+    async def write_client(self, client, writer, ready):
+        """
+        Write the buffered frames of a client, waiting for the connection to drain.
+        """
+        try:
+            while True:
+                await ready.wait()
+                ready.clear()
+                while client.frames:
+                    writer.write(client.frames.popleft())
+                    await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+    async def tick(self):
+        """
+        Write the predicted positions between the samples, while they are not stale.
+        """
+        while True:
+            await self.sample.wait()
+            self.sample.clear()
+            while not self.predictor.stale():
+                try:
+                    await asyncio.wait_for(self.sample.wait(), self.interval)
+                    "a new sample restarts the interval"
+                    self.sample.clear()
+                except asyncio.TimeoutError:
+                    if self.clients:
+                        self.broadcast(bytes(stc_encode(*self.predictor.position())))
+
+    def broadcast(self, data):
+        """
+        Write a frame to every connected STC client, buffering what can't be written right away.
+
+        :param data: the encoded frame
+        :type data: bytes
+        """
+        for client, (writer, ready) in self.clients.items():
+            if not client.frames and writer.transport.get_write_buffer_size() == 0:
+                writer.write(data)
+            else:
+                client.queue(data)
+                ready.set()
+
+    def send(self, msg):
+        """
+        Write the position of a DATA message to every connected STC client.
+
+        :param msg: data message with time, ra and dec
+        :type msg: :obj:`pushto.messages.DataMessage`
+        """
+        if not self.clients:
+            return
+        t0 = time.perf_counter()
+        if self.predictor is None:
+            data = bytes(stc_encode(msg.time, msg.ra, msg.dec))
+        else:
+            data = bytes(stc_encode(*self.predictor.handle(msg)))
+            self.sample.set()
+        t1 = time.perf_counter()
+        self.broadcast(data)
+        if self.monitor is not None:
+            now = time.time()
+            self.monitor.record('stc_encode', t1 - t0)
+            self.monitor.record('stc_send', time.perf_counter() - t1)
+            if msg.utc:
+                self.monitor.record('age_td_eq', now - msg.time)
+            self.monitor.tick(now)
+
+    async def close(self):
+        """
+        Close the connections and stop listening.
+        """
+        "closing the server stops accepting, closing the connections ends their handlers"
+        if self.server is not None:
+            self.server.close()
+        if self.ticker is not None:
+            self.ticker.cancel()
+            self.ticker = None
+        tasks = list(self.tasks)
+        for writer, _ in list(self.clients.values()):
+            writer.close()
+        if tasks:
+            await asyncio.wait(tasks, timeout=1)
+        if self.server is not None:
+            await self.server.wait_closed()
+            self.server = None
+        if self.monitor is not None:
+            self.monitor.close()
+        logging.debug('stopped listening for Stellarium')
+
+    @classmethod
+    def setup(cls, cfg, on_goto=None, ctx=None):
+        """
+        Convenience method for creating an AsyncStellariumTC object based on a Configuration object
+        
+        :param cfg: the configuration object to use
+        :type cfg: :obj:`Configuration`
+        :param on_goto: receives the alignment messages, optional
+        :type on_goto: callable or None
+        :param ctx: the zmq context of the monitoring, optional
+        :type ctx: :obj:`zmq.Context` or None
+
+        :return: the stellarium TC
+        :rtype: :obj:`AsyncStellariumTC`
+        """
+        return AsyncStellariumTC(stel_host=cfg.get_host_ip(),
+                                 stel_port=cfg.get_stc_port(),
+                                 on_goto=on_goto,
+                                 monitor=Monitor.setup(cfg, 'stellarium', ctx),
+                                 max_frames=cfg.get_stc_buffer(),
+                                 predictor=Predictor.setup(cfg),
+                                 rate=cfg.get_stc_rate())
 
    
 if __name__ == '__main__':
-    import time
     from pushto.config import Configuration
     from pushto.messages import DataMessage, CmdMessage
 
@@ -394,8 +985,8 @@ if __name__ == '__main__':
     ctx = zmq.Context()
     stc = StellariumTC.setup(cfg, ctx)
 
-    data_sub_address = "tcp://%s:%s" % (cfg.get_host_ip(), cfg.get_td_eq_port())
-    calib_pub_address = "tcp://%s:%s" % (cfg.get_host_ip(), cfg.get_pd_eq_port())
+    data_sub_address = cfg.get_address('td_eq')
+    calib_pub_address = cfg.get_address('pd_eq')
     
     data_pub_socket = ctx.socket(zmq.PUB)
     data_pub_socket.bind(data_sub_address)
@@ -406,7 +997,6 @@ if __name__ == '__main__':
     poller.register(calib_sub_socket, zmq.POLLIN)
     poller.register(data_pub_socket, zmq.POLLOUT)
     
-    stc.handshake()
     stc.start()
     
     try:
@@ -416,8 +1006,7 @@ if __name__ == '__main__':
         
             socks = dict(poller.poll())
             if data_pub_socket in socks:
-                utc = Time.now().iso
-                msg = DataMessage(time=utc, ra=RA, dec=Dec)
+                msg = DataMessage(time=time.time(), ra=RA, dec=Dec, utc=True)
                 logging.info("Sending: %s" % msg.to_json())
                 data_pub_socket.send_json(msg.to_json())
                 time.sleep(0.5)
@@ -425,8 +1014,7 @@ if __name__ == '__main__':
                 RA = RA % 24
             
             if calib_sub_socket in socks:
-                data = calib_sub_socket.recv_json()
-                msg = Message.from_json(data)
+                msg = recv_message(calib_sub_socket)
                 logging.info("Receiving: %s" % msg)
 
     except KeyboardInterrupt:
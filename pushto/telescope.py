@@ -4,38 +4,168 @@ Interface to telescope
     - Handles communication with Arduino connected to serial port, using the :mod:`pyserial` package to create a
       threaded serial reader
     - Transforms data from encoder counts to raw telescope attitude to corrected telescope attitude
+    - Optionally smooths the encoder counts, see :mod:`pushto.smoothing`
     - Publishes data to a :mod:`zmq` PUB socket
 
 Provides:
     - Encoders
     - PointingModel
+    - CorrectionGrid
+    - SerialHandler
     - Telescope
+    - frame_encode, frame_decode
 
 """
 import sys
+import time
+import struct
+import asyncio
 import logging
+from binascii import crc_hqx
 #
 import numpy as np
 import serial
 import serial.threaded
 import zmq
 #
-from pushto.messages import DataMessage, CmdMessage
+from pushto.clock import ClockSync
+from pushto.monitoring import Monitor
+from pushto.smoothing import AttitudeFilter
+from pushto.session import SessionWriter, SessionReader, SessionReplay, ReplayClock
+from pushto.messages import DataMessage, CmdMessage, send_message, send_messages
+
+"Longest partial line kept while waiting for its terminator, in bytes"
+MAX_PARTIAL = 4096
+
+"Approximate transmission time of a data line, in bits (~25 bytes of 10 bits)"
+LINE_BITS = 250
+
+"Binary frames of the Arduino: sync word, micros(), counts and error counts, CRC-16"
+FRAME_SYNC = b'\xa5\x5a'
+FRAME = struct.Struct('<2sIiiHHH')
+FRAME_BITS = 10*FRAME.size
+
+"Terms of the pointing model, in the order used by the configuration"
+PM_TERMS = ('ia', 'ie', 'an', 'aw', 'ca', 'npae', 'tx', 'tf')
+
+
+def frame_encode(micros, phi_cnt, theta_cnt, phi_err, theta_err):
+    """
+    Encode a binary frame, as written by the Arduino sketch.
+
+    :param micros: Arduino micros() value
+    :type micros: int
+    :param phi_cnt: count of azimuthal encoder
+    :type phi_cnt: int
+    :param theta_cnt: count of polar encoder
+    :type theta_cnt: int
+    :param phi_err: error count of azimuthal encoder
+    :type phi_err: int
+    :param theta_err: error count of polar encoder
+    :type theta_err: int
+
+    :return: encoded frame
+    :rtype: bytes
+
+    The frame is 20B, little-endian, composed of:
+        - sync      (2B): 0xa5 0x5a
+        - micros    (4B): unsigned
+        - phi_cnt   (4B): signed
+        - theta_cnt (4B): signed
+        - phi_err   (2B): unsigned, wraps
+        - theta_err (2B): unsigned, wraps
+        - crc       (2B): CRC-16/CCITT (polynomial 0x1021, initial value 0xffff) of the first 18B
+
+    >>> data = frame_encode(1234567, -548, 870, 0, 0)
+    """
+    data = bytearray(FRAME.size)
+    FRAME.pack_into(data, 0, FRAME_SYNC, micros % 2**32, phi_cnt, theta_cnt, phi_err % 2**16, theta_err % 2**16, 0)
+    struct.pack_into('<H', data, FRAME.size - 2, crc_hqx(data[:-2], 0xffff))
+    return bytes(data)
+
+
+def frame_decode(data):
+    """
+    Decode the binary frames of a buffer. Bytes that are not part of a valid frame
+    (e.g. text from the sketch, or frames garbled by noise) are skipped, resynchronizing
+    on the next sync word.
+
+    :param data: data read from the serial port
+    :type data: bytes or bytearray
+
+    :return: the frames as (micros, phi_cnt, theta_cnt, phi_err, theta_err) tuples, the
+             number of bytes consumed (a partial frame at the end is not), the number of
+             bytes skipped and the number of frames with a bad CRC
+    :rtype: tuple(list, int, int, int)
+    """
+    rows = []
+    pos = 0
+    skipped = 0
+    bad = 0
+    size = FRAME.size
+    n = len(data)
+    with memoryview(data) as view:
+        while True:
+            i = data.find(FRAME_SYNC, pos)
+            if i < 0:
+                "keep a last byte that may be the start of a sync word"
+                end = n - 1 if n > pos and data[n - 1] == FRAME_SYNC[0] else n
+                skipped += end - pos
+                pos = end
+                break
+            skipped += i - pos
+            if n - i < size:
+                pos = i
+                break
+            frame = FRAME.unpack_from(data, i)
+            if crc_hqx(view[i:i + size - 2], 0xffff) == frame[6]:
+                rows.append(frame[1:6])
+                pos = i + size
+            else:
+                bad += 1
+                skipped += 1
+                pos = i + 1
+    return rows, pos, skipped, bad
 
 
 class SerialHandler(serial.threaded.LineReader):
     """
-    This class is used to handle serial data encoded as utf-8 and terminated with \r\n.
+    This class is used to handle serial data encoded as utf-8 and terminated with \r\n,
+    or binary frames (see :func:`frame_encode`) if the protocol is 'binary'.
+    All the complete lines or frames of a serial read are handled at once, as a batch.
     It uses an Encoders object and a PointingModel object to translate encoder counts
-    into telescope attitude and then publishes the results.
+    into telescope attitude and then publishes the results in the given wire format.
+    If a ClockSync object is given, the Arduino time stamps are converted into the
+    acquisition time in seconds since epoch, otherwise they are passed through.
+    If a Monitor object is given, the time spent in every stage is recorded.
+    If a SessionWriter object is given, every raw line is captured with its arrival
+    time, as given by now (:func:`time.time` unless replaying a session), and flushed
+    after every read.
+    If a sink is given, the data messages are passed to it instead of being published,
+    e.g. by :class:`pushto.runtime.AsyncRuntime` which runs every stage in one event loop.
+    If a command is given, it is written to the Arduino when the port is opened, and
+    again when the binary stream is lost (e.g. the Arduino was reset to its defaults).
+    If an AttitudeFilter object is given, the encoder counts are smoothed before they
+    are converted, and the angular velocities of the axes are published with the attitude.
     """
 
-    def __init__(self, enc, pm, pub_address, ctx):
+    def __init__(self, enc, pm, pub_address, ctx, fmt='json', clock=None, monitor=None, capture=None,
+                 now=time.time, sink=None, protocol='text', command=b'', smoother=None):
         super().__init__()
         self.enc = enc
         self.pm = pm
         self.pub_address = pub_address
         self.ctx = ctx
+        self.fmt = fmt
+        self.clock = clock
+        self.monitor = monitor
+        self.capture = capture
+        self.now = now
+        self.sink = sink
+        self.protocol = protocol
+        self.command = command
+        self.command_time = None
+        self.smoother = smoother
         self.pubs = None
         
     def __call__(self):
@@ -50,40 +180,186 @@ class SerialHandler(serial.threaded.LineReader):
         """
         super().connection_made(transport)
         logging.debug('opened serial port to arduino')
+        self.send_command()
 
         "Setup PUB socket"
-        self.pubs = self.ctx.socket(zmq.PUB)
-        self.pubs.bind(self.pub_address)
+        if self.sink is None:
+            self.pubs = self.ctx.socket(zmq.PUB)
+            self.pubs.bind(self.pub_address)
 
     def connection_lost(self, exc):
         logging.debug('closed serial port to arduino', exc_info=exc)
 
+    def send_command(self):
+        """
+        Write the command configuring the Arduino, at most once per second
+        """
+        now = time.monotonic()
+        if not self.command or self.transport is None:
+            return
+        if self.command_time is not None and now - self.command_time < 1:
+            return
+        logging.debug('sending command to arduino: %s' % self.command)
+        self.command_time = now
+        self.transport.write(self.command)
+
+    def data_received(self, data):
+        """
+        Buffer the received bytes and handle every complete line (or frame) at once,
+        the partial line at the end is kept for the next call
+        """
+        if self.protocol == 'binary':
+            self.buffer.extend(data)
+            rows, end, skipped, bad = frame_decode(self.buffer)
+            del self.buffer[:end]
+            if bad:
+                logging.warning('Dropped %d binary frames with a bad CRC' % bad)
+            if skipped:
+                logging.debug('Skipped %d bytes of the binary stream' % skipped)
+                self.send_command()
+            if rows:
+                self.handle_frames(rows)
+            return
+
+        start = max(len(self.buffer) - len(self.TERMINATOR) + 1, 0)
+        self.buffer.extend(data)
+        end = self.buffer.rfind(self.TERMINATOR, start)
+        if end < 0:
+            if len(self.buffer) > MAX_PARTIAL:
+                logging.warning('Dropping %d bytes without a line terminator' % len(self.buffer))
+                del self.buffer[:]
+            return
+        end += len(self.TERMINATOR)
+        chunk = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        self.handle_chunk(chunk)
+
     def handle_line(self, line):
         """
         Handle a received line (it's a string!)
         """
-        if self.pubs is not None:
-            alist = line.split()
-            if len(alist) == 5:
-                [time, phi_cnt, theta_cnt, phi_err, theta_err] = alist
-                logging.debug('got data: %s %s %s %s %s' % (time, phi_cnt, theta_cnt, phi_err, theta_err))
-                phi_raw, theta_raw = self.enc.convert(int(phi_cnt), int(theta_cnt))
-                phi, theta = self.pm.apply(phi_raw, theta_raw)
-                msg = DataMessage(time=time, phi_cnt=phi_cnt, theta_cnt=theta_cnt, 
-                                  phi_raw=phi_raw, theta_raw=theta_raw, phi=phi, theta=theta)
-                logging.debug('publish data: %s' % msg.to_json())
-                self.pubs.send_json(msg.to_json())
-            else:
-                logging.info('Got write size from Arduino: %s' % alist[0])
+        self.handle_chunk(line.encode(self.ENCODING) + self.TERMINATOR)
+
+    def handle_chunk(self, chunk):
+        """
+        Handle complete lines (it's bytes!), all of them in one pass: the fields are
+        converted straight from bytes, the encoders and the pointing model are applied
+        to arrays, and the messages are published with one send
+        """
+        arrival = self.now()
+        lines = chunk.split(self.TERMINATOR)[:-1]
+        if self.capture is not None:
+            for line in lines:
+                self.capture.write(line.decode(self.ENCODING, self.UNICODE_HANDLING), arrival)
+            "once per read, so a crash loses at most one read and the file can be mapped live"
+            self.capture.flush()
+
+        if self.pubs is None and self.sink is None:
+            return
+
+        t0 = time.perf_counter()
+        rows = []
+        for line in lines:
+            fields = line.split()
+            if len(fields) == 5:
+                rows.append(fields)
+            elif fields:
+                logging.info('Got write size from Arduino: %s' % fields[0].decode(self.ENCODING, self.UNICODE_HANDLING))
+        if not rows:
+            return
+        try:
+            values = np.array(rows, dtype=np.int64)
+        except (ValueError, OverflowError):
+            "drop the malformed lines, e.g. garbled by a reset of the Arduino, or out of range"
+            good = []
+            for fields in rows:
+                try:
+                    good.append(np.array([int(f) for f in fields], dtype=np.int64))
+                except (ValueError, OverflowError):
+                    logging.warning('Malformed line from Arduino: %s' % b' '.join(fields))
+            if not good:
+                return
+            values = np.array(good, dtype=np.int64)
+        self.handle_values(values, arrival, t0)
+
+    def handle_frames(self, rows):
+        """
+        Handle decoded binary frames, see :func:`frame_decode`
+        """
+        arrival = self.now()
+        if self.capture is not None:
+            for row in rows:
+                self.capture.write('%d %d %d %d %d' % row, arrival)
+            self.capture.flush()
+
+        if self.pubs is None and self.sink is None:
+            return
+        t0 = time.perf_counter()
+        self.handle_values(np.array(rows, dtype=np.int64), arrival, t0)
+
+    def handle_values(self, values, arrival, t0):
+        """
+        Convert a batch of samples, one (time stamp, phi count, theta count, phi errors,
+        theta errors) row per sample, and publish it
+        """
+        logging.debug('got data: %s' % values.tolist())
+
+        millis = values[:, 0].tolist()
+        if self.clock is not None:
+            "all the lines of a chunk arrived together, the clock fit gives their acquisition times"
+            utc = [self.clock.update(m, arrival) for m in millis]
+        else:
+            utc = millis
+        t1 = time.perf_counter()
+        phi_cnt = values[:, 1]
+        theta_cnt = values[:, 2]
+        phi_rate = theta_rate = [None]*len(millis)
+        if self.smoother is not None:
+            "the filters need seconds, without a clock the time stamps are millis() or micros()"
+            times = utc if self.clock is not None else [m*(1e-6 if self.protocol == 'binary' else 1e-3)
+                                                        for m in millis]
+            smoothed = self.smoother.update_array(times, phi_cnt.tolist(), theta_cnt.tolist())
+            phi_cnt, theta_cnt, phi_rate, theta_rate = (np.array(x) for x in smoothed)
+            phi_rate, theta_rate = (x.tolist() for x in self.enc.convert_rate(phi_rate, theta_rate, theta_cnt))
+        t2 = time.perf_counter()
+        phi_raw, theta_raw = self.enc.convert_array(phi_cnt, theta_cnt)
+        t3 = time.perf_counter()
+        phi, theta = self.pm.apply(phi_raw, theta_raw)
+        t4 = time.perf_counter()
+
+        msgs = [DataMessage(time=args[0], phi_cnt=args[1], theta_cnt=args[2], phi_raw=args[3],
+                            theta_raw=args[4], phi=args[5], theta=args[6], phi_rate=args[7], theta_rate=args[8],
+                            utc=self.clock is not None)
+                for args in zip(utc, values[:, 1].tolist(), values[:, 2].tolist(), phi_raw.tolist(),
+                                theta_raw.tolist(), phi.tolist(), theta.tolist(), phi_rate, theta_rate)]
+        if self.monitor is not None:
+            self.monitor.record('serial_parse', t1 - t0)
+            if self.smoother is not None:
+                self.monitor.record('smoothing', t2 - t1)
+            self.monitor.record('encoders', t3 - t2)
+            self.monitor.record('pointing', t4 - t3)
+        if self.sink is not None:
+            for msg in msgs:
+                self.sink(msg)
+        else:
+            logging.debug('publish data: %d messages' % len(msgs))
+            send_messages(self.pubs, msgs, self.fmt)
+            if self.monitor is not None:
+                self.monitor.record('td_ta_send', time.perf_counter() - t4)
+        if self.monitor is not None:
+            self.monitor.tick()
 
     def poison_pill(self):
         """
         Insert the poison pill
         """
-        msg = CmdMessage(cmd='stop')
-        logging.debug('publish cmd: %s' % msg.to_json())
-        self.pubs.send_json(msg.to_json())  # poison pill closes everything else
-        self.pubs.close(linger=1)
+        if self.pubs is not None:
+            msg = CmdMessage(cmd='stop')
+            logging.debug('publish cmd: %s' % msg.to_json())
+            send_message(self.pubs, msg, self.fmt)  # poison pill closes everything else
+            self.pubs.close(linger=1)
+        if self.monitor is not None:
+            self.monitor.close()
 
 
 class Telescope(object):
@@ -96,10 +372,17 @@ class Telescope(object):
     :type pub_address: str
     :param ctx: the zmq context to use, optional [None]
     :type ctx: :obj:`zmq.Context`
+    :param capture: name of a session file capturing the raw serial lines, optional [None]
+    :type capture: str or None
 
     >>> scope = Telescope('/dev/cu.usbmodem143301', 'tcp://127.0.0.1:10011')
     >>> scope.start()
     >>> scope.close()
+
+    A captured session (see :mod:`pushto.session`) is replayed instead of reading the
+    serial port with:
+
+    >>> scope.start_replay('session.ptsc', speed=10)
     
     .. note::
 
@@ -108,19 +391,70 @@ class Telescope(object):
        
           '<msec> <azi_cnt> <alt_cnt> <azi_err> <alt_err>CRLF'
 
-       Published data is a JSON dictionary:
+       With the binary protocol, it is a stream of fixed-size frames with a sync word and
+       a CRC, time stamped with micros() (see :func:`frame_encode`). At 20B per frame, a
+       sample rate of 1 kHz needs 200 kb/s, e.g. a baud rate of 250000.
+
+       Published data is a :class:`pushto.messages.DataMessage`, as a JSON dictionary or
+       in the binary wire format (see :mod:`pushto.messages`). The Arduino time stamp is
+       converted into the acquisition time, in seconds since epoch, with a
+       :class:`pushto.clock.ClockSync`:
        
-          {'time': '2034', 'azi_cnt': '-548', 'alt_cnt': '870', 'azi_err': '0', 'alt_err': '1'}
+          {'type': 'DATA', 'time': 1668701698.967, 'phi_cnt': -548, 'theta_cnt': 870, 'phi_raw': ..., ...}
     
     """
 
-    def __init__(self, port, pub_address, cfg=None, ctx=None):
+    def __init__(self, port, pub_address, cfg=None, ctx=None, capture=None):
         self.port = port
         self.pub_address = pub_address
         self.cfg = cfg
         self.ctx = ctx
+        self.capture = capture
         self.protocol = None
         self.reader = None
+        self.replay = None
+        self.serial = None
+        self.loop = None
+
+    def make_protocol(self, baudrate, now=time.time, sink=None, protocol=None):
+        """
+        Create and configure the protocol object
+
+        :param baudrate: baud rate of the serial port, for the transmission delay
+        :type baudrate: int
+        :param now: the host clock, optional
+        :type now: callable
+        :param sink: receives the data messages instead of the PUB socket, optional
+        :type sink: callable or None
+        :param protocol: protocol of the data, text or binary, optional (default is the configured one)
+        :type protocol: str or None
+
+        :return: the protocol
+        :rtype: :obj:`SerialHandler`
+        """
+        enc = Encoders()
+        enc.config(self.cfg)
+        pm = PointingModel()
+        pm.config(self.cfg)
+
+        "the binary frames are stamped with micros(), the text lines with millis()"
+        binary = self.cfg.get_serial_protocol() == 'binary'
+        if binary:
+            clock = ClockSync(delay=FRAME_BITS/baudrate, tick=1e-6)
+        else:
+            clock = ClockSync(delay=LINE_BITS/baudrate)
+
+        "tell the sketch which protocol and sample period to use, if they are not its defaults"
+        period = self.cfg.get_sample_period()
+        command = b''
+        if binary or period > 0:
+            command = b'%s%d\n' % (b'B' if binary else b'T', round(1000*period))
+
+        monitor = Monitor.setup(self.cfg, 'telescope', self.ctx)
+        capture = SessionWriter(self.capture) if self.capture else None
+        return SerialHandler(enc, pm, self.pub_address, self.ctx, self.cfg.get_td_ta_format(), clock,
+                             monitor, capture, now, sink, protocol or self.cfg.get_serial_protocol(), command,
+                             AttitudeFilter.setup(self.cfg))
 
     def start(self):
         """
@@ -129,14 +463,10 @@ class Telescope(object):
 
         "Create and configure the serial object"
         ser = serial.serial_for_url(self.port, do_not_open=True)
-        ser.baudrate = 9600
+        ser.baudrate = self.cfg.get_serial_baudrate()
 
         "Create and configure the protocol object"
-        enc = Encoders()
-        enc.config(self.cfg)
-        pm = PointingModel()
-        pm.config(self.cfg)
-        self.protocol = SerialHandler(enc, pm, self.pub_address, self.ctx)
+        self.protocol = self.make_protocol(ser.baudrate)
 
         "Open the serial port"
         try:
@@ -151,12 +481,109 @@ class Telescope(object):
         self.reader.name = 'telescope'
         self.reader.start()
 
+    def start_async(self, sink, loop=None):
+        """
+        Read the serial port from an :mod:`asyncio` event loop instead of a reader thread.
+        The port is read when its file descriptor is readable, ports without one (e.g.
+        'loop://') are read by the default executor of the loop.
+
+        :param sink: receives the data messages
+        :type sink: callable
+        :param loop: the event loop, optional (default is the running loop)
+        :type loop: :obj:`asyncio.AbstractEventLoop` or None
+        """
+        self.loop = loop or asyncio.get_running_loop()
+
+        "Create and configure the serial object, non-blocking"
+        ser = serial.serial_for_url(self.port, do_not_open=True)
+        ser.baudrate = self.cfg.get_serial_baudrate()
+        ser.timeout = 0
+        self.protocol = self.make_protocol(ser.baudrate, sink=sink)
+        ser.open()
+        self.serial = ser
+        self.protocol.connection_made(ser)
+
+        try:
+            fd = ser.fileno()
+        except AttributeError:
+            fd = None
+        if fd is not None:
+            self.loop.add_reader(fd, self.read_serial)
+        else:
+            ser.timeout = 0.1
+            self.loop.create_task(self.poll_serial())
+
+    def read_serial(self):
+        """
+        Read the available bytes of the serial port and pass them to the protocol.
+        """
+        try:
+            data = self.serial.read(self.serial.in_waiting or 1)
+        except serial.SerialException as e:
+            logging.error('Could not read serial port {}: {}'.format(self.serial.name, e))
+            self.loop.remove_reader(self.serial.fileno())
+            self.protocol.connection_lost(e)
+            return
+        if data:
+            self.protocol.data_received(data)
+
+    async def poll_serial(self):
+        """
+        Read a serial port without a file descriptor in the default executor.
+        """
+        while self.serial is not None and self.serial.is_open:
+            try:
+                data = await self.loop.run_in_executor(None, lambda: self.serial.read(self.serial.in_waiting or 1))
+            except serial.SerialException:
+                break
+            if data:
+                self.protocol.data_received(data)
+
+    def start_replay(self, filename, speed=1.0, clock=None, delay=0.5):
+        """
+        Start replaying a captured session instead of reading the serial port.
+
+        :param filename: name of the session file
+        :type filename: str
+        :param speed: replay speed, 1 for real time, N for N times faster, 0 for as fast as possible, optional
+        :type speed: float
+        :param clock: the replay clock, optional
+        :type clock: :obj:`pushto.session.ReplayClock` or None
+        :param delay: time in seconds given to the subscribers to connect before replaying, optional
+        :type delay: float
+
+        :return: the replay clock, which follows the arrival times of the session
+        :rtype: :obj:`pushto.session.ReplayClock`
+        """
+        session = SessionReader(filename)
+        clock = clock or ReplayClock(session.t0)
+        "sessions are captured as text lines, whatever the protocol"
+        self.protocol = self.make_protocol(self.cfg.get_serial_baudrate(), now=clock, protocol='text')
+        self.protocol.connection_made(None)
+        self.replay = SessionReplay(session, self.protocol, speed, clock, delay=delay)
+        self.replay.start()
+        return clock
+
     def close(self):
         """
-        Signal to downstream components, close the PUB, and stop the reader thread.
+        Signal to downstream components, close the PUB, and stop the reader or replay thread.
         """
+        if self.replay is not None:
+            self.replay.stop()
+            self.replay.join()
         self.protocol.poison_pill()
-        self.reader.close()
+        if self.reader is not None:
+            self.reader.close()
+        if self.serial is not None:
+            "read from an event loop, this must be called from the loop"
+            try:
+                self.loop.remove_reader(self.serial.fileno())
+            except AttributeError:
+                pass
+            self.serial.close()
+            self.serial = None
+        if self.protocol.capture is not None:
+            self.protocol.capture.close()
 
     @classmethod
     def setup(cls, cfg, ctx=None):
@@ -172,9 +599,9 @@ class Telescope(object):
         :rtype: :obj:`Telescope`
         """
         ser_port = cfg.get_serial_port()
-        pub_address = "tcp://%s:%s" % (cfg.get_host_ip(), cfg.get_td_ta_port())
+        pub_address = cfg.get_address('td_ta')
         
-        return Telescope(ser_port, pub_address, cfg=cfg, ctx=ctx)
+        return Telescope(ser_port, pub_address, cfg=cfg, ctx=ctx, capture=cfg.get_capture_file())
 
 
 class Encoders(object):
@@ -228,39 +655,82 @@ class Encoders(object):
         :return: phi and theta, in degrees
         :rtype: list(float)
         """
+        phi, theta = self.convert_array(np.asarray(phi_cnt), np.asarray(theta_cnt))
+        return float(phi), float(theta)
+
+    def convert_array(self, phi_cnt, theta_cnt):
+        """
+        Convert arrays of encoder counts to raw telescope attitude (phi, theta)
+    
+        :param phi_cnt: counts of azimuthal encoder
+        :type phi_cnt: :obj:`np.ndarray` of int64
+        :param theta_cnt: counts of polar encoder
+        :type theta_cnt: :obj:`np.ndarray` of int64
+        
+        :return: phi and theta, in degrees
+        :rtype: list(:obj:`np.ndarray`)
+
+        >>> encoders = Encoders(phi_npr=2400, theta_npr=2400)
+        >>> phi, theta = encoders.convert_array(np.array([0, 1200]), np.array([0, 1200]))
+        """
 
         "Reverse the sense of the counters if necessary"
         if self.flip_phi:
-            phi_cnt *= -1
+            phi_cnt = -phi_cnt
         if self.flip_theta:
-            theta_cnt *= -1
+            theta_cnt = -theta_cnt
 
         "For phi: convert counts into an angle in range [0:360]"
         phi = phi_cnt*360./self.phi_npr
-        if phi >= 360:
-            phi -= 360*np.fix(phi/360)
-        elif phi < 0:
-            phi += 360*(1-np.fix(phi/360))
-        
+        phi = np.where(phi >= 360, phi - 360*np.fix(phi/360),
+                       np.where(phi < 0, phi + 360*(1 - np.fix(phi/360)), phi))
+
         "For theta: convert counts into an angle in range [-180:+180]"
-        theta = theta_cnt*360./self.theta_npr
-        if theta >= 360:
-            theta -= 360*np.fix(theta/360)
-        elif theta < 0:
-            theta += 360*(1-np.fix(theta/360))
-        if theta > 180:
-            theta -= 360
-    
+        theta = self._theta_range(theta_cnt)
+
         "Now convert to spherical angles"
-        if theta > 90:
-            theta = 180 - theta
-            phi = (phi + 180) % 360
-        elif theta < -90:
-            theta = -180 - theta
-            phi = (phi + 180) % 360
+        fold = (theta > 90) | (theta < -90)
+        theta = np.where(theta > 90, 180 - theta, np.where(theta < -90, -180 - theta, theta))
+        phi = np.where(fold, (phi + 180) % 360, phi)
 
         return phi, theta
 
+    def _theta_range(self, theta_cnt):
+        """
+        Convert counts of the polar encoder, already flipped, into an angle in range [-180:+180]
+        """
+        theta = theta_cnt*360./self.theta_npr
+        theta = np.where(theta >= 360, theta - 360*np.fix(theta/360),
+                         np.where(theta < 0, theta + 360*(1 - np.fix(theta/360)), theta))
+        return np.where(theta > 180, theta - 360, theta)
+
+    def convert_rate(self, phi_rate, theta_rate, theta_cnt=None):
+        """
+        Convert rates of the encoder counts to angular velocities of the telescope attitude
+
+        Past the zenith (or the nadir) the attitude is folded, see :meth:`convert_array`:
+        theta runs backwards there, and phi is turned by 180 degrees, which does not
+        change its rate.
+
+        :param phi_rate: rate of azimuthal encoder in counts/s
+        :type phi_rate: float or :obj:`np.ndarray`
+        :param theta_rate: rate of polar encoder in counts/s
+        :type theta_rate: float or :obj:`np.ndarray`
+        :param theta_cnt: counts of polar encoder, to fold the rate of theta, optional
+                          (without them the rates are those of the encoder axes)
+        :type theta_cnt: float or :obj:`np.ndarray` or None
+
+        :return: rates of phi and theta, in degrees/s
+        :rtype: list
+        """
+        phi_scale = -360./self.phi_npr if self.flip_phi else 360./self.phi_npr
+        theta_scale = -360./self.theta_npr if self.flip_theta else 360./self.theta_npr
+        theta_rate = theta_rate*theta_scale
+        if theta_cnt is not None:
+            theta = self._theta_range(-np.asarray(theta_cnt) if self.flip_theta else np.asarray(theta_cnt))
+            theta_rate = np.where((theta > 90) | (theta < -90), -theta_rate, theta_rate)[()]
+        return phi_rate*phi_scale, theta_rate
+
 
 class PointingModel(object):
     """
@@ -287,6 +757,9 @@ class PointingModel(object):
 
     >>> pm = PointingModel()
     >>> phi, theta = pm.apply(180, 45)
+
+    The corrections are evaluated analytically, or interpolated on a precomputed
+    grid after :meth:`set_grid`.
     """
 
     def __init__(self, ia=0, ie=0, an=0, aw=0, ca=0, npae=0, tx=0, tf=0):
@@ -298,6 +771,33 @@ class PointingModel(object):
         self.npae = npae
         self.tx = tx
         self.tf = tf
+        self.grid = None
+
+    def terms(self):
+        """
+        Current values of the terms.
+
+        :return: the terms, in the order of :data:`PM_TERMS`
+        :rtype: tuple(float)
+        """
+        return (self.ia, self.ie, self.an, self.aw, self.ca, self.npae, self.tx, self.tf)
+
+    def set_grid(self, resolution, order=1):
+        """
+        Use a precomputed correction grid, see :class:`CorrectionGrid`.
+
+        :param resolution: grid spacing in degrees, 0 or None for the analytic corrections
+        :type resolution: float or None
+        :param order: interpolation order, 1 (bilinear) or 3 (bicubic), optional
+        :type order: int
+        """
+        if not resolution:
+            self.grid = None
+            return
+        self.grid = CorrectionGrid(self, resolution, order)
+        max_err, rms_err = self.grid.accuracy()
+        logging.info('correction grid %.3g deg, order %d: max error %.3g arcsec, rms %.3g arcsec'
+                     % (self.grid.resolution, order, max_err, rms_err))
 
     def config(self, cfg):
         """
@@ -318,74 +818,423 @@ class PointingModel(object):
         self.npae = cfg.get_npae()
         self.tx = cfg.get_tx()
         self.tf = cfg.get_tf()
+        self.set_grid(cfg.get_grid_resolution(), cfg.get_grid_order())
         
+    def corrections(self, phi, theta, jacobian=False):
+        """
+        Evaluate the azimuth and elevation corrections of the model.
+
+        The ca term is skipped at the zenith (theta = +-90) and the tx term is
+        skipped on the horizon (theta = 0), where they are singular.
+
+        :param phi: raw azimuthal angle in degrees
+        :type phi: float or :obj:`np.ndarray`
+        :param theta: raw altitude angle in degrees
+        :type theta: float or :obj:`np.ndarray`
+        :param jacobian: also return the partial derivatives, optional
+        :type jacobian: bool
+
+        :return: da and de in arcsec, followed by the partial derivatives
+                 (da/dphi, da/dtheta, de/dphi, de/dtheta) in arcsec per radian if requested
+        :rtype: list(:obj:`np.ndarray`)
+        """
+        phi_r = np.radians(phi)
+        theta_r = np.radians(theta)
+        sin_p = np.sin(phi_r)
+        cos_p = np.cos(phi_r)
+        sin_t = np.sin(theta_r)
+        cos_t = np.cos(theta_r)
+        tan_t = sin_t/cos_t
+        zenith = np.abs(theta) == 90
+        horizon = theta == 0
+
+        "azimuth corrections"
+        da = -self.ia - (self.an*sin_p + self.aw*cos_p + self.npae)*tan_t
+        da = da - np.divide(self.ca, cos_t, out=np.zeros_like(cos_t), where=~zenith)
+
+        "elevation corrections"
+        de = self.ie - self.an*cos_p + self.aw*sin_p - self.tf*cos_t
+        de = de - np.divide(self.tx, tan_t, out=np.zeros_like(tan_t), where=~horizon)
+
+        if not jacobian:
+            return da, de
+
+        sec_t = np.divide(1, cos_t, out=np.zeros_like(cos_t), where=~zenith)
+        csc_t = np.divide(1, sin_t, out=np.zeros_like(sin_t), where=~horizon)
+        da_dp = (self.aw*sin_p - self.an*cos_p)*tan_t
+        da_dt = -(self.an*sin_p + self.aw*cos_p + self.npae)*sec_t*sec_t - self.ca*sec_t*tan_t
+        de_dp = self.an*sin_p + self.aw*cos_p
+        de_dt = self.tf*sin_t + self.tx*csc_t*csc_t
+        return da, de, da_dp, da_dt, de_dp, de_dt
+
+    def partials(self, phi, theta):
+        """
+        Partial derivatives of the corrections with respect to the terms of the model,
+        in the order of :data:`PM_TERMS`. The corrections are linear in the terms, so
+        these do not depend on the current values of the terms.
+
+        :param phi: raw azimuthal angle in degrees
+        :type phi: float or :obj:`np.ndarray`
+        :param theta: raw altitude angle in degrees
+        :type theta: float or :obj:`np.ndarray`
+
+        :return: d(da)/d(terms) and d(de)/d(terms), each of shape (..., 8)
+        :rtype: list(:obj:`np.ndarray`)
+        """
+        phi_r = np.radians(phi)
+        theta_r = np.radians(theta)
+        sin_p = np.sin(phi_r)
+        cos_p = np.cos(phi_r)
+        sin_t = np.sin(theta_r)
+        cos_t = np.cos(theta_r)
+        tan_t = sin_t/cos_t
+        zenith = np.abs(theta) == 90
+        horizon = theta == 0
+        sec_t = np.divide(1, cos_t, out=np.zeros_like(cos_t), where=~zenith)
+        cot_t = np.divide(cos_t, sin_t, out=np.zeros_like(sin_t), where=~horizon)
+        zero = np.zeros_like(sin_p)
+        one = np.ones_like(sin_p)
+
+        "ia, ie, an, aw, ca, npae, tx, tf"
+        da = np.stack([-one, zero, -sin_p*tan_t, -cos_p*tan_t, -sec_t, -tan_t, zero, zero], axis=-1)
+        de = np.stack([zero, one, -cos_p, sin_p, zero, zero, -cot_t, -cos_t], axis=-1)
+        return da, de
+
     def apply(self, phi, theta):
         """
         Convert from raw telescope attitude to corrected telescope attitude
     
         :param phi: raw azimuthal angle
-        :type phi: float
+        :type phi: float or :obj:`np.ndarray`
         :param theta: raw altitude angle
-        :type theta: float
+        :type theta: float or :obj:`np.ndarray`
         
         :return: phi and theta, in degrees
-        :rtype: list(float)
+        :rtype: list(float) or list(:obj:`np.ndarray`)
         """
-
-        phi_r = np.radians(phi)
-        theta_r = np.radians(theta)
-
-        "azimuth corrections"
-        da = -1 * self.ia
-        da -= self.an * np.sin(phi_r) * np.tan(theta_r)
-        da -= self.aw * np.cos(phi_r) * np.tan(theta_r)
-        if abs(theta) != 90:
-            da -= self.ca / np.cos(theta_r)
-        da -= self.npae * np.tan(theta_r)
+        phi = np.asarray(phi, dtype=float)
+        theta = np.asarray(theta, dtype=float)
+        if self.grid is None:
+            da, de = self.corrections(phi, theta)
+        else:
+            if self.grid.terms != self.terms():
+                self.grid.build()
+            da, de = self.grid.corrections(phi, theta)
 
         azi = phi + da/3600
-        if azi >= 360:
-            azi -= 360*np.fix(azi/360)
-        elif phi < 0:
-            azi += 360*(1-np.fix(azi/360))
+        azi = np.where(azi >= 360, azi - 360*np.fix(azi/360),
+                       np.where(azi < 0, azi + 360*(1 - np.fix(azi/360)), azi))
 
-        "elevation corrections"
-        de = self.ie
-        de -= self.an * np.cos(phi_r)
-        de += self.aw * np.sin(phi_r)
-        de -= self.tf * np.cos(theta_r)
-        if theta != 0:
-            de -= self.tx / np.tan(theta_r)
-    
         alt = theta + de/3600
-        if alt >= 360:
-            alt -= 360*np.fix(alt/360)
-        elif alt < 0:
-            alt += 360*(1-np.fix(alt/360))
-        if alt > 180:
-            alt -= 360
+        alt = np.where(alt >= 360, alt - 360*np.fix(alt/360),
+                       np.where(alt < 0, alt + 360*(1 - np.fix(alt/360)), alt))
+        alt = np.where(alt > 180, alt - 360, alt)
 
         "Now convert to spherical angles"
-        if alt > 90:
-            alt = 180 - alt
-            azi = (azi + 180) % 360
-        elif alt < -90:
-            alt = -180 - alt
-            azi = (azi + 180) % 360
-
-        return azi, alt
+        fold = (alt > 90) | (alt < -90)
+        alt = np.where(alt > 90, 180 - alt, np.where(alt < -90, -180 - alt, alt))
+        azi = np.where(fold, (azi + 180) % 360, azi)
+
+        return azi[()], alt[()]
         
-    def deapply(self, azi, alt):
+    def deapply(self, azi, alt, tol=1e-9, max_iter=20, max_step=1.0):
         """
-        need to find the phi, theta that make apply(phi,theta) - (azi,alt) = 0
-        
+        Convert from corrected telescope attitude to raw telescope attitude, the
+        inverse of :meth:`apply`.
+
+        Solves apply(phi, theta) = (azi, alt) with Newton iterations using the
+        analytic Jacobian of the model; only unconverged points are iterated.
+
+        Steps are limited to max_step and theta is kept away from the zenith, where
+        the tan(theta) and 1/cos(theta) terms diverge; there the azimuth is
+        degenerate, so convergence is measured on the sky (the azimuth residual is
+        scaled by cos(alt)). Iterations never cross the horizon, where the tx term
+        is singular.
+    
+        :param azi: corrected azimuthal angle in degrees
+        :type azi: float or :obj:`np.ndarray`
+        :param alt: corrected altitude angle in degrees
+        :type alt: float or :obj:`np.ndarray`
+        :param tol: convergence tolerance in degrees, optional
+        :type tol: float
+        :param max_iter: maximum number of iterations, optional
+        :type max_iter: int
+        :param max_step: maximum step per iteration in degrees, optional
+        :type max_step: float
+
+        :return: phi and theta, in degrees
+        :rtype: list(float) or list(:obj:`np.ndarray`)
+
+        >>> pm = PointingModel(ia=30, an=10)
+        >>> phi, theta = pm.deapply(*pm.apply(180, 45))
+        """
+        azi = np.asarray(azi, dtype=float)
+        alt = np.asarray(alt, dtype=float)
+        shape = np.broadcast(azi, alt).shape
+        azi = np.broadcast_to(azi, shape).ravel()
+        alt = np.broadcast_to(alt, shape).ravel()
+        theta_max = 90 - 1e-6
+        scale = np.pi/180/3600
+
+        phi = azi.copy()
+        theta = np.clip(alt, -theta_max, theta_max)
+        cos_alt = np.cos(np.radians(alt))
+
+        idx = None
+        for _ in range(max_iter):
+            if idx is None:
+                p, t, a, e, c = phi, theta, azi, alt, cos_alt
+            else:
+                p, t, a, e, c = phi[idx], theta[idx], azi[idx], alt[idx], cos_alt[idx]
+            da, de, da_dp, da_dt, de_dp, de_dt = self.corrections(p, t, jacobian=True)
+
+            "residuals, with the azimuth wrapped to [-180:180]"
+            ra = (p + da/3600 - a + 180) % 360 - 180
+            re = t + de/3600 - e
+            active = (np.abs(ra)*c >= tol) | (np.abs(re) >= tol)
+            if not np.any(active):
+                break
+            if not np.all(active):
+                idx = np.flatnonzero(active) if idx is None else idx[active]
+                p, t, ra, re = p[active], t[active], ra[active], re[active]
+                da_dp, da_dt, de_dp, de_dt = da_dp[active], da_dt[active], de_dp[active], de_dt[active]
+
+            "Newton step, falling back to a fixed-point step if the Jacobian is singular"
+            j11 = 1 + da_dp*scale
+            j12 = da_dt*scale
+            j21 = de_dp*scale
+            j22 = 1 + de_dt*scale
+            det = j11*j22 - j12*j21
+            ok = np.abs(det) > 1e-12
+            det = np.where(ok, det, 1)
+            dp = np.where(ok, (j22*ra - j12*re)/det, ra)
+            dt = np.where(ok, (j11*re - j21*ra)/det, re)
+
+            t_new = np.clip(t - np.clip(dt, -max_step, max_step), -theta_max, theta_max)
+            t_new = np.where(t_new*t < 0, t/2, t_new)
+            p_new = p - np.clip(dp, -max_step, max_step)
+            if idx is None:
+                phi, theta = p_new, t_new
+            else:
+                phi[idx] = p_new
+                theta[idx] = t_new
+
+        phi = (phi % 360).reshape(shape)
+        theta = theta.reshape(shape)
+        return phi[()], theta[()]
+
+
+class CorrectionGrid(object):
+    """
+    Precomputed corrections of a pointing model on a regular (phi, theta) grid.
+
+    The corrections are interpolated, bilinearly (order 1) or with Catmull-Rom bicubic
+    splines (order 3), in constant time. The grid is built from the terms of the model
+    when created, :meth:`PointingModel.apply` rebuilds it when a term changes.
+
+    Near the zenith the tan(theta) and 1/cos(theta) terms diverge, and near the horizon
+    the tx term does, so points with abs(theta) > theta_max, or abs(theta) < theta_min
+    if tx is not zero, use the analytic corrections.
+
+    :param pm: the pointing model
+    :type pm: :obj:`PointingModel`
+    :param resolution: grid spacing in degrees, optional
+    :type resolution: float
+    :param order: interpolation order, 1 or 3, optional
+    :type order: int
+    :param theta_max: largest abs(theta) covered by the grid in degrees, optional
+    :type theta_max: float
+    :param theta_min: smallest abs(theta) covered by the grid when tx is not zero, optional
+    :type theta_min: float
+
+    >>> grid = CorrectionGrid(pm, resolution=0.5)
+    >>> da, de = grid.corrections(phi, theta)
+    >>> max_err, rms_err = grid.accuracy()
+    """
+
+    def __init__(self, pm, resolution=0.5, order=1, theta_max=80, theta_min=5):
+        if order not in (1, 3):
+            raise ValueError('interpolation order must be 1 or 3, not %s' % order)
+        self.pm = pm
+        self.resolution = resolution
+        self.order = order
+        self.theta_max = theta_max
+        self.theta_min = theta_min
+
+        self.terms = None
+        self.da = None
+        self.de = None
+        self.table = None
+        self.n_phi = None
+        self.theta0 = None
+        self.n_theta = None
+        self.build()
+
+    def build(self):
+        """
+        Evaluate the corrections of the model on the grid.
+        """
+        res = self.resolution
+        self.n_phi = int(np.ceil(360/res))
+        res = self.resolution = 360/self.n_phi
+
+        "one extra node before and two after, in both directions, for the cubic stencil"
+        phi = (np.arange(-1, self.n_phi + 2))*res
+        n = int(np.ceil(self.theta_max/res))
+        theta = np.arange(-n - 1, n + 2)*res
+        theta = np.clip(theta, -90 + 1e-6, 90 - 1e-6)
+        self.theta0 = -(n + 1)*res
+        self.n_theta = len(theta)
+
+        da, de = self.pm.corrections(phi[:, None], theta[None, :])
+        self.da = np.ascontiguousarray(da).ravel()
+        self.de = np.ascontiguousarray(de).ravel()
+        "nested lists for the scalar path, which is faster in pure python"
+        self.table = np.stack((da, de), axis=-1).tolist()
+        self.terms = self.pm.terms()
+        logging.debug('built %dx%d correction grid' % (len(phi), len(theta)))
+
+    def corrections(self, phi, theta):
+        """
+        Interpolate the azimuth and elevation corrections.
+
+        :param phi: raw azimuthal angle in degrees
+        :type phi: float or :obj:`np.ndarray`
+        :param theta: raw altitude angle in degrees
+        :type theta: float or :obj:`np.ndarray`
+
+        :return: da and de in arcsec
+        :rtype: list(:obj:`np.ndarray`)
+        """
+        if np.ndim(phi) == 0 and np.ndim(theta) == 0:
+            return self.scalar_corrections(float(phi), float(theta))
+        phi, theta = np.broadcast_arrays(np.asarray(phi, dtype=float), np.asarray(theta, dtype=float))
+
+        "grid coordinates: phi wraps, theta is clamped to the grid"
+        u = (phi % 360)/self.resolution + 1
+        v = (np.clip(theta, -self.theta_max, self.theta_max) - self.theta0)/self.resolution
+        i = np.minimum(u.astype(int), self.n_phi)
+        j = np.minimum(v.astype(int), self.n_theta - 3)
+        fu = u - i
+        fv = v - j
+
+        "flat indices into the (phi, theta) planes of da and de"
+        k = i*self.n_theta + j
+        if self.order == 1:
+            wu = (1 - fu, fu)
+            wv = (1 - fv, fv)
+        else:
+            wu = self.catmull_rom(fu)
+            wv = self.catmull_rom(fv)
+            k = k - self.n_theta - 1
+        da = 0
+        de = 0
+        for a, w_a in enumerate(wu):
+            for b, w_b in enumerate(wv):
+                w = w_a*w_b
+                node = k + (a*self.n_theta + b)
+                da = da + w*self.da.take(node)
+                de = de + w*self.de.take(node)
+
+        "analytic corrections where the grid doesn't apply"
+        outside = np.abs(theta) > self.theta_max
+        if self.pm.tx != 0:
+            outside = outside | (np.abs(theta) < self.theta_min)
+        if np.any(outside):
+            da = np.array(da)
+            de = np.array(de)
+            da[outside], de[outside] = self.pm.corrections(phi[outside], theta[outside])
+        return da, de
+
+    def scalar_corrections(self, phi, theta):
+        """
+        Interpolate the corrections of a single point.
+
+        :param phi: raw azimuthal angle in degrees
+        :type phi: float
+        :param theta: raw altitude angle in degrees
+        :type theta: float
+
+        :return: da and de in arcsec
+        :rtype: list(float)
+        """
+        if abs(theta) > self.theta_max or (self.pm.tx != 0 and abs(theta) < self.theta_min):
+            da, de = self.pm.corrections(phi, theta)
+            return float(da), float(de)
+
+        u = (phi % 360)/self.resolution + 1
+        v = (theta - self.theta0)/self.resolution
+        i = min(int(u), self.n_phi)
+        j = min(int(v), self.n_theta - 3)
+        fu = u - i
+        fv = v - j
+        g = self.table
+
+        if self.order == 1:
+            wu = (1 - fu, fu)
+            wv = (1 - fv, fv)
+        else:
+            wu = self.catmull_rom(fu)
+            wv = self.catmull_rom(fv)
+            i -= 1
+            j -= 1
+
+        da = de = 0.0
+        for a, w_a in enumerate(wu):
+            row = g[i + a]
+            for b, w_b in enumerate(wv):
+                w = w_a*w_b
+                node = row[j + b]
+                da += w*node[0]
+                de += w*node[1]
+        return da, de
+
+    @staticmethod
+    def catmull_rom(f):
+        """
+        Weights of the 4 nodes around a point of the Catmull-Rom spline.
+
+        :param f: fractional position between the second and third nodes
+        :type f: :obj:`np.ndarray`
+
+        :return: the 4 weights
+        :rtype: list(:obj:`np.ndarray`)
+        """
+        f2 = f*f
+        f3 = f2*f
+        return (-0.5*f3 + f2 - 0.5*f,
+                1.5*f3 - 2.5*f2 + 1,
+                -1.5*f3 + 2*f2 + 0.5*f,
+                0.5*f3 - 0.5*f2)
+
+    def accuracy(self, n=10000, seed=0):
+        """
+        Compare the interpolated corrections with the analytic ones, at random points
+        where the grid applies.
+
+        :param n: number of points, optional
+        :type n: int
+        :param seed: random seed, optional
+        :type seed: int
+
+        :return: maximum and rms error on the sky in arcsec
+        :rtype: list(float)
         """
-        return None
+        rng = np.random.default_rng(seed)
+        phi = rng.uniform(0, 360, n)
+        theta = rng.uniform(-self.theta_max, self.theta_max, n)
+        if self.pm.tx != 0:
+            theta = np.where(np.abs(theta) < self.theta_min, np.copysign(self.theta_min, theta), theta)
+        da, de = self.corrections(phi, theta)
+        da0, de0 = self.pm.corrections(phi, theta)
+        err = np.hypot((da - da0)*np.cos(np.radians(theta)), de - de0)
+        return float(np.max(err)), float(np.sqrt(np.mean(err*err)))
 
 
 if __name__ == '__main__':
     import argparse
     from pushto.config import Configuration
+    from pushto.messages import recv_message
     
     """
     This demonstrates how to use it.
@@ -399,6 +1248,10 @@ if __name__ == '__main__':
     "Setup argument parser"
     parser = argparse.ArgumentParser(description='Telescope Server')
     parser.add_argument('--port', help='serial port connected to arduino')
+    parser.add_argument('--capture', help='capture the raw serial lines to this session file')
+    parser.add_argument('--replay', help='replay this session file instead of reading the serial port')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='replay speed, 0 for as fast as possible')
     parser.add_argument('-d', action='store_true', default=False,
                         help='enable debug logging')
     
@@ -416,7 +1269,7 @@ if __name__ == '__main__':
     cfg = Configuration()
 
     "Configure zmq"
-    pub_address = 'tcp://%s:%s' % (cfg.get_host_ip(), cfg.get_td_ta_port())
+    pub_address = cfg.get_address('td_ta')
     ctx = zmq.Context()
     subs = ctx.socket(zmq.SUB)
     subs.subscribe("")
@@ -425,15 +1278,20 @@ if __name__ == '__main__':
     "Configure serial port"
     if args.port:
         cfg.set_serial_port(args.port)
+    if args.capture:
+        cfg.set_capture_file(args.capture)
 
     "Create the server and start it"
     telescope = Telescope.setup(cfg, ctx)
-    telescope.start()
+    if args.replay:
+        telescope.start_replay(args.replay, args.speed)
+    else:
+        telescope.start()
     
     "Sit here and read the output of the server until ^C"
     try:
         while True:
-            data = subs.recv_json()
+            data = recv_message(subs)
             logging.info("On SUB: %s" % data)
     except KeyboardInterrupt:
         logging.info('keyboard interrupt')
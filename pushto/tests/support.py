@@ -0,0 +1,54 @@
+"""
+Helpers of the tests that stand in for Stellarium and the Arduino.
+"""
+import os
+import socket
+#
+from pushto.stellarium import STC_POSITION
+
+
+def free_port():
+    """
+    Find a free local tcp port.
+
+    :return: port number
+    :rtype: int
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def recv_frame(sock):
+    """
+    Receive one 'CurrentPosition' frame from the STC.
+
+    :param sock: the socket standing in for Stellarium
+    :type sock: :obj:`socket.socket`
+
+    :return: the frame
+    :rtype: bytes
+    """
+    data = b''
+    while len(data) < STC_POSITION.size:
+        chunk = sock.recv(STC_POSITION.size - len(data))
+        if not chunk:
+            raise ConnectionError('STC closed the connection')
+        data += chunk
+    return data
+
+
+def open_pty():
+    """
+    Open a raw pseudo terminal, standing in for the Arduino serial port.
+
+    :return: file descriptor of the master side and name of the slave side
+    :rtype: list(int, str)
+    """
+    import tty
+    master, slave = os.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    name = os.ttyname(slave)
+    os.close(slave)
+    return master, name
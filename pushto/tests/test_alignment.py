@@ -93,6 +93,80 @@ class TestAligner(unittest.TestCase):
         self.assertEqual(len(self.aligner.stars), 2)
         self.assertIsNotNone(self.aligner.R_chi2)
 
+    def test_remove_star(self):
+        phi1, theta1 = pushto.alignment.angles_from_vec(self.t1)
+        azi1, alt1 = pushto.alignment.angles_from_vec(self.e1)
+        phi2, theta2 = pushto.alignment.angles_from_vec(self.t2)
+        azi2, alt2 = pushto.alignment.angles_from_vec(self.e2)
+        self.aligner.add_star(phi1, theta1, azi1, alt1)
+        self.aligner.add_star(phi2, theta2, azi2, alt2)
+        R = self.aligner.R.copy()
+
+        self.aligner.add_star(phi1, theta1, azi2, alt2)
+        self.aligner.remove_star(2)
+        self.assertEqual(len(self.aligner.stars), 2)
+        self.assertTrue(np.allclose(self.aligner.R, R))
+        self.assertTrue(np.allclose(np.matmul(self.aligner.R, self.aligner.R_inv), np.identity(3)))
+
+        self.aligner.remove_star(0)
+        self.assertIsNone(self.aligner.R_chi2)
+        self.assertTrue(np.array_equal(self.aligner.R, np.identity(3)))
+
+    def test_window(self):
+        aligner = pushto.alignment.Aligner(window=2)
+        phi1, theta1 = pushto.alignment.angles_from_vec(self.t1)
+        azi1, alt1 = pushto.alignment.angles_from_vec(self.e1)
+        phi2, theta2 = pushto.alignment.angles_from_vec(self.t2)
+        azi2, alt2 = pushto.alignment.angles_from_vec(self.e2)
+        aligner.add_star(phi2, theta2, azi1, alt1)
+        aligner.add_star(phi1, theta1, azi1, alt1)
+        aligner.add_star(phi2, theta2, azi2, alt2)
+        self.assertEqual(len(aligner.stars), 2)
+
+        self.aligner.add_star(phi1, theta1, azi1, alt1)
+        self.aligner.add_star(phi2, theta2, azi2, alt2)
+        self.assertTrue(np.allclose(aligner.R, self.aligner.R))
+
+    def test_forget(self):
+        aligner = pushto.alignment.Aligner(forget=0.5)
+        phi1, theta1 = pushto.alignment.angles_from_vec(self.t1)
+        azi1, alt1 = pushto.alignment.angles_from_vec(self.e1)
+        phi2, theta2 = pushto.alignment.angles_from_vec(self.t2)
+        azi2, alt2 = pushto.alignment.angles_from_vec(self.e2)
+        aligner.add_star(phi1, theta1, azi1, alt1)
+        aligner.add_star(phi2, theta2, azi2, alt2)
+
+        "the first star now has half the weight of the second one"
+        self.aligner.add_star(phi1, theta1, azi1, alt1, weight=1)
+        self.aligner.add_star(phi2, theta2, azi2, alt2, weight=2)
+        self.assertTrue(np.allclose(aligner.R, self.aligner.R))
+
+    def test_forget_bounded(self):
+        aligner = pushto.alignment.Aligner(forget=0.5)
+        phi1, theta1 = pushto.alignment.angles_from_vec(self.t1)
+        azi1, alt1 = pushto.alignment.angles_from_vec(self.e1)
+        phi2, theta2 = pushto.alignment.angles_from_vec(self.t2)
+        azi2, alt2 = pushto.alignment.angles_from_vec(self.e2)
+        for _ in range(100):
+            aligner.add_star(phi1, theta1, azi1, alt1)
+            aligner.add_star(phi2, theta2, azi2, alt2)
+        "the stars below the min weight are dropped, the weight sum is kept"
+        self.assertLess(len(aligner.stars), 30)
+        self.assertAlmostEqual(aligner.norm, sum(aligner._weight(star) for star in aligner.stars))
+
+    def test_covariance(self):
+        phi1, theta1 = pushto.alignment.angles_from_vec(self.t1)
+        azi1, alt1 = pushto.alignment.angles_from_vec(self.e1)
+        phi2, theta2 = pushto.alignment.angles_from_vec(self.t2)
+        azi2, alt2 = pushto.alignment.angles_from_vec(self.e2)
+        self.aligner.add_star(phi1, theta1, azi1, alt1)
+        self.aligner.add_star(phi2, theta2, azi2, alt2)
+        "the covariance scales with the inverse of the weight sum, not of the number of stars"
+        aligner = pushto.alignment.Aligner()
+        aligner.add_star(phi1, theta1, azi1, alt1, weight=4)
+        aligner.add_star(phi2, theta2, azi2, alt2, weight=4)
+        self.assertTrue(np.allclose(aligner.corr, self.aligner.corr/4))
+
     def test_taki(self):
         phi1, theta1 = pushto.alignment.angles_from_vec(self.t1)
         azi1, alt1 = pushto.alignment.angles_from_vec(self.e1)
@@ -0,0 +1,64 @@
+import io
+import os
+import tempfile
+import unittest
+import numpy as np
+import astropy.units as u
+import pushto.batch
+from pushto.telescope import Encoders, PointingModel
+from pushto.alignment import Aligner
+from pushto.site import Location
+
+
+class TestBatchProcessor(unittest.TestCase):
+
+    def setUp(self):
+        self.enc = Encoders(phi_npr=15507, theta_npr=27196, flip_phi=True, flip_theta=True)
+        self.pm = PointingModel(ia=30, ie=-20, an=15, aw=-10, ca=25, npae=5, tx=3, tf=8)
+        self.aligner = Aligner()
+        for p, t in ((10, 20), (100, 50), (220, 70)):
+            self.aligner.add_star(p, t, p + 1.5, t - 0.7)
+        self.location = Location(33.30167, -87.60750, 85, 1013*u.hPa, 15*u.deg_C, 0.75)
+        self.batch = pushto.batch.BatchProcessor(self.enc, self.pm, self.location, self.aligner)
+
+        rng = np.random.default_rng(2)
+        self.utc = 1668701698.967 + np.arange(20)*30.0
+        self.phi_cnt = rng.integers(-8000, 8000, 20)
+        self.theta_cnt = rng.integers(-6000, -500, 20)
+
+    def test_process(self):
+        out = self.batch.process(self.utc, self.phi_cnt, self.theta_cnt)
+        for i in range(0, 20, 5):
+            phi_raw, theta_raw = self.enc.convert(self.phi_cnt[i], self.theta_cnt[i])
+            phi, theta = self.pm.apply(phi_raw, theta_raw)
+            azi, alt = self.aligner.telescope_to_horizontal(phi, theta)
+            ra, dec = self.location.horizontal_to_equatorial(azi, alt, self.utc[i])
+            self.assertAlmostEqual(out['phi'][i], phi)
+            self.assertAlmostEqual(out['alt'][i], alt)
+            self.assertAlmostEqual(out['ra'][i], ra, places=7)
+            self.assertAlmostEqual(out['dec'][i], dec, places=6)
+
+    def test_run(self):
+        chunks = [(self.utc[i:i + 6], self.phi_cnt[i:i + 6], self.theta_cnt[i:i + 6]) for i in range(0, 20, 6)]
+        whole = self.batch.process(self.utc, self.phi_cnt, self.theta_cnt)
+        for workers in (0, 2):
+            outs = list(self.batch.run(chunks, workers))
+            self.assertEqual(len(outs), 4)
+            np.testing.assert_allclose(np.concatenate([o['ra'] for o in outs]), whole['ra'])
+
+    def test_text(self):
+        out = self.batch.process(self.utc, self.phi_cnt, self.theta_cnt)
+        f = io.StringIO()
+        pushto.batch.write_text(f, out, header=True)
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'out.txt')
+            with open(filename, 'w') as g:
+                g.write(f.getvalue())
+            chunks = list(pushto.batch.read_text(filename, size=7))
+        self.assertEqual([len(c[0]) for c in chunks], [7, 7, 6])
+        np.testing.assert_array_equal(np.concatenate([c[1] for c in chunks]), self.phi_cnt)
+        np.testing.assert_allclose(np.concatenate([c[0] for c in chunks]), self.utc)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pushto.benchmarks
+from pushto.benchmarks.stages import run_stages
+from pushto.benchmarks.pipeline import run_pipeline
+from pushto.config import Configuration
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_summarize(self):
+        summary = pushto.benchmarks.summarize(np.linspace(1e-6, 100e-6, 100), elapsed=0.01)
+        self.assertEqual(summary['count'], 100)
+        self.assertAlmostEqual(summary['throughput'], 1e4)
+        self.assertAlmostEqual(summary['p50_us'], 50.5)
+        self.assertLess(summary['p99_us'], 100)
+
+    def test_save_load(self):
+        results = {'a': {'p50_us': 2.0}, 'b': {'p50_us': 4.0}}
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'results.json')
+            pushto.benchmarks.save_results(results, filename)
+            self.assertEqual(pushto.benchmarks.load_results(filename), results)
+        ratios = pushto.benchmarks.compare_results({'a': {'p50_us': 1.0}, 'c': {'p50_us': 1.0}}, results)
+        self.assertEqual(ratios, {'a': 0.5})
+
+    def test_stages(self):
+        results = run_stages(Configuration(), n=20)
+        for name in ('encoders.convert', 'pointing.apply', 'aligner.telescope_to_horizontal',
+                     'location.horizontal_to_equatorial', 'stellarium.stc_encode', 'messages.from_json'):
+            self.assertEqual(results[name]['count'], 20)
+            self.assertGreater(results[name]['throughput'], 0)
+
+    def test_pipeline(self):
+        results = run_pipeline(Configuration(), n=20, burst=50, fmt='binary')
+        self.assertEqual(results['pipeline.latency']['count'], 20)
+        self.assertEqual(results['pipeline.throughput']['count'], 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import time
+import tempfile
+import unittest
+import numpy as np
+from pushto.alignment import vec_from_angles, angles_from_vec
+from pushto.catalog import Catalog, cube_pixel, pixel_vectors
+
+
+class TestCubePixel(unittest.TestCase):
+
+    def test_centers(self):
+        for nside in (1, 4, 7):
+            pix = cube_pixel(pixel_vectors(nside).T, nside)
+            self.assertEqual(pix.tolist(), list(range(6*nside*nside)))
+
+
+class TestCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        v = rng.normal(size=(3, 5000))
+        ra, dec = angles_from_vec(v)
+        self.ra = ra*24/360
+        self.dec = dec
+        self.mag = rng.uniform(-1, 10, len(ra))
+        self.stars = os.path.join(self.dir.name, 'stars.txt')
+        with open(self.stars, 'w') as f:
+            f.write('# ra dec mag name\n')
+            for i, (r, d, m) in enumerate(zip(self.ra, self.dec, self.mag)):
+                f.write('%.8f %.8f %.2f HIP %d\n' % (r, d, m, i))
+        self.dso = os.path.join(self.dir.name, 'dso.txt')
+        with open(self.dso, 'w') as f:
+            f.write('0.7123 41.2689 3.4 M 31\n')
+            f.write('not a row\n')
+        self.catalog = Catalog.open([self.stars, self.dso])
+
+    def tearDown(self):
+        self.catalog.close()
+        self.dir.cleanup()
+
+    def test_open(self):
+        self.assertEqual(len(self.catalog), 5001)
+        index, sep = self.catalog.nearest(0.7123, 41.2689)
+        self.assertEqual(self.catalog.name(index[0]), 'M 31')
+        self.assertLess(sep[0], 1e-5)
+        ra, dec = self.catalog.radec(index[0])
+        self.assertAlmostEqual(ra, 0.7123)
+        self.assertAlmostEqual(dec, 41.2689)
+
+        "the cache is reused, and rebuilt when a list changes"
+        cache = self.catalog.filename
+        mtime = os.path.getmtime(cache)
+        Catalog.open([self.stars, self.dso]).close()
+        self.assertEqual(os.path.getmtime(cache), mtime)
+        later = time.time() + 10
+        os.utime(self.dso, (later, later))
+        Catalog.open([self.stars, self.dso]).close()
+        self.assertGreater(os.path.getmtime(cache), mtime)
+
+    def test_queries(self):
+        rng = np.random.default_rng(1)
+        vectors = vec_from_angles(self.ra*360/24, self.dec)
+        mag = self.mag.astype(np.float32)
+        for _ in range(100):
+            ra, dec = rng.uniform(0, 24), rng.uniform(-90, 90)
+            radius = rng.choice([0.5, 3, 20, 100])
+            v = vec_from_angles(ra*360/24, dec)
+            cos = v @ vectors
+
+            index, sep = self.catalog.cone(ra, dec, radius)
+            names = sorted(self.catalog.name(i) for i in index if self.catalog.name(i) != 'M 31')
+            expected = sorted('HIP %d' % i for i in np.flatnonzero(cos >= np.cos(np.radians(radius))))
+            self.assertEqual(names, expected)
+            self.assertTrue(np.all(np.diff(sep) >= 0))
+            self.assertTrue(np.all(sep <= radius))
+
+            index, sep = self.catalog.nearest(ra, dec, k=2, mag_limit=3)
+            bright = np.flatnonzero(mag <= np.float32(3))
+            expected = ['HIP %d' % i for i in bright[np.argsort(-cos[bright])][:2]]
+            self.assertEqual([self.catalog.name(i) for i in index], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import numpy as np
+import pushto.clock
+
+
+class TestClockSync(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.millis = np.arange(1000)*50 + 1234
+        self.truth = 1668701698.967 + (self.millis - 1234)/1000*(1 + 50e-6)
+        delay = 0.005 + rng.exponential(0.002, len(self.millis))
+        delay[::37] += 0.3
+        self.arrival = self.truth + delay
+
+    def test_update(self):
+        clock = pushto.clock.ClockSync()
+        self.assertFalse(clock.synced)
+        utc = [clock.update(m, a) for m, a in zip(self.millis, self.arrival)]
+        self.assertTrue(clock.synced)
+        self.assertAlmostEqual(clock.rate, 1 + 50e-6, places=3)
+
+        err = np.array(utc[100:]) - self.truth[100:]
+        self.assertLess(np.max(np.abs(err - 0.005)), 0.002)
+        self.assertLess(clock.latency, 0.005)
+        self.assertAlmostEqual(clock.to_unix(self.millis[-1]), utc[-1])
+
+    def test_convert(self):
+        clock = pushto.clock.ClockSync()
+        millis = np.concatenate((self.millis, self.millis[:500]))
+        arrival = np.concatenate((self.arrival, self.arrival[:500] + 100))
+        utc = clock.convert(millis, arrival)
+        self.assertFalse(clock.synced)
+        self.assertLess(np.max(np.abs(utc[:1000] - self.truth - 0.005)), 0.002)
+        "after the reset the second segment is fitted on its own"
+        self.assertLess(np.max(np.abs(utc[1000:] - self.truth[:500] - 100.005)), 0.002)
+
+    def test_wrap(self):
+        clock = pushto.clock.ClockSync()
+        millis = (self.millis + pushto.clock.MILLIS_WRAP - 25000) % pushto.clock.MILLIS_WRAP
+        utc = [clock.update(m, a) for m, a in zip(millis, self.arrival)]
+        self.assertEqual(clock.wraps, 1)
+        self.assertLess(np.max(np.abs(np.array(utc[100:]) - self.truth[100:] - 0.005)), 0.002)
+
+    def test_reset(self):
+        clock = pushto.clock.ClockSync()
+        for m, a in zip(self.millis[:50], self.arrival[:50]):
+            clock.update(m, a)
+        self.assertTrue(clock.synced)
+        clock.update(10, self.arrival[50])
+        self.assertFalse(clock.synced)
+
+    def test_micros(self):
+        clock = pushto.clock.ClockSync(tick=1e-6)
+        micros = (1000*self.millis + pushto.clock.MILLIS_WRAP - 25000000) % pushto.clock.MILLIS_WRAP
+        utc = [clock.update(m, a) for m, a in zip(micros, self.arrival)]
+        self.assertEqual(clock.wraps, 1)
+        self.assertLess(np.max(np.abs(np.array(utc[100:]) - self.truth[100:] - 0.005)), 0.002)
+        self.assertLess(np.max(np.abs(clock.convert(micros, self.arrival)[100:] - self.truth[100:] - 0.005)), 0.002)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,6 +12,29 @@ class TestConfiguration(unittest.TestCase):
         cfg = pushto.config.Configuration(filename=pushto.config.DEFAULT_CONFIG_FILE)
         self.assertIn('COMMUNICATION', cfg.config)
 
+    def test_address(self):
+        cfg = pushto.config.Configuration()
+        "every edge is reachable over tcp unless inproc or ipc is opted in"
+        default = pushto.config.Configuration(filename=pushto.config.DEFAULT_CONFIG_FILE)
+        for edge in pushto.config.EDGES:
+            self.assertEqual(cfg.get_transport(edge), 'tcp')
+            self.assertEqual(default.get_transport(edge), 'tcp')
+        cfg.set_host_ip('127.0.0.1')
+        cfg.set_td_ta_port('10011')
+        cfg.set_transport('td_ta', 'tcp')
+        self.assertEqual(cfg.get_address('td_ta'), 'tcp://127.0.0.1:10011')
+        cfg.set_transport('td_ta', 'ipc')
+        self.assertTrue(cfg.get_address('td_ta').startswith('ipc://'))
+        self.assertTrue(cfg.get_address('td_ta').endswith('pushto-10011'))
+        cfg.set_transport('td_ta', 'inproc')
+        self.assertEqual(cfg.get_address('td_ta'), 'inproc://pushto-td_ta')
+        with self.assertRaises(ValueError):
+            cfg.set_transport('td_ta', 'udp')
+        "a typo in the file is not taken for tcp"
+        cfg.config['COMMUNICATION']['td_ta_transport'] = 'inporc'
+        with self.assertRaises(ValueError):
+            cfg.get_address('td_ta')
+
     def test_save_default(self):
         cfg = pushto.config.Configuration()
         cfg.save()
@@ -0,0 +1,80 @@
+import unittest
+import numpy as np
+import astropy.units as u
+from astropy.time import Time
+import pushto.site
+from pushto.alignment import Aligner, vec_from_angles
+from pushto.guidance import Guide
+from pushto.messages import DataMessage
+
+
+class TestGuide(unittest.TestCase):
+
+    def setUp(self):
+        self.location = pushto.site.Location(lat=33.3, lon=-87.6, elev=85, pres=1013*u.hPa,
+                                             temp=15*u.deg_C, relh=0.75, refresh=2)
+        self.aligner = Aligner()
+        for p, t in ((10, 20), (100, 50), (220, 70), (300, 30)):
+            self.aligner.add_star(p, t, p + 1.5, t - 0.7)
+        self.utc = Time('2022-11-17 16:14:58.967', format='iso').unix
+        self.guide = Guide(self.location, self.aligner)
+        self.ra, self.dec = self.location.horizontal_to_equatorial(123.4, 45.6, self.utc)
+
+    def test_on_target(self):
+        self.guide.set_target(self.ra, self.dec, self.utc)
+        for dt in (0, 3.3, 7.1, 10, 25):
+            azi, alt = self.location.equatorial_to_horizontal(self.ra, self.dec, self.utc + dt)
+            phi, theta = self.aligner.horizontal_to_telescope(azi, alt)
+            d_phi, d_theta, sep = self.guide.offsets(phi, theta, self.utc + dt)
+            self.assertLess(3600*sep, 0.05)
+            self.assertLess(3600*abs(d_phi), 0.1)
+            self.assertLess(3600*abs(d_theta), 0.1)
+
+    def test_interpolation(self):
+        "the interpolated direction of the target is within 0.01 arcsec of the exact one"
+        guide = Guide(self.location, Aligner())
+        for alt in (5, 45, 89):
+            for azi in (0, 120, 240):
+                ra, dec = self.location.horizontal_to_equatorial(azi, alt, self.utc)
+                guide.set_target(ra, dec, self.utc)
+                for dt in (2.5, 5, 7.5):
+                    exact = vec_from_angles(*self.location.equatorial_to_horizontal(ra, dec, self.utc + dt))
+                    error = np.linalg.norm(np.array(guide.target(self.utc + dt)) - exact)
+                    self.assertLess(np.degrees(error)*3600, 0.01)
+
+    def test_offsets(self):
+        self.guide.set_target(self.ra, self.dec, self.utc)
+        azi, alt = self.location.equatorial_to_horizontal(self.ra, self.dec, self.utc)
+        phi, theta = self.aligner.horizontal_to_telescope(azi, alt)
+        d_phi, d_theta, sep = self.guide.offsets(phi - 1, theta + 0.5, self.utc)
+        self.assertAlmostEqual(d_phi, 1, places=4)
+        self.assertAlmostEqual(d_theta, -0.5, places=4)
+        self.assertLess(sep, 1.2)
+        self.assertGreater(sep, 0.5)
+
+        "wrapped azimuthal offsets"
+        d_phi, _, _ = self.guide.offsets(phi + 359, theta, self.utc)
+        self.assertAlmostEqual(d_phi, 1, places=4)
+
+    def test_handle(self):
+        msg = DataMessage(time=self.utc, phi=30.0, theta=45.0, utc=True)
+        self.assertIsNone(self.guide.handle(msg))
+        self.guide.set_target(self.ra, self.dec, self.utc)
+        guide = self.guide.handle(msg)
+        self.assertEqual(guide.type, 'GUIDE')
+        self.assertEqual(guide.time, self.utc)
+        self.assertEqual(guide.phi, 30.0)
+        self.guide.clear()
+        self.assertFalse(self.guide.active)
+        self.assertIsNone(self.guide.handle(msg))
+
+    def test_alignment_change(self):
+        self.guide.set_target(self.ra, self.dec, self.utc)
+        before = self.guide.target(self.utc)
+        self.aligner.reset()
+        after = self.guide.target(self.utc)
+        self.assertNotAlmostEqual(before[0], after[0], places=3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import json
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from pushto.stellarium import StellariumRPC, rpc_session
+from pushto.harvest import InfoCache, Harvester
+
+OBJECTS = {'StarMgr': ['Polaris', 'Vega', 'Deneb', 'Altair', 'Sirius', 'Capella'],
+           'NebulaMgr': ['M31', 'M42']}
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """
+    Stand-in for the Stellarium Remote Control api, failing the first request of 'Vega'.
+    """
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        with server.lock:
+            server.hits.append(url.path)
+            server.active += 1
+            server.peak = max(server.peak, server.active)
+        try:
+            if url.path == '/api/objects/listobjecttypes':
+                body = [{'key': k, 'name': k} for k in OBJECTS]
+            elif url.path == '/api/objects/listobjectsbytype':
+                body = OBJECTS[query['type']]
+            elif url.path == '/api/objects/info' and query.get('name') in sum(OBJECTS.values(), []):
+                name = query['name']
+                with server.lock:
+                    fail = name == 'Vega' and name not in server.failed
+                    server.failed.add(name)
+                if fail:
+                    self.send_error(503)
+                    return
+                body = {'name': name, 'ra': 10.0, 'dec': 20.0}
+            else:
+                self.send_error(404)
+                return
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHarvester(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+        self.server.hits = []
+        self.server.failed = set()
+        self.server.lock = threading.Lock()
+        self.server.active = 0
+        self.server.peak = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:%d/api' % self.server.server_address[1]
+        self.clock = [1000.0]
+        self.cache = InfoCache(':memory:', ttl=60, now=lambda: self.clock[0])
+        rpc = StellariumRPC(self.url, rpc_session(pool=2, retries=2, backoff=0))
+        self.harvester = Harvester(rpc, self.cache, workers=2, list_ttl=600, info_ttl=60)
+
+    def tearDown(self):
+        self.cache.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_harvest(self):
+        done, failed = self.harvester.harvest(names=['M31', 'Unknown'], types=['StarMgr'])
+        self.assertEqual((done, failed), (7, 1))
+        self.assertLessEqual(self.server.peak, 2)
+        "Vega was retried"
+        self.assertEqual(self.server.hits.count('/api/objects/info'), 9)
+
+        "lookups are served by the cache"
+        hits = len(self.server.hits)
+        self.assertEqual(self.harvester.lookup('Vega')['name'], 'Vega')
+        self.assertEqual(self.harvester.info('M31')['name'], 'M31')
+        self.assertIsNone(self.harvester.lookup('M42'))
+        self.assertEqual(self.harvester.harvest(types=['StarMgr']), (0, 0))
+        self.assertEqual(len(self.server.hits), hits)
+
+        "the info expires before the lists"
+        self.clock[0] += 120
+        self.assertIsNone(self.harvester.lookup('Vega'))
+        self.assertEqual(self.harvester.harvest(types=['StarMgr']), (6, 0))
+        self.assertEqual(len(self.server.hits), hits + 6)
+
+    def test_cache(self):
+        self.cache.put('a', {'x': 1})
+        self.cache.put('b', [1, 2], ttl=10)
+        self.assertEqual(self.cache.get('a'), {'x': 1})
+        self.assertEqual(self.cache.missing(['a', 'b', 'c']), ['c'])
+        self.clock[0] += 30
+        self.assertEqual(self.cache.missing(['a', 'b', 'c']), ['b', 'c'])
+        self.assertEqual(self.cache.purge(), 1)
+        self.assertEqual(len(self.cache), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,6 @@
+import json
 import unittest
+import zmq
 import pushto.messages
 
 
@@ -101,5 +103,94 @@ class TestAlignMessage(unittest.TestCase):
         self.assertIsInstance(msg, pushto.messages.AlignMessage)
 
 
+class TestWireFormat(unittest.TestCase):
+
+    def test_data_bytes(self):
+        msg = pushto.messages.DataMessage(time='2034', phi_cnt='-548', theta_cnt=870, phi=1.5, theta=-2.5)
+        data = msg.to_bytes()
+        self.assertEqual(len(data), pushto.messages.DataMessage.layout.size)
+        self.assertLess(len(data), len(json.dumps(msg.to_json())))
+
+        msg = pushto.messages.Message.from_bytes(data)
+        self.assertIsInstance(msg, pushto.messages.DataMessage)
+        self.assertEqual(msg.time, 2034.0)
+        self.assertEqual(msg.phi_cnt, -548)
+        self.assertEqual(msg.theta_cnt, 870)
+        self.assertEqual(msg.phi, 1.5)
+        self.assertEqual(msg.theta, -2.5)
+        self.assertIsNone(msg.ra)
+
+    def test_data_utc(self):
+        "the kind of time survives both formats"
+        for utc in (True, False, None):
+            msg = pushto.messages.DataMessage(time=1200.0, phi=1.5, utc=utc)
+            for data in (msg.to_bytes(), json.dumps(msg.to_json()).encode('utf-8')):
+                self.assertEqual(pushto.messages.Message.from_wire(data).utc, utc)
+
+    def test_align_bytes(self):
+        msg = pushto.messages.AlignMessage(time='2022-11-17 16:14:58.967', ra=12, dec=-30)
+        msg = pushto.messages.Message.from_bytes(msg.to_bytes())
+        self.assertIsInstance(msg, pushto.messages.AlignMessage)
+        self.assertAlmostEqual(msg.time, 1668701698.967)
+        self.assertEqual(msg.ra, 12)
+        self.assertEqual(msg.dec, -30)
+        self.assertIsNone(msg.azi)
+
+    def test_cmd_bytes(self):
+        msg = pushto.messages.CmdMessage(cmd='stop', opt={'opt1': 1})
+        msg = pushto.messages.Message.from_bytes(msg.to_bytes())
+        self.assertIsInstance(msg, pushto.messages.CmdMessage)
+        self.assertEqual(msg.cmd, 'stop')
+        self.assertEqual(msg.opt, {'opt1': 1})
+
+    def test_guide_bytes(self):
+        msg = pushto.messages.GuideMessage(time=2034.5, phi=10, theta=20, d_phi=-1.5, d_theta=0.25, sep=1.2)
+        for data in (msg.to_bytes(), json.dumps(msg.to_json()).encode('utf-8')):
+            msg = pushto.messages.Message.from_wire(data)
+            self.assertIsInstance(msg, pushto.messages.GuideMessage)
+            self.assertEqual(msg.time, 2034.5)
+            self.assertEqual(msg.d_phi, -1.5)
+            self.assertEqual(msg.d_theta, 0.25)
+            self.assertEqual(msg.sep, 1.2)
+
+    def test_version(self):
+        data = bytearray(pushto.messages.CmdMessage(cmd='stop').to_bytes())
+        data[0] = 99
+        with self.assertRaises(ValueError):
+            pushto.messages.Message.from_bytes(data)
+
+    def test_send_recv(self):
+        ctx = zmq.Context()
+        pull = ctx.socket(zmq.PAIR)
+        pull.bind('inproc://test_send_recv')
+        push = ctx.socket(zmq.PAIR)
+        push.connect('inproc://test_send_recv')
+        for fmt in pushto.messages.message_formats:
+            pushto.messages.send_message(push, pushto.messages.DataMessage(time=1.0, phi_cnt=7), fmt)
+            msg = pushto.messages.recv_message(pull)
+            self.assertIsInstance(msg, pushto.messages.DataMessage)
+            self.assertEqual(msg.phi_cnt, 7)
+        push.close()
+        pull.close()
+        ctx.term()
+
+    def test_send_recv_batch(self):
+        ctx = zmq.Context()
+        pull = ctx.socket(zmq.PAIR)
+        pull.bind('inproc://test_send_recv_batch')
+        push = ctx.socket(zmq.PAIR)
+        push.connect('inproc://test_send_recv_batch')
+        for fmt in pushto.messages.message_formats:
+            msgs = [pushto.messages.DataMessage(time=1.0, phi_cnt=i) for i in range(3)]
+            pushto.messages.send_messages(push, msgs, fmt)
+            self.assertEqual([m.phi_cnt for m in pushto.messages.recv_messages(pull)], [0, 1, 2])
+            "the frames of a batch can also be received one by one"
+            pushto.messages.send_messages(push, msgs, fmt)
+            self.assertEqual([pushto.messages.recv_message(pull).phi_cnt for _ in range(3)], [0, 1, 2])
+        push.close()
+        pull.close()
+        ctx.term()
+
+
 if __name__ == '__main__':
     unittest.main()
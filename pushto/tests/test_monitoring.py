@@ -0,0 +1,68 @@
+import time
+import unittest
+import zmq
+import pushto.monitoring
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_percentile(self):
+        hist = pushto.monitoring.Histogram()
+        self.assertIsNone(hist.percentile(50))
+        for i in range(1, 101):
+            hist.record(i*1e-6)
+        self.assertEqual(hist.count, 100)
+        self.assertAlmostEqual(hist.max, 100e-6)
+        "the buckets have a ~12% resolution"
+        self.assertAlmostEqual(hist.percentile(50)/50e-6, 1, delta=0.13)
+        self.assertAlmostEqual(hist.percentile(99)/99e-6, 1, delta=0.13)
+        self.assertAlmostEqual(hist.percentile(100), 100e-6)
+
+    def test_overflow(self):
+        hist = pushto.monitoring.Histogram()
+        hist.record(100.0)
+        hist.record(-1.0)
+        self.assertEqual(hist.counts[-1], 1)
+        self.assertEqual(hist.counts[0], 1)
+        self.assertEqual(hist.percentile(99), 100.0)
+
+
+class TestMonitor(unittest.TestCase):
+
+    def test_snapshot(self):
+        monitor = pushto.monitoring.Monitor('test', interval=1)
+        for _ in range(10):
+            monitor.record('stage', 1e-3)
+        snapshot = monitor.snapshot(monitor.start + 2)
+        self.assertEqual(snapshot['type'], 'MONI')
+        self.assertEqual(snapshot['source'], 'test')
+        stage = snapshot['stages']['stage']
+        self.assertEqual(stage['count'], 10)
+        self.assertAlmostEqual(stage['rate'], 5)
+        self.assertAlmostEqual(stage['p50_us'], 1000, delta=1)
+        self.assertEqual(monitor.stages['stage'].count, 0)
+        self.assertIn('stage', pushto.monitoring.format_snapshot(snapshot))
+
+    def test_hub(self):
+        ctx = zmq.Context()
+        try:
+            hub = pushto.monitoring.MonitorHub('inproc://test-monitoring', ctx)
+            hub.start()
+            sub = ctx.socket(zmq.SUB)
+            sub.subscribe('')
+            sub.connect('inproc://test-monitoring')
+            monitor = pushto.monitoring.Monitor('test', pushto.monitoring.MONI_HUB_ADDRESS, ctx, interval=0)
+            time.sleep(0.2)
+            monitor.record('stage', 1e-3)
+            monitor.tick()
+            self.assertTrue(sub.poll(2000))
+            snapshot = sub.recv_json()
+            self.assertEqual(snapshot['stages']['stage']['count'], 1)
+            monitor.close()
+            sub.close(linger=0)
+        finally:
+            ctx.destroy(linger=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+import numpy as np
+import pushto.pointing
+from pushto.telescope import PointingModel, PM_TERMS
+
+
+class TestPointingFitter(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.truth = [30, -20, 15, -10, 25, 5, 3, 8]
+        self.azi = rng.uniform(0, 360, 200)
+        self.alt = rng.uniform(10, 80, 200)
+        self.phi, self.theta = PointingModel(*self.truth).deapply(self.azi, self.alt)
+
+    def test_fit(self):
+        fitter = pushto.pointing.PointingFitter()
+        fitter.add(self.phi, self.theta, self.azi, self.alt)
+        params = fitter.fit()
+        np.testing.assert_allclose(params, self.truth, atol=1e-3)
+        self.assertLess(fitter.rms, 1e-3)
+        self.assertEqual(fitter.n, 200)
+        da, de = fitter.residuals()
+        self.assertLess(np.max(np.abs(da)), 1e-2)
+        self.assertLess(np.max(np.abs(de)), 1e-2)
+
+    def test_incremental(self):
+        fitter = pushto.pointing.PointingFitter()
+        for i in range(200):
+            fitter.add(self.phi[i], self.theta[i], self.azi[i], self.alt[i])
+            fitter.fit()
+        np.testing.assert_allclose(fitter.params, self.truth, atol=1e-3)
+
+    def test_noise(self):
+        rng = np.random.default_rng(1)
+        fitter = pushto.pointing.PointingFitter()
+        fitter.add(self.phi + rng.normal(0, 5/3600, 200), self.theta + rng.normal(0, 5/3600, 200),
+                   self.azi, self.alt)
+        fitter.fit()
+        errors = fitter.errors()
+        for term, value, truth in zip(PM_TERMS, fitter.params, self.truth):
+            self.assertLess(abs(value - truth), 5*errors[term])
+        self.assertAlmostEqual(fitter.rms, 5*np.sqrt(1 + np.mean(np.cos(np.radians(self.theta))**2)), delta=1)
+
+    def test_terms(self):
+        fitter = pushto.pointing.PointingFitter(terms=('ia', 'ie'))
+        phi, theta = PointingModel(ia=30, ie=-20).deapply(self.azi, self.alt)
+        fitter.add(phi, theta, self.azi, self.alt)
+        np.testing.assert_allclose(fitter.fit(), [30, -20, 0, 0, 0, 0, 0, 0], atol=1e-3)
+        self.assertEqual(fitter.cov.shape, (2, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
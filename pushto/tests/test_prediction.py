@@ -0,0 +1,69 @@
+import unittest
+import pushto.config
+import pushto.prediction
+from pushto.messages import DataMessage
+
+
+class TestPredictor(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = 100.0
+        self.predictor = pushto.prediction.Predictor(horizon=0.5, deadband=0.01, now=lambda: self.clock)
+
+    def add_track(self, rate=1.0, n=10, ra0=23.99):
+        "a telescope moving at rate deg/s along the equator, across ra = 0"
+        for i in range(n):
+            self.predictor.add(99.0 + 0.1*i, (ra0 + rate*0.1*i/15) % 24, 0.0)
+
+    def test_extrapolate(self):
+        self.add_track()
+        self.assertAlmostEqual(self.predictor.speed, 1.0, places=4)
+        "0.1s after the last sample"
+        utc, ra, dec = self.predictor.position()
+        self.assertEqual(utc, 100.0)
+        self.assertAlmostEqual(ra, (23.99 + 1.0/15) % 24, places=4)
+        self.assertAlmostEqual(dec, 0.0)
+        "the extrapolation stops at the horizon"
+        utc, ra, dec = self.predictor.position(102.0)
+        self.assertAlmostEqual(ra, (23.99 + 1.4/15) % 24, places=4)
+
+    def test_deadband(self):
+        self.add_track(rate=0.005)
+        utc, ra, dec = self.predictor.position()
+        self.assertAlmostEqual(ra, (23.99 + 0.0045/15) % 24, places=9)
+
+    def test_interpolate(self):
+        self.add_track()
+        self.predictor.delay = 0.25
+        utc, ra, dec = self.predictor.position()
+        self.assertEqual(utc, 99.75)
+        self.assertAlmostEqual(ra, (23.99 + 0.75/15) % 24, places=4)
+        "before the first sample, it is held"
+        self.assertAlmostEqual(self.predictor.position(90.0)[1], 23.99, places=6)
+
+    def test_handle(self):
+        self.assertIsNone(self.predictor.position())
+        self.assertTrue(self.predictor.stale())
+        self.add_track()
+        self.assertFalse(self.predictor.stale())
+        self.clock = 200.0
+        self.assertTrue(self.predictor.stale())
+        "a sample from the past restarts the predictor"
+        utc, ra, dec = self.predictor.handle(DataMessage(time=199.9, ra=5.0, dec=10.0, utc=True))
+        self.assertEqual(len(self.predictor), 1)
+        self.assertEqual(utc, 200.0)
+        self.assertAlmostEqual(ra, 5.0)
+        self.assertAlmostEqual(dec, 10.0)
+        "without an acquisition time, e.g. an Arduino time stamp, the sample is passed through"
+        self.assertEqual(self.predictor.handle(DataMessage(time=1200.0, ra=1.0, dec=2.0)), (1200.0, 1.0, 2.0))
+        self.assertEqual(len(self.predictor), 1)
+
+    def test_setup(self):
+        cfg = pushto.config.Configuration()
+        self.assertIsNone(pushto.prediction.Predictor.setup(cfg))
+        cfg.set_stc_horizon(0.25)
+        self.assertEqual(pushto.prediction.Predictor.setup(cfg).horizon, 0.25)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import socket
+import struct
+import time
+import unittest
+import zmq
+from pushto.config import Configuration
+from pushto.runtime import AsyncRuntime, Pipeline
+from pushto.tests.support import free_port, open_pty, recv_frame
+from pushto.stellarium import stc_decode
+
+
+class TestPipeline(unittest.TestCase):
+
+    def test_process(self):
+        pipeline = Pipeline.setup(Configuration())
+        utc = time.time()
+        msg = pipeline.process((1200, -3000), utc)
+        self.assertEqual(msg.time, utc)
+        self.assertEqual(msg.phi_cnt, 1200)
+        self.assertTrue(0 <= msg.ra < 24)
+        self.assertTrue(-90 <= msg.dec <= 90)
+
+        "syncing on the position just computed leaves the telescope where it is"
+        pd = pipeline.sync(msg.ra, msg.dec, utc)
+        self.assertAlmostEqual(pd['s_phi'], msg.phi, places=4)
+        self.assertAlmostEqual(pd['s_theta'], msg.theta, places=4)
+
+
+@unittest.skipUnless(hasattr(os, 'openpty'), 'requires pseudo terminals')
+class TestAsyncRuntime(unittest.TestCase):
+
+    def setUp(self):
+        self.master, port = open_pty()
+        self.cfg = Configuration()
+        self.cfg.set_host_ip('127.0.0.1')
+        self.cfg.set_serial_port(port)
+        for setter in (self.cfg.set_stc_port, self.cfg.set_pd_ta_port, self.cfg.set_gd_port):
+            setter(str(free_port()))
+        self.cfg.set_td_eq_decimation(2)
+        self.cfg.set_moni_interval(0)
+        self.ctx = zmq.Context()
+        self.runtime = AsyncRuntime.setup(self.cfg, self.ctx)
+        self.runtime.start()
+        self.client = socket.create_connection(('127.0.0.1', self.cfg.get_stc_port()))
+        self.client.settimeout(5)
+
+    def tearDown(self):
+        self.runtime.close()
+        self.client.close()
+        os.close(self.master)
+        self.ctx.destroy(linger=0)
+
+    def test_data(self):
+        time.sleep(0.1)
+        "two lines in one write, and a line split in two writes"
+        os.write(self.master, b'100 10 20 0 0\r\n200 11 21 0 0\r\n300 12 ')
+        os.write(self.master, b'22 0 0\r\n400 13 23 0 0\r\n')
+        for _ in range(2):
+            utc, ra, dec = stc_decode(recv_frame(self.client)[:20])
+            self.assertAlmostEqual(utc, time.time(), delta=5)
+            self.assertTrue(0 <= ra < 24)
+            self.assertTrue(-90 <= dec <= 90)
+        self.assertEqual(self.runtime.site.n, 4)
+
+    def test_goto(self):
+        sub = self.ctx.socket(zmq.SUB)
+        sub.subscribe('')
+        sub.connect('tcp://127.0.0.1:%s' % self.cfg.get_pd_ta_port())
+        time.sleep(0.2)
+        os.write(self.master, b'100 10 20 0 0\r\n200 11 21 0 0\r\n')
+        recv_frame(self.client)
+        self.client.sendall(struct.pack('<HHqIi', 20, 0, int(1e6*time.time()), 2**30, 2**29))
+        self.assertTrue(sub.poll(5000))
+        pd = sub.recv_json()
+        self.assertIn('s_phi', pd)
+        self.assertIn('model', pd)
+        sub.close(linger=0)
+
+    def test_clients(self):
+        other = socket.create_connection(('127.0.0.1', self.cfg.get_stc_port()))
+        other.settimeout(5)
+        while len(self.runtime.stel.clients) < 2:
+            time.sleep(0.01)
+        os.write(self.master, b'100 10 20 0 0\r\n200 11 21 0 0\r\n')
+        self.assertEqual(recv_frame(self.client), recv_frame(other))
+        other.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import serial.threaded
+import pushto.session
+
+
+class Collector(serial.threaded.LineReader):
+
+    def __init__(self, clock=None):
+        super().__init__()
+        self.clock = clock
+        self.received = []
+
+    def handle_line(self, line):
+        self.received.append((self.clock() if self.clock else None, line))
+
+
+class TestSession(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp.name, 'session.ptsc')
+        t0 = 1668701698.967
+        self.lines = [(t0, 'Write size: 25'),
+                      (t0 + 0.1, '1000 -548 870 0 0'),
+                      (t0 + 0.2, '1100 -540 880 0 1'),
+                      (t0 + 0.3, '1200 100000 -90000 0 1'),
+                      (t0 + 0.3, '01300 1 2 3 4'),
+                      (t0 + 0.4, 'garbage \xe9 line that is longer than one record'),
+                      (t0 + 0.5, '1400 1 2 70000 4'),
+                      (t0 + 0.6, '1500 2 3 70000 4')]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, lines):
+        capture = pushto.session.SessionWriter(self.filename)
+        for arrival, line in lines:
+            capture.write(line, arrival)
+        capture.close()
+
+    def test_roundtrip(self):
+        self.write(self.lines)
+        session = pushto.session.SessionReader(self.filename)
+        self.assertEqual(len(session), len(self.lines))
+        for (arrival, line), (t, l) in zip(self.lines, session.lines()):
+            self.assertEqual(line, l)
+            self.assertAlmostEqual(arrival, t, places=6)
+        self.assertEqual(os.path.getsize(self.filename) % pushto.session.RECORD.itemsize, 0)
+
+        "the non-canonical line and the error counts overflowing a delta are kept as text"
+        utc, millis, phi_cnt, theta_cnt, phi_err, theta_err = session.data()
+        np.testing.assert_array_equal(millis, [1000, 1100, 1200])
+        np.testing.assert_array_equal(phi_cnt, [-548, -540, 100000])
+        np.testing.assert_array_equal(theta_err, [0, 1, 1])
+        self.assertAlmostEqual(utc[-1], self.lines[3][0], places=6)
+
+    def test_iter_data(self):
+        self.write(self.lines)
+        session = pushto.session.SessionReader(self.filename)
+        chunks = list(session.iter_data(size=2))
+        self.assertEqual([len(c[0]) for c in chunks], [2, 1])
+        for whole, chunked in zip(session.data(), zip(*chunks)):
+            np.testing.assert_array_equal(whole, np.concatenate(chunked))
+
+    def test_append(self):
+        self.write(self.lines[:3])
+        self.write(self.lines[3:])
+        session = pushto.session.SessionReader(self.filename)
+        self.assertEqual([l for _, l in session.lines()], [l for _, l in self.lines])
+
+    def test_gap(self):
+        "a gap longer than the max dt, e.g. between two nights, keeps the arrival times"
+        t0 = self.lines[0][0]
+        lines = [(t0, '1000 1 2 0 0'), (t0 + 0.05, '1050 1 2 0 0'),
+                 (t0 + 10800.05, '2000 1 2 0 0'), (t0 + 10800.10, '2050 1 2 0 0')]
+        self.write(lines)
+        session = pushto.session.SessionReader(self.filename)
+        self.assertEqual(len(session), 4)
+        for (arrival, line), (t, l) in zip(lines, session.lines()):
+            self.assertEqual(line, l)
+            self.assertAlmostEqual(arrival - t0, t - t0, places=6)
+        np.testing.assert_array_equal(session.data()[1], [1000, 1050, 2000, 2050])
+
+    def test_append_nights(self):
+        "a second night appended to the capture of the first one"
+        night = [(arrival + 86400, line) for arrival, line in self.lines]
+        self.write(self.lines)
+        self.write(night)
+        session = pushto.session.SessionReader(self.filename)
+        self.assertEqual(len(session), 2*len(self.lines))
+        for (arrival, line), (t, l) in zip(self.lines + night, session.lines()):
+            self.assertEqual(line, l)
+            self.assertAlmostEqual(arrival, t, places=5)
+
+    def test_long_line(self):
+        "a text line is cut to the max length, on a character boundary, with a warning"
+        line = 'x' + '\xe9'*200
+        with self.assertLogs(level='WARNING'):
+            self.write([(self.lines[0][0], line)])
+        _, l = next(pushto.session.SessionReader(self.filename).lines())
+        self.assertEqual(l, line[:1 + (pushto.session.MAX_TEXT - 1)//2])
+
+    def test_replay(self):
+        self.write(self.lines)
+        clock = pushto.session.ReplayClock()
+        collector = Collector(clock)
+        replay = pushto.session.SessionReplay(pushto.session.SessionReader(self.filename), collector,
+                                              speed=0, clock=clock)
+        replay.start()
+        replay.join(5)
+        self.assertEqual([l for _, l in collector.received], [l for _, l in self.lines])
+        for (arrival, _), (t, _) in zip(self.lines, collector.received):
+            self.assertAlmostEqual(arrival, t, places=2)
+
+    def test_replay_speed(self):
+        self.write(self.lines)
+        collector = Collector()
+        replay = pushto.session.SessionReplay(pushto.session.SessionReader(self.filename), collector, speed=2)
+        replay.start()
+        replay.join(0.1)
+        self.assertTrue(replay.is_alive())
+        replay.join(5)
+        self.assertEqual(len(collector.received), len(self.lines))
+
+
+if __name__ == '__main__':
+    unittest.main()
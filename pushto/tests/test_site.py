@@ -1,6 +1,14 @@
+import itertools
+import json
+import time
 import unittest
+import zmq
+import astropy.units as u
 from astropy.time import Time
+import pushto.messages
+import pushto.pointing
 import pushto.site
+from pushto.messages import Message, DataMessage, AlignMessage
 
 
 class TestLocation(unittest.TestCase):
@@ -20,5 +28,141 @@ class TestLocation(unittest.TestCase):
         self.assertAlmostEqual(alt, 0)
 
 
+class TestTransformCache(unittest.TestCase):
+
+    def setUp(self):
+        self.location = pushto.site.Location(lat=33.3, lon=-87.6, elev=85, pres=1013*u.hPa,
+                                             temp=15*u.deg_C, relh=0.75, refresh=2)
+        self.utc = Time('2022-11-17 16:14:58.967', format='iso')
+
+    def test_transform_error(self):
+        self.assertLess(self.location.transform_error(self.utc, n=8), 1.0)
+
+    def test_round_trip(self):
+        ra, dec = self.location.horizontal_to_equatorial(123.4, 45.6, utc=self.utc)
+        azi, alt = self.location.equatorial_to_horizontal(ra, dec, utc=self.utc)
+        self.assertAlmostEqual(azi, 123.4, places=6)
+        self.assertAlmostEqual(alt, 45.6, places=6)
+
+    def test_refresh(self):
+        self.location.horizontal_to_equatorial(0, 45, utc=self.utc.unix)
+        epoch = self.location.cache.epoch
+        self.location.horizontal_to_equatorial(0, 45, utc=self.utc.unix + 1)
+        self.assertEqual(self.location.cache.epoch, epoch)
+        self.location.horizontal_to_equatorial(0, 45, utc=self.utc.unix + 3)
+        self.assertEqual(self.location.cache.epoch, self.utc.unix + 3)
+
+
+class TestSite(unittest.TestCase):
+
+    def setUp(self):
+        self.ctx = zmq.Context()
+        location = pushto.site.Location(lat=0, lon=0, elev=0, refresh=2)
+        self.site = pushto.site.Site('inproc://td_ta', 'inproc://td_eq', 'inproc://pd_eq', 'inproc://pd_ta',
+                                     location, self.ctx, decimation=5)
+
+    def tearDown(self):
+        self.ctx.destroy(linger=0)
+
+    def test_transform(self):
+        msg = self.site.transform(DataMessage(phi=30, theta=45))
+        self.assertAlmostEqual(msg.azi, 30)
+        self.assertAlmostEqual(msg.alt, 45)
+        self.assertIsNotNone(msg.time)
+        self.assertTrue(0 <= msg.ra < 24)
+        self.assertTrue(-90 <= msg.dec <= 90)
+        self.assertEqual(self.site.decimation, 5)
+
+    def test_transform_formats(self):
+        "an Arduino time stamp is a float in the binary format, it is never taken for a utc"
+        before = time.time()
+        for utc, fmt in itertools.product((True, False), pushto.messages.message_formats):
+            msg = DataMessage(time=1e9 if utc else 1200, phi=30, theta=45, utc=utc)
+            data = msg.to_bytes() if fmt == 'binary' else json.dumps(msg.to_json()).encode('utf-8')
+            msg = self.site.transform(Message.from_wire(data))
+            self.assertTrue(msg.utc)
+            if utc:
+                self.assertEqual(msg.time, 1e9)
+            else:
+                self.assertGreaterEqual(msg.time, before)
+
+    def test_handle_data(self):
+        self.assertIsNone(self.site.handle_align(AlignMessage(time=1e9, ra=1, dec=2)))
+        published = [self.site.handle_data(DataMessage(phi=30, theta=45)) for _ in range(10)]
+        self.assertEqual([i for i, msg in enumerate(published) if msg is not None], [4, 9])
+        self.assertEqual(self.site.n, 10)
+        pd = self.site.handle_align(AlignMessage(time=1e9, ra=1, dec=2))
+        self.assertEqual(pd['t_phi'], 30)
+        self.assertEqual(len(self.site.aligner.stars), 1)
+
+    def test_decimation(self):
+        "every decimation-th sample is transformed and published, the others are only stored"
+        transformed = []
+        transform = self.site.transform
+        self.site.transform = lambda msg: transformed.append(msg.phi) or transform(msg)
+        pub = self.ctx.socket(zmq.PUB)
+        pub.bind('inproc://td_ta')
+        self.site.connect()
+        sub = self.ctx.socket(zmq.SUB)
+        sub.subscribe('')
+        sub.connect('inproc://td_eq')
+        time.sleep(0.1)
+        self.site.start()
+
+        for batch in range(3):
+            pushto.messages.send_messages(pub, [DataMessage(phi=4*batch + i, theta=45) for i in range(4)])
+        pushto.messages.send_message(pub, pushto.messages.CmdMessage(cmd='stop'))
+        published = []
+        while True:
+            self.assertEqual(sub.poll(5000), zmq.POLLIN)
+            msg = pushto.messages.recv_message(sub)
+            if msg.type == 'CMD':
+                break
+            published.append(msg.phi)
+        self.site.join(5)
+        self.assertEqual(self.site.n, 12)
+        self.assertEqual(transformed, [4, 9])
+        self.assertEqual(published, [4, 9])
+        self.assertEqual(self.site.last_data.phi, 11)
+        sub.close()
+        pub.close()
+
+    def test_align_fit(self):
+        "the pointing model is fitted on the stars synced once aligned, against the previous alignment"
+        self.site.fitter = pushto.pointing.PointingFitter()
+        for i, (ra, dec) in enumerate(((1, 2), (5, 40), (9, -20))):
+            self.site.last_data = DataMessage(phi_raw=30.0 + 40*i, theta_raw=10.0 + 20*i,
+                                              phi=30.0 + 40*i, theta=10.0 + 20*i)
+            msg = AlignMessage(time=1e9, ra=ra, dec=dec)
+            target = self.site.aligner.horizontal_to_telescope(
+                *self.site.location.equatorial_to_horizontal(ra, dec, 1e9))
+            pd = self.site.handle_align(msg)
+            self.assertIn('model', pd)
+            self.assertEqual(self.site.fitter.n, max(0, i - 1))
+        self.assertAlmostEqual(self.site.fitter.pairs[0][2], target[0])
+        self.assertAlmostEqual(self.site.fitter.pairs[0][3], target[1])
+        self.assertNotAlmostEqual(self.site.fitter.pairs[0][2], pd['s_phi'], places=3)
+
+        "the snapshot is not changed by the syncs that follow, the reset drops the pairs with the stars"
+        snapshot = self.site.fitter_snapshot()
+        self.site.handle_align(AlignMessage(time=1e9, ra=3, dec=10))
+        self.assertEqual((snapshot.n, self.site.fitter.n), (1, 2))
+        self.site.reset_alignment()
+        self.assertEqual((len(self.site.aligner.stars), self.site.fitter.n), (0, 0))
+
+    def test_handle_goto(self):
+        self.site.handle_data(DataMessage(time=1e9, phi=30.0, theta=45.0, utc=True))
+        self.assertIsNone(self.site.guidance(self.site.last_data))
+        self.site.goto = 'guide'
+        self.assertIsNone(self.site.handle_goto(AlignMessage(time=1e9, ra=1, dec=2)))
+        self.assertEqual(len(self.site.aligner.stars), 0)
+        guide = self.site.guidance(DataMessage(time=1e9 + 0.1, phi=30.0, theta=45.0, utc=True))
+        self.assertEqual(guide.type, 'GUIDE')
+        self.assertTrue(0 <= guide.sep <= 180)
+        self.site.goto = 'sync'
+        self.assertIsNotNone(self.site.handle_goto(AlignMessage(time=1e9, ra=1, dec=2)))
+        self.assertEqual(len(self.site.aligner.stars), 1)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,73 @@
+import unittest
+import numpy as np
+import pushto.config
+import pushto.smoothing
+
+
+class TestFilters(unittest.TestCase):
+
+    def setUp(self):
+        "a telescope at rest on a count boundary, and one tracking at 2.5 counts/s"
+        rng = np.random.default_rng(0)
+        self.t = np.arange(400)*0.05
+        self.rest = np.floor(100.5 + rng.normal(0, 0.2, len(self.t)))
+        self.track = np.floor(100 + 2.5*self.t + rng.normal(0, 0.2, len(self.t)))
+
+    def run_filter(self, f, z):
+        x, v = zip(*(f.update(zi, ti) for zi, ti in zip(z.tolist(), self.t.tolist())))
+        return np.array(x), np.array(v)
+
+    def test_alpha_beta(self):
+        x, v = self.run_filter(pushto.smoothing.AlphaBetaFilter(alpha=0.3, beta=0.05), self.rest)
+        "the count jitters by a whole count, the smoothed count by a fraction"
+        self.assertLess(np.std(np.diff(x[50:])), 0.5*np.std(np.diff(self.rest[50:])))
+        self.assertAlmostEqual(np.mean(x[50:]), np.mean(self.rest[50:]), delta=0.1)
+        self.assertLess(np.max(np.abs(v[50:])), 2)
+
+    def test_kalman(self):
+        x, v = self.run_filter(pushto.smoothing.KalmanFilter(accel=2), self.track)
+        self.assertLess(np.std(np.diff(x[50:])), 0.5*np.std(np.diff(self.track[50:])))
+        self.assertAlmostEqual(np.mean(v[50:]), 2.5, delta=0.1)
+        "the truth is the middle of the count"
+        self.assertLess(np.max(np.abs(x[50:] - (100 + 2.5*self.t[50:] - 0.5))), 1)
+
+    def test_restart(self):
+        f = pushto.smoothing.KalmanFilter(accel=2, jump=50)
+        for i in range(20):
+            f.update(100 + i, 0.05*i)
+        self.assertAlmostEqual(f.v, 20, delta=1)
+        "a jump of the counts, e.g. a reset of the Arduino"
+        self.assertEqual(f.update(0, 1.0), (0.0, 0.0))
+        f.update(1, 1.05)
+        "a gap in the stream"
+        self.assertEqual(f.update(5, 3.0), (5.0, 0.0))
+        "a time stamp that goes back"
+        self.assertEqual(f.update(6, 2.0), (6.0, 0.0))
+
+
+class TestAttitudeFilter(unittest.TestCase):
+
+    def test_attitude_filter(self):
+        smoother = pushto.smoothing.AttitudeFilter('kalman', 0.025, 0.0125)
+        t = [0.05*i for i in range(100)]
+        phi, theta, phi_rate, theta_rate = smoother.update_array(t, [10*i for i in range(100)], [-3]*100)
+        self.assertAlmostEqual(phi_rate[-1], 200, delta=1)
+        self.assertAlmostEqual(theta[-1], -3)
+        phi_next, theta_next, _, _ = smoother.update(5.0, 1000, -3)
+        self.assertAlmostEqual(phi_next, phi[-1] + 10)
+        self.assertAlmostEqual(theta_next, -3)
+
+        with self.assertRaises(ValueError):
+            pushto.smoothing.AttitudeFilter('none', 0.025, 0.0125)
+
+    def test_setup(self):
+        cfg = pushto.config.Configuration()
+        self.assertIsNone(pushto.smoothing.AttitudeFilter.setup(cfg))
+        cfg.set_filter('alpha-beta')
+        self.assertEqual(pushto.smoothing.AttitudeFilter.setup(cfg).kind, 'alpha-beta')
+        with self.assertRaises(ValueError):
+            cfg.set_filter('median')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,12 @@
+import socket
+import struct
+import time
 import unittest
+import zmq
 import pushto.stellarium
+import pushto.prediction
+from pushto.messages import DataMessage, CmdMessage, send_message, recv_message
+from pushto.tests.support import free_port, recv_frame
 
 
 class TestBinary(unittest.TestCase):
@@ -33,13 +40,160 @@ class TestBinary(unittest.TestCase):
         self.assertEqual(data[22], 0)
         self.assertEqual(data[23], 0)
 
+        self.assertEqual(pushto.stellarium.stc_encode(utc=1668701698.967, ra=12, dec=-30), data)
+
     def test_stc_decode(self):
         data = bytes([24, 0, 0, 0, 216, 197, 0, 228, 172, 237, 5, 0, 0, 0, 0, 128, 171, 170, 170, 234])
         utc, ra, dec = pushto.stellarium.stc_decode(data)
-        self.assertEqual(utc, '2022-11-17 16:14:58.967')
+        self.assertAlmostEqual(utc, 1668701698.967)
         self.assertAlmostEqual(ra, 12)
         self.assertAlmostEqual(dec, -30)
 
 
+class TestSTCClient(unittest.TestCase):
+
+    def test_drop_oldest(self):
+        left, right = socket.socketpair()
+        left.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        client = pushto.stellarium.STCClient(left, 'test', max_frames=4)
+        n = 2000
+        for i in range(n):
+            client.queue(bytes(pushto.stellarium.stc_encode(i, 1.0, 2.0)))
+            self.assertTrue(client.flush())
+        self.assertTrue(client.pending)
+        self.assertGreater(client.dropped, 0)
+
+        "the frames received are whole, in order, and the newest ones are kept"
+        right.settimeout(1)
+        received = []
+        while client.pending or len(received) < n - client.dropped:
+            client.flush()
+            received.append(pushto.stellarium.stc_decode(recv_frame(right)[:20])[0])
+        self.assertEqual(len(received), n - client.dropped)
+        self.assertEqual(received, sorted(received))
+        self.assertAlmostEqual(received[-1], n - 1)
+        client.close()
+        right.close()
+
+    def test_decode(self):
+        client = pushto.stellarium.STCClient(None, 'test')
+        goto = struct.pack('<HHqIi', 20, 0, 10**6, 2**30, 2**29)
+        other = struct.pack('<HH', 4, 5)
+        self.assertEqual(client.decode(other + goto[:7]), [])
+        gotos = client.decode(goto[7:] + goto)
+        self.assertEqual(len(gotos), 2)
+        self.assertAlmostEqual(gotos[0][1], 6.0)
+        self.assertAlmostEqual(gotos[0][2], 45.0)
+
+
+class TestStellariumTC(unittest.TestCase):
+
+    def test_fan_out(self):
+        ctx = zmq.Context()
+        stel = pushto.stellarium.StellariumTC('127.0.0.1', free_port(), 'inproc://td_eq', 'inproc://pd_eq', ctx)
+        pub = ctx.socket(zmq.PUB)
+        pub.bind('inproc://td_eq')
+        sub = ctx.socket(zmq.SUB)
+        sub.subscribe('')
+        sub.connect('inproc://pd_eq')
+        stel.start()
+        clients = [socket.create_connection(stel.serverAddress, timeout=5) for _ in range(3)]
+        while len(stel.clients) < 3:
+            time.sleep(0.01)
+            send_message(pub, DataMessage(time=1.0, ra=1.0, dec=2.0))
+
+        "every client gets the position"
+        send_message(pub, DataMessage(time=2.0, ra=3.0, dec=4.0))
+        for client in clients:
+            while True:
+                utc, ra, dec = pushto.stellarium.stc_decode(recv_frame(client)[:20])
+                if utc == 2.0:
+                    break
+            self.assertAlmostEqual(ra, 3.0, places=6)
+
+        "a goto from any client is published, a client leaving does not affect the others"
+        clients[0].close()
+        clients[2].sendall(struct.pack('<HHqIi', 20, 0, 3*10**6, 2**30, 2**29))
+        self.assertEqual(sub.poll(5000), zmq.POLLIN)
+        msg = recv_message(sub)
+        self.assertEqual((msg.time, msg.ra, msg.dec), (3.0, 6.0, 45.0))
+        send_message(pub, DataMessage(time=4.0, ra=3.0, dec=4.0))
+        self.assertEqual(pushto.stellarium.stc_decode(recv_frame(clients[1])[:20])[0], 4.0)
+        self.assertEqual(len(stel.clients), 2)
+
+        send_message(pub, CmdMessage(cmd='stop'))
+        stel.join(5)
+        self.assertFalse(stel.is_alive())
+        for client in clients[1:]:
+            client.close()
+        pub.close()
+        sub.close()
+        ctx.term()
+
+    def test_reconnect(self):
+        ctx = zmq.Context()
+        stel = pushto.stellarium.StellariumTC('127.0.0.1', free_port(), 'inproc://td_eq', 'inproc://pd_eq', ctx)
+        pub = ctx.socket(zmq.PUB)
+        pub.bind('inproc://td_eq')
+        stel.start()
+
+        "streaming to nobody, then to every client that (re)connects"
+        for i in range(3):
+            send_message(pub, DataMessage(time=1.0, ra=1.0, dec=2.0))
+            client = socket.create_connection(stel.serverAddress, timeout=5)
+            t0 = time.time()
+            while True:
+                send_message(pub, DataMessage(time=2.0 + i, ra=3.0, dec=4.0))
+                client.settimeout(0.05)
+                try:
+                    frame = recv_frame(client)
+                    break
+                except socket.timeout:
+                    self.assertLess(time.time() - t0, 2)
+            self.assertEqual(pushto.stellarium.stc_decode(frame[:20])[0], 2.0 + i)
+            client.close()
+            while stel.clients:
+                send_message(pub, DataMessage(time=1.0, ra=1.0, dec=2.0))
+                time.sleep(0.01)
+                self.assertLess(time.time() - t0, 2)
+        self.assertTrue(stel.is_alive())
+
+        send_message(pub, CmdMessage(cmd='stop'))
+        stel.join(5)
+        pub.close()
+        ctx.term()
+
+    def test_prediction(self):
+        ctx = zmq.Context()
+        predictor = pushto.prediction.Predictor(horizon=1.0, deadband=0.01)
+        stel = pushto.stellarium.StellariumTC('127.0.0.1', free_port(), 'inproc://td_eq', 'inproc://pd_eq', ctx,
+                                              predictor=predictor, rate=50)
+        pub = ctx.socket(zmq.PUB)
+        pub.bind('inproc://td_eq')
+        stel.start()
+        client = socket.create_connection(stel.serverAddress, timeout=5)
+        while not stel.clients:
+            time.sleep(0.01)
+
+        "two samples of a telescope moving at 1 deg/s in declination, then nothing"
+        t0 = time.time()
+        send_message(pub, DataMessage(time=t0 - 0.1, ra=1.0, dec=10.0, utc=True))
+        send_message(pub, DataMessage(time=t0, ra=1.0, dec=10.1, utc=True))
+        frames = [pushto.stellarium.stc_decode(recv_frame(client)[:20]) for _ in range(10)]
+
+        "the positions between the samples follow the motion, up to the horizon"
+        self.assertEqual(len(set(utc for utc, _, _ in frames)), 10)
+        for utc, ra, dec in frames[1:]:
+            self.assertAlmostEqual(ra, 1.0, places=6)
+            self.assertAlmostEqual(dec, 10.1 + min(utc - t0, 1.0), delta=0.001)
+        self.assertGreater(frames[-1][2], frames[1][2])
+
+        send_message(pub, CmdMessage(cmd='stop'))
+        stel.join(5)
+        client.close()
+        pub.close()
+        ctx.term()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,5 +1,10 @@
+import os
+import tempfile
 import unittest
+import numpy as np
 import pushto.telescope
+import pushto.session
+import pushto.smoothing
 
 
 class TestEncoders(unittest.TestCase):
@@ -55,6 +60,33 @@ class TestEncoders(unittest.TestCase):
         self.assertEqual(phi, 359.0)
         self.assertEqual(theta, 1.0)
 
+    def test_convert_array(self):
+        enc = pushto.telescope.Encoders(phi_npr=360, theta_npr=360, flip_phi=False, flip_theta=True)
+        cnt = np.arange(-1000, 1000, dtype=np.int64)
+
+        phi, theta = enc.convert_array(cnt, cnt)
+        self.assertEqual(phi.shape, cnt.shape)
+        for i in range(len(cnt)):
+            scalar = enc.convert(int(cnt[i]), int(cnt[i]))
+            self.assertEqual(phi[i], scalar[0])
+            self.assertEqual(theta[i], scalar[1])
+
+    def test_convert_rate(self):
+        "the rates are those of the attitude, by finite differences, also past the zenith"
+        enc = pushto.telescope.Encoders(phi_npr=3600, theta_npr=3600, flip_phi=True, flip_theta=True)
+        theta_cnt = np.array([-300., -850., -950., -1500., -2000.])
+        phi_cnt = np.full(len(theta_cnt), 100.)
+        phi_rate, theta_rate = enc.convert_rate(np.full(len(theta_cnt), 10.), np.full(len(theta_cnt), -20.),
+                                                theta_cnt)
+        phi0, theta0 = enc.convert_array(phi_cnt, theta_cnt)
+        phi1, theta1 = enc.convert_array(phi_cnt + 0.1, theta_cnt - 0.2)
+        np.testing.assert_allclose(theta_rate, (theta1 - theta0)/0.01)
+        np.testing.assert_allclose(phi_rate, (phi1 - phi0)/0.01)
+        np.testing.assert_array_equal(theta_rate, [2, 2, -2, -2, -2])
+        "without the counts, the rates of the encoder axes"
+        self.assertEqual(enc.convert_rate(10., -20.), (-1.0, 2.0))
+        self.assertEqual(enc.convert_rate(10., -20., -1500.), (-1.0, -2.0))
+
 
 class TestPointingModel(unittest.TestCase):
 
@@ -64,6 +96,205 @@ class TestPointingModel(unittest.TestCase):
         self.assertEqual(phi, 0)
         self.assertEqual(theta, 0)
 
+    def test_apply_array(self):
+        pm = pushto.telescope.PointingModel(ia=30, ie=-20, an=15, aw=-12, ca=8, npae=5, tx=3, tf=10)
+        phi = np.array([0, 90, 180, 270, 359.99])
+        theta = np.array([0, 45, -45, 90, 10])
+        azi, alt = pm.apply(phi, theta)
+        for i in range(len(phi)):
+            scalar = pm.apply(phi[i], theta[i])
+            self.assertAlmostEqual(azi[i], scalar[0])
+            self.assertAlmostEqual(alt[i], scalar[1])
+        self.assertTrue(np.all((azi >= 0) & (azi < 360)))
+
+    def test_deapply(self):
+        pm = pushto.telescope.PointingModel(ia=30, ie=-20, an=15, aw=-12, ca=8, npae=5, tx=3, tf=10)
+        rng = np.random.default_rng(42)
+        phi = rng.uniform(0, 360, 1000)
+        theta = rng.uniform(1, 85, 1000)*rng.choice([-1, 1], 1000)
+        azi, alt = pm.apply(phi, theta)
+        phi_inv, theta_inv = pm.deapply(azi, alt)
+        self.assertLess(np.max(np.abs((phi_inv - phi + 180) % 360 - 180)), 1e-6)
+        self.assertLess(np.max(np.abs(theta_inv - theta)), 1e-6)
+
+        phi, theta = pm.deapply(180, 45)
+        azi, alt = pm.apply(phi, theta)
+        self.assertAlmostEqual(azi, 180)
+        self.assertAlmostEqual(alt, 45)
+
+    def test_deapply_zenith(self):
+        pm = pushto.telescope.PointingModel(an=15, aw=-12, ca=8, npae=5)
+        phi, theta = pm.deapply(np.array([0, 120]), np.array([90, 89.9999]))
+        self.assertTrue(np.all(np.isfinite(phi)))
+        self.assertTrue(np.all(np.abs(theta) < 90))
+
+    def test_partials(self):
+        rng = np.random.default_rng(3)
+        phi = rng.uniform(0, 360, 50)
+        theta = rng.uniform(-85, 85, 50)
+        params = rng.normal(0, 50, 8)
+        pm = pushto.telescope.PointingModel(*params)
+        da, de = pm.corrections(phi, theta)
+        pa, pe = pm.partials(phi, theta)
+        np.testing.assert_allclose(pa @ params, da, atol=1e-9)
+        np.testing.assert_allclose(pe @ params, de, atol=1e-9)
+
+
+class TestCorrectionGrid(unittest.TestCase):
+
+    def test_accuracy(self):
+        pm = pushto.telescope.PointingModel(30, -20, 15, -10, 25, 5, 3, 8)
+        for order, tolerance in ((1, 0.1), (3, 0.01)):
+            grid = pushto.telescope.CorrectionGrid(pm, resolution=0.5, order=order)
+            max_err, rms_err = grid.accuracy()
+            self.assertLess(max_err, tolerance)
+            self.assertLessEqual(rms_err, max_err)
+
+    def test_scalar_array(self):
+        pm = pushto.telescope.PointingModel(30, -20, 15, -10, 25, 5, 3, 8)
+        phi = np.array([0, 0.1, 123.4, 359.99, 200, 10])
+        theta = np.array([45, -79.9, 2, 80, 89.5, -3])
+        for order in (1, 3):
+            grid = pushto.telescope.CorrectionGrid(pm, resolution=1, order=order)
+            da, de = grid.corrections(phi, theta)
+            for k in range(len(phi)):
+                da_k, de_k = grid.corrections(phi[k], theta[k])
+                self.assertAlmostEqual(da_k, da[k])
+                self.assertAlmostEqual(de_k, de[k])
+
+    def test_fallback(self):
+        pm = pushto.telescope.PointingModel(30, -20, 15, -10, 25, 5, 3, 8)
+        grid = pushto.telescope.CorrectionGrid(pm, resolution=2)
+        "near the zenith and the horizon the corrections are analytic"
+        phi = np.array([10, 20])
+        theta = np.array([89.9, 0.1])
+        np.testing.assert_allclose(grid.corrections(phi, theta), pm.corrections(phi, theta))
+
+    def test_rebuild(self):
+        pm = pushto.telescope.PointingModel(ia=30)
+        pm.set_grid(1.0)
+        self.assertAlmostEqual(pm.apply(100, 45)[0], 100 - 30/3600)
+        pm.ia = -60
+        self.assertAlmostEqual(pm.apply(100, 45)[0], 100 + 60/3600)
+        self.assertEqual(pm.grid.terms, pm.terms())
+        pm.set_grid(0)
+        self.assertIsNone(pm.grid)
+
+
+class TestSerialHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.msgs = []
+        enc = pushto.telescope.Encoders(phi_npr=360, theta_npr=360, flip_phi=False, flip_theta=False)
+        self.handler = pushto.telescope.SerialHandler(enc, pushto.telescope.PointingModel(), None, None,
+                                                      sink=self.msgs.append)
+
+    def test_chunk(self):
+        self.handler.data_received(b'Write size: 25\r\n1000 10 20 0 0\r\n1100 11 21 0 0\r\n1200 12')
+        self.assertEqual([(m.time, m.phi_cnt, m.theta_cnt) for m in self.msgs], [(1000, 10, 20), (1100, 11, 21)])
+        "without a clock the time is the Arduino time stamp"
+        self.assertFalse(self.msgs[0].utc)
+        self.assertAlmostEqual(self.msgs[1].phi, 11)
+        self.assertAlmostEqual(self.msgs[1].theta, 21)
+        "the partial line is completed by the next read"
+        self.handler.data_received(b' 22 0 0\r')
+        self.assertEqual(len(self.msgs), 2)
+        self.handler.data_received(b'\n')
+        self.assertEqual((self.msgs[-1].time, self.msgs[-1].phi_cnt, self.msgs[-1].theta_cnt), (1200, 12, 22))
+
+    def test_malformed(self):
+        with self.assertLogs(level='WARNING'):
+            self.handler.data_received(b'1000 10 20 0 0\r\n\r\n10x0 1 2 0 0\r\n1100 -11 21 0 0\r\n')
+        self.assertEqual([m.phi_cnt for m in self.msgs], [10, -11])
+        self.assertAlmostEqual(self.msgs[1].phi, 349)
+
+    def test_long_field(self):
+        "a field out of the int64 range is dropped with its line, the handler keeps going"
+        with self.assertLogs(level='WARNING'):
+            self.handler.data_received(b'1000 10 20 0 0\r\n1050 %d 20 0 0\r\n1100 11 21 0 0\r\n' % 10**30)
+        self.assertEqual([m.phi_cnt for m in self.msgs], [10, 11])
+        with self.assertLogs(level='WARNING'):
+            self.handler.data_received(b'1150 1 %d 0 0\r\n' % -10**19)
+        self.handler.data_received(b'1200 12 22 0 0\r\n')
+        self.assertEqual([m.phi_cnt for m in self.msgs], [10, 11, 12])
+
+    def test_overflow(self):
+        with self.assertLogs(level='WARNING'):
+            self.handler.data_received(b'x'*(pushto.telescope.MAX_PARTIAL + 1))
+        self.handler.data_received(b'1000 10 20 0 0\r\n')
+        self.assertEqual(len(self.msgs), 1)
+
+    def test_capture(self):
+        "the captured lines are on disk after every read, before the capture is closed"
+        with tempfile.TemporaryDirectory() as tmp:
+            filename = os.path.join(tmp, 'session.ptsc')
+            self.handler.capture = pushto.session.SessionWriter(filename)
+            self.handler.data_received(b'1000 10 20 0 0\r\n1100 11 21 0 0\r\n')
+            session = pushto.session.SessionReader(filename)
+            self.assertEqual([l for _, l in session.lines()], ['1000 10 20 0 0', '1100 11 21 0 0'])
+            session.close()
+            self.handler.capture.close()
+
+    def test_smoother(self):
+        self.handler.smoother = pushto.smoothing.AttitudeFilter('kalman', 1, 1, accel=5)
+        self.handler.enc.flip_theta = True
+        self.handler.data_received(b''.join(b'%d %d 20 0 0\r\n' % (50*i, 10 + i) for i in range(40)))
+        "the counts are published as they are, the attitude is smoothed"
+        self.assertEqual(self.msgs[-1].phi_cnt, 49)
+        self.assertAlmostEqual(self.msgs[-1].phi, 49, delta=0.1)
+        self.assertAlmostEqual(self.msgs[-1].theta, -20)
+        self.assertAlmostEqual(self.msgs[-1].phi_rate, 20, delta=0.5)
+        self.assertAlmostEqual(self.msgs[-1].theta_rate, 0)
+
+
+class TestFrames(unittest.TestCase):
+
+    def setUp(self):
+        self.msgs = []
+        self.written = []
+        enc = pushto.telescope.Encoders(phi_npr=360, theta_npr=360, flip_phi=False, flip_theta=False)
+        self.handler = pushto.telescope.SerialHandler(enc, pushto.telescope.PointingModel(), None, None,
+                                                      sink=self.msgs.append, protocol='binary',
+                                                      command=b'B1000\n')
+        self.handler.connection_made(self)
+
+    def write(self, data):
+        self.written.append(data)
+
+    def test_encode_decode(self):
+        data = pushto.telescope.frame_encode(2**32 + 5, -548, 870, -1, 3)
+        self.assertEqual(len(data), pushto.telescope.FRAME.size)
+        rows, end, skipped, bad = pushto.telescope.frame_decode(data)
+        self.assertEqual((rows, end, skipped, bad), ([(5, -548, 870, 2**16 - 1, 3)], len(data), 0, 0))
+
+    def test_resync(self):
+        frames = [pushto.telescope.frame_encode(1000*i, i, -i, 0, 0) for i in range(4)]
+        corrupt = bytearray(frames[1])
+        corrupt[7] ^= 0xff
+        data = b'Write size\r\n' + frames[0] + bytes(corrupt) + frames[2] + frames[3][:9]
+        rows, end, skipped, bad = pushto.telescope.frame_decode(data)
+        self.assertEqual([r[1] for r in rows], [0, 2])
+        self.assertEqual(bad, 1)
+        self.assertEqual(skipped, 12 + len(corrupt))
+        self.assertEqual(end, len(data) - 9)
+
+    def test_handler(self):
+        self.assertEqual(self.written, [b'B1000\n'])
+        data = b''.join(pushto.telescope.frame_encode(1000*i, 10 + i, 20, 0, 0) for i in range(5))
+        "frames split across reads"
+        self.handler.data_received(data[:30])
+        self.assertEqual(len(self.msgs), 1)
+        self.handler.data_received(data[30:])
+        self.assertEqual([(m.time, m.phi_cnt) for m in self.msgs], [(1000*i, 10 + i) for i in range(5)])
+        self.assertAlmostEqual(self.msgs[4].phi, 14)
+        "text from a reset sketch: the command is sent again, at most once per second"
+        self.handler.data_received(b'1000 1 2 0 0\r\n')
+        self.assertEqual(len(self.msgs), 5)
+        self.assertEqual(len(self.written), 1)
+        self.handler.command_time -= 1
+        self.handler.data_received(b'1000 1 2 0 0\r\n')
+        self.assertEqual(len(self.written), 2)
+
 
 if __name__ == '__main__':
     unittest.main()